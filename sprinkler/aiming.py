@@ -0,0 +1,137 @@
+"""
+Created on 2024-09-06
+
+@author: wf
+"""
+
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+
+from sprinkler.sprinkler_config import Hose, Motors, Point3D, SprinklerConfig
+
+
+@dataclass
+class AimSolution:
+    """
+    Angle pairs hitting a batch of targets - angles which are not reachable
+    or outside of the motor limits are NaN
+    """
+
+    horizontal_angles: np.ndarray  # (n,) degrees
+    low_angles: np.ndarray  # (n,) vertical angle of the flat arc in degrees
+    high_angles: np.ndarray  # (n,) vertical angle of the steep arc in degrees
+
+    @property
+    def low_valid(self) -> np.ndarray:
+        return ~np.isnan(self.low_angles)
+
+    @property
+    def high_valid(self) -> np.ndarray:
+        return ~np.isnan(self.high_angles)
+
+
+class AimingSolver:
+    """
+    Inverse of the parabolic trajectory calculation:
+    find the (horizontal angle, vertical angle) pairs that hit given target points
+    """
+
+    def __init__(
+        self,
+        start_position: Point3D,
+        hose: Hose,
+        motors: Motors = None,
+        gravity: float = 9.8,
+    ):
+        """
+        Initialize the solver.
+
+        Args:
+            start_position (Point3D): the position of the sprinkler head
+            hose (Hose): the hose configuration providing the velocity
+            motors (Motors): optional motor configuration limiting the angles
+            gravity (float): gravitational acceleration in m/s²
+        """
+        self.start_position = start_position
+        self.hose = hose
+        self.motors = motors if isinstance(motors, Motors) else None
+        self.gravity = gravity
+
+    @classmethod
+    def from_config(cls, config: SprinklerConfig) -> "AimingSolver":
+        """
+        Create a solver for the sprinkler head, hose and motors of the given configuration.
+        """
+        head = config.sprinkler_head
+        solver = cls(
+            start_position=Point3D(head.x, head.y, head.z),
+            hose=config.hose,
+            motors=config.motors,
+        )
+        return solver
+
+    def solve(self, targets) -> AimSolution:
+        """
+        Calculate the low and high arc angle pairs for a batch of targets
+        in closed form.
+
+        Args:
+            targets: array of shape (n, 3) with x, y, z target coordinates in m
+                or (n, 2) for targets on the lawn (z=0)
+
+        Returns:
+            AimSolution: the angles for the targets
+        """
+        targets = np.atleast_2d(np.asarray(targets, dtype=float))
+        dx = targets[:, 0] - self.start_position.x
+        dy = targets[:, 1] - self.start_position.y
+        target_z = targets[:, 2] if targets.shape[1] > 2 else 0.0
+        dz = target_z - self.start_position.z
+        d = np.hypot(dx, dy)
+        v2 = self.hose.velocity**2
+        g = self.gravity
+        h_angles = np.degrees(np.arctan2(dy, dx))
+        discriminant = v2**2 - g * (g * d**2 + 2 * dz * v2)
+        reachable = discriminant >= 0
+        root = np.sqrt(np.where(reachable, discriminant, 0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            low = np.degrees(np.arctan((v2 - root) / (g * d)))
+            high = np.degrees(np.arctan((v2 + root) / (g * d)))
+        # targets straight above or below the sprinkler head
+        vertical = d == 0
+        low = np.where(vertical, np.where(dz <= 0, -90.0, 90.0), low)
+        high = np.where(vertical, 90.0, high)
+        low = np.where(reachable, low, np.nan)
+        high = np.where(reachable, high, np.nan)
+        if self.motors is not None:
+            h_motor = self.motors.horizontal
+            v_motor = self.motors.vertical
+            h_ok = (h_angles >= h_motor.min_angle) & (h_angles <= h_motor.max_angle)
+            low_ok = h_ok & (low >= v_motor.min_angle) & (low <= v_motor.max_angle)
+            high_ok = h_ok & (high >= v_motor.min_angle) & (high <= v_motor.max_angle)
+            low = np.where(low_ok, low, np.nan)
+            high = np.where(high_ok, high, np.nan)
+        solution = AimSolution(
+            horizontal_angles=h_angles, low_angles=low, high_angles=high
+        )
+        return solution
+
+    def aim(self, target: Point3D) -> List[Tuple[float, float]]:
+        """
+        Get the valid (horizontal angle, vertical angle) pairs hitting a single target.
+
+        Args:
+            target (Point3D): the target point
+
+        Returns:
+            List[Tuple[float, float]]: the low arc and high arc solutions that are valid
+        """
+        solution = self.solve([target.to_tuple()])
+        h_angle = float(solution.horizontal_angles[0])
+        angle_pairs = []
+        for v_angle in [solution.low_angles[0], solution.high_angles[0]]:
+            if not np.isnan(v_angle):
+                angle_pairs.append((h_angle, float(v_angle)))
+        return angle_pairs
@@ -0,0 +1,69 @@
+"""
+Created on 2024-09-08
+
+@author: wf
+"""
+
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+
+@dataclass
+class BroadPhaseStats:
+    """
+    Counters of a broad phase which rejects query/object pairs by their
+    axis aligned bounding boxes before any exact test runs
+    """
+
+    queries: int = 0  # trajectories or points checked
+    culled_queries: int = 0  # queries rejected without any exact test
+    pairs: int = 0  # pairs a brute force check would test
+    exact_tests: int = 0  # pairs that passed the broad phase and were tested exactly
+
+    @property
+    def avoided(self) -> int:
+        return self.pairs - self.exact_tests
+
+    @property
+    def avoided_ratio(self) -> float:
+        return self.avoided / self.pairs if self.pairs > 0 else 0.0
+
+    def reset(self):
+        self.queries = 0
+        self.culled_queries = 0
+        self.pairs = 0
+        self.exact_tests = 0
+
+    def __str__(self) -> str:
+        text = (
+            f"{self.culled_queries}/{self.queries} queries culled, "
+            f"{self.avoided}/{self.pairs} exact tests avoided ({self.avoided_ratio:.1%})"
+        )
+        return text
+
+
+def trajectory_bounds(trajectories: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Get the axis aligned bounding box of each trajectory.
+
+    Args:
+        trajectories (np.ndarray): trajectories of shape (n_jets, n_points, 3)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: lower and upper corners of shape (n_jets, 3)
+    """
+    return trajectories.min(axis=1), trajectories.max(axis=1)
+
+
+def boxes_overlap(
+    low_a: np.ndarray, high_a: np.ndarray, low_b: np.ndarray, high_b: np.ndarray
+) -> np.ndarray:
+    """
+    Check which boxes overlap - the corner arrays of shape (..., 3) are broadcast.
+
+    Returns:
+        np.ndarray: boolean mask of the broadcast shape without the last axis
+    """
+    return np.all((low_a <= high_b) & (high_a >= low_b), axis=-1)
@@ -0,0 +1,256 @@
+"""
+Created on 2024-09-07
+
+@author: wf
+"""
+
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+
+
+class MeshBVH:
+    """
+    Bounding volume hierarchy (AABB tree) over the triangles of a mesh.
+
+    The tree is stored in flat NumPy arrays so that it can be saved, memory mapped
+    and shared between processes. Queries are answered by a breadth first traversal
+    which tests all nodes of a level for all queries in one vectorized step.
+
+    Node i is a leaf if node_count[i] > 0 - its triangles are
+    triangle_order[node_start[i]:node_start[i] + node_count[i]].
+    Inner nodes have their children at node_start[i] and node_start[i] + 1.
+    """
+
+    ARRAY_NAMES = ["node_min", "node_max", "node_start", "node_count", "triangle_order"]
+
+    def __init__(
+        self,
+        node_min: np.ndarray,
+        node_max: np.ndarray,
+        node_start: np.ndarray,
+        node_count: np.ndarray,
+        triangle_order: np.ndarray,
+    ):
+        """
+        Initialize the tree from its flat arrays.
+        """
+        self.node_min = node_min
+        self.node_max = node_max
+        self.node_start = node_start
+        self.node_count = node_count
+        self.triangle_order = triangle_order
+
+    @property
+    def node_total(self) -> int:
+        return len(self.node_count)
+
+    @classmethod
+    def build(cls, triangles: np.ndarray, leaf_size: int = 8) -> "MeshBVH":
+        """
+        Build the tree by recursively splitting the triangles at the median
+        of their centroids along the axis of largest extent.
+
+        Args:
+            triangles (np.ndarray): triangle vertices of shape (m, 3, 3)
+            leaf_size (int): the maximum number of triangles per leaf
+
+        Returns:
+            MeshBVH: the tree
+        """
+        triangles = np.asarray(triangles, dtype=np.float64)
+        tri_min = triangles.min(axis=1)
+        tri_max = triangles.max(axis=1)
+        centroids = triangles.mean(axis=1)
+        order = np.arange(len(triangles))
+        # a binary tree with leaves of at least leaf_size/2 triangles
+        # has less than 4 * m / leaf_size + 1 nodes
+        capacity = max(1, 4 * len(triangles) // max(leaf_size, 1) + 1)
+        node_min = np.zeros((capacity, 3))
+        node_max = np.zeros((capacity, 3))
+        node_start = np.zeros(capacity, dtype=np.int64)
+        node_count = np.zeros(capacity, dtype=np.int64)
+        node_total = 1
+        # stack of (node index, start, end) of the triangle range in order
+        stack = [(0, 0, len(triangles))]
+        while stack:
+            node, start, end = stack.pop()
+            indices = order[start:end]
+            if len(indices) > 0:
+                node_min[node] = tri_min[indices].min(axis=0)
+                node_max[node] = tri_max[indices].max(axis=0)
+            else:
+                # empty mesh - a box that overlaps nothing
+                node_min[node] = np.inf
+                node_max[node] = -np.inf
+            if end - start <= leaf_size:
+                node_start[node] = start
+                node_count[node] = end - start
+                continue
+            extent = centroids[indices].max(axis=0) - centroids[indices].min(axis=0)
+            axis = int(np.argmax(extent))
+            mid = (end - start) // 2
+            split = np.argpartition(centroids[indices, axis], mid)
+            order[start:end] = indices[split]
+            if node_total + 2 > capacity:
+                capacity *= 2
+                node_min = np.resize(node_min, (capacity, 3))
+                node_max = np.resize(node_max, (capacity, 3))
+                node_start = np.resize(node_start, capacity)
+                node_count = np.resize(node_count, capacity)
+            left = node_total
+            node_total += 2
+            node_start[node] = left
+            node_count[node] = 0
+            stack.append((left, start, start + mid))
+            stack.append((left + 1, start + mid, end))
+        bvh = cls(
+            node_min=node_min[:node_total].copy(),
+            node_max=node_max[:node_total].copy(),
+            node_start=node_start[:node_total].copy(),
+            node_count=node_count[:node_total].copy(),
+            triangle_order=order,
+        )
+        return bvh
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Get the flat arrays of the tree by name.
+        """
+        arrays = {name: getattr(self, name) for name in MeshBVH.ARRAY_NAMES}
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "MeshBVH":
+        """
+        Create a tree from the flat arrays returned by to_arrays.
+        """
+        return cls(**{name: arrays[name] for name in MeshBVH.ARRAY_NAMES})
+
+    def traverse(
+        self, overlaps: Callable[[np.ndarray, np.ndarray], np.ndarray], query_count: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Traverse the tree for a batch of queries.
+
+        Args:
+            overlaps (Callable): function mapping arrays of (query index, node index)
+                pairs to a boolean mask of the pairs whose node box overlaps the query
+            query_count (int): the number of queries
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: query indices and triangle indices
+            of all candidate pairs
+        """
+        queries = np.arange(query_count)
+        nodes = np.zeros(query_count, dtype=np.int64)
+        hit_queries = []
+        hit_triangles = []
+        while len(queries) > 0:
+            mask = overlaps(queries, nodes)
+            queries = queries[mask]
+            nodes = nodes[mask]
+            counts = self.node_count[nodes]
+            is_leaf = counts > 0
+            if np.any(is_leaf):
+                leaf_queries = queries[is_leaf]
+                leaf_starts = self.node_start[nodes[is_leaf]]
+                leaf_counts = counts[is_leaf]
+                # expand each leaf into its triangle range
+                repeat_queries = np.repeat(leaf_queries, leaf_counts)
+                offsets = np.arange(leaf_counts.sum()) - np.repeat(
+                    np.cumsum(leaf_counts) - leaf_counts, leaf_counts
+                )
+                positions = np.repeat(leaf_starts, leaf_counts) + offsets
+                hit_queries.append(repeat_queries)
+                hit_triangles.append(self.triangle_order[positions])
+            inner = ~is_leaf
+            children = self.node_start[nodes[inner]]
+            queries = np.repeat(queries[inner], 2)
+            nodes = np.stack([children, children + 1], axis=1).ravel()
+        if hit_queries:
+            return np.concatenate(hit_queries), np.concatenate(hit_triangles)
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    def query_boxes(
+        self, box_min: np.ndarray, box_max: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the candidate triangles of all leaves whose boxes overlap the given query boxes.
+
+        Args:
+            box_min (np.ndarray): lower corners of shape (q, 3)
+            box_max (np.ndarray): upper corners of shape (q, 3)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: query indices and triangle indices
+        """
+        box_min = np.atleast_2d(box_min)
+        box_max = np.atleast_2d(box_max)
+
+        def overlaps(queries: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+            return np.all(
+                (self.node_min[nodes] <= box_max[queries])
+                & (self.node_max[nodes] >= box_min[queries]),
+                axis=1,
+            )
+
+        return self.traverse(overlaps, len(box_min))
+
+    def query_points(
+        self, points: np.ndarray, tolerance: float = 0.0
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the candidate triangles of all leaves whose boxes are within tolerance
+        of the given points.
+
+        Args:
+            points (np.ndarray): points of shape (q, 3)
+            tolerance (float): the distance to expand the boxes by
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: query indices and triangle indices
+        """
+        points = np.atleast_2d(points)
+        return self.query_boxes(points - tolerance, points + tolerance)
+
+    def query_segments(
+        self, starts: np.ndarray, ends: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the candidate triangles of all leaves whose boxes are crossed
+        by the given line segments using the slab test.
+
+        Args:
+            starts (np.ndarray): segment start points of shape (q, 3)
+            ends (np.ndarray): segment end points of shape (q, 3)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: query indices and triangle indices
+        """
+        starts = np.atleast_2d(starts)
+        directions = np.atleast_2d(ends) - starts
+        with np.errstate(divide="ignore"):
+            inverse = 1.0 / directions
+
+        def overlaps(queries: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+            origin = starts[queries]
+            inv = inverse[queries]
+            with np.errstate(invalid="ignore"):
+                t0 = (self.node_min[nodes] - origin) * inv
+                t1 = (self.node_max[nodes] - origin) * inv
+            # axis parallel segments: inside the slab means no restriction
+            parallel = ~np.isfinite(inv)
+            inside = (origin >= self.node_min[nodes]) & (origin <= self.node_max[nodes])
+            t_near = np.where(
+                parallel, np.where(inside, -np.inf, np.inf), np.minimum(t0, t1)
+            )
+            t_far = np.where(
+                parallel, np.where(inside, np.inf, -np.inf), np.maximum(t0, t1)
+            )
+            t_enter = np.maximum(t_near.max(axis=1), 0.0)
+            t_exit = np.minimum(t_far.min(axis=1), 1.0)
+            return t_enter <= t_exit
+
+        return self.traverse(overlaps, len(starts))
@@ -0,0 +1,285 @@
+"""
+Created on 2024-09-08
+
+@author: wf
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+
+import numpy as np
+
+from sprinkler.bvh import MeshBVH
+from sprinkler.sprinkler_config import Angles, Hose, Point3D
+from sprinkler.sprinkler_core import SprinklerSystem
+from sprinkler.stl3d import STL3D
+from sprinkler.waterjet import WaterJet
+
+
+class SharedArrays:
+    """
+    Named NumPy arrays packed into a single shared memory block
+    so that worker processes can use them without pickling or copying.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, layout: Dict[str, Tuple]):
+        """
+        Initialize from an existing shared memory block.
+
+        Args:
+            shm (SharedMemory): the shared memory block
+            layout (Dict[str, Tuple]): (offset, shape, dtype) of each array by name
+        """
+        self.shm = shm
+        self.layout = layout
+
+    @classmethod
+    def create(cls, arrays: Dict[str, np.ndarray]) -> "SharedArrays":
+        """
+        Copy the given arrays into a new shared memory block.
+
+        Args:
+            arrays (Dict[str, np.ndarray]): the arrays by name
+
+        Returns:
+            SharedArrays: the shared arrays - the caller has to unlink them
+        """
+        layout = {}
+        size = 0
+        for name, array in arrays.items():
+            # 64 byte alignment of each array
+            size = (size + 63) // 64 * 64
+            layout[name] = (size, array.shape, array.dtype)
+            size += array.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        shared = cls(shm, layout)
+        for name, array in arrays.items():
+            shared.arrays()[name][...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, name: str, layout: Dict[str, Tuple]) -> "SharedArrays":
+        """
+        Attach to the shared memory block with the given name.
+        """
+        return cls(shared_memory.SharedMemory(name=name), layout)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Get views of the arrays in the shared memory block by name.
+        """
+        arrays = {
+            name: np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            for name, (offset, shape, dtype) in self.layout.items()
+        }
+        return arrays
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+@dataclass
+class SweepResult:
+    """
+    Collision check results for a batch of angle pairs
+    """
+
+    horizontal_angles: np.ndarray  # (n,) degrees
+    vertical_angles: np.ndarray  # (n,) degrees
+    valid: np.ndarray  # (n,) True if the jet does not hit the mesh
+    hit_points: np.ndarray  # (n, 3) first hit point in m - NaN for valid jets
+
+    @property
+    def valid_ratio(self) -> float:
+        return float(np.mean(self.valid)) if len(self.valid) > 0 else 1.0
+
+
+# state of a sweep worker process set by init_sweep_worker
+_worker_state = {}
+
+
+def init_sweep_worker(shm_name: str, layout: Dict[str, Tuple], water_jet: WaterJet):
+    """
+    Attach a worker process to the shared mesh arrays.
+    """
+    shared = SharedArrays.attach(shm_name, layout)
+    arrays = shared.arrays()
+    bvh = MeshBVH.from_arrays(arrays)
+    _worker_state["shared"] = shared
+    _worker_state["stl"] = STL3D.from_arrays(arrays["mesh_data"], bvh)
+    _worker_state["water_jet"] = water_jet
+
+
+def sweep_angles(
+    stl: STL3D,
+    water_jet: WaterJet,
+    horizontal_angles: np.ndarray,
+    vertical_angles: np.ndarray,
+    num_segments: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Check the trajectories of the given angle pairs for collisions with the mesh.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the validity mask and the first hit points
+    """
+    trajectories = water_jet.calculate_trajectories(
+        horizontal_angles, vertical_angles, num_segments
+    )
+    segment_index, points, _triangles = stl.intersect_trajectories(trajectories)
+    return segment_index < 0, points
+
+
+def sweep_worker_chunk(
+    horizontal_angles: np.ndarray, vertical_angles: np.ndarray, num_segments: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sweep a chunk of the angle grid in a worker process.
+    """
+    return sweep_angles(
+        _worker_state["stl"],
+        _worker_state["water_jet"],
+        horizontal_angles,
+        vertical_angles,
+        num_segments,
+    )
+
+
+class CollisionSweep:
+    """
+    Check every angle pair of a sprinkler pattern for collisions of the
+    water jet with the garden mesh.
+
+    The angle grid is partitioned into chunks which are processed by a pool
+    of worker processes. The mesh records and the BVH are put into shared memory
+    once instead of being pickled for every task.
+    """
+
+    def __init__(
+        self,
+        stl: STL3D,
+        start_position: Point3D,
+        hose: Hose,
+        model: str = "parabolic",
+        num_segments: int = 20,
+        workers: int = None,
+        chunk_size: int = 512,
+    ):
+        """
+        Initialize the sweep.
+
+        Args:
+            stl (STL3D): the garden mesh
+            start_position (Point3D): the position of the sprinkler head
+            hose (Hose): the hose configuration providing the velocity
+            model (str): the trajectory model - see WaterJet.MODELS
+            num_segments (int): number of segments per trajectory
+            workers (int): number of worker processes - default: number of CPUs,
+                1 to sweep in the calling process
+            chunk_size (int): number of angle pairs per task
+        """
+        self.stl = stl
+        self.water_jet = WaterJet(start_position, hose, model=model)
+        self.num_segments = num_segments
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_system(cls, system: SprinklerSystem, **kwargs) -> "CollisionSweep":
+        """
+        Create a sweep for the collision mesh, sprinkler head and hose of the given system.
+
+        Args:
+            system (SprinklerSystem): the sprinkler system
+            **kwargs: further arguments of the constructor
+
+        Returns:
+            CollisionSweep: the sweep
+        """
+        head = system.config.sprinkler_head
+        sweep = cls(
+            stl=system.collision_stl,
+            start_position=Point3D(head.x, head.y, head.z),
+            hose=system.config.hose,
+            **kwargs,
+        )
+        return sweep
+
+    def sweep_grid(self, angles: Angles) -> SweepResult:
+        """
+        Sweep all angle pairs of the given angle configuration.
+
+        Args:
+            angles (Angles): the angle configuration
+
+        Returns:
+            SweepResult: the results in horizontal major order
+        """
+        horizontal_angles, vertical_angles = WaterJet.angle_grid(angles)
+        return self.sweep(horizontal_angles, vertical_angles)
+
+    def sweep(self, horizontal_angles, vertical_angles) -> SweepResult:
+        """
+        Sweep the given angle pairs.
+
+        Args:
+            horizontal_angles: array of horizontal angles in degrees
+            vertical_angles: array of vertical angles in degrees (same shape)
+
+        Returns:
+            SweepResult: the results in the order of the given angle pairs
+        """
+        h = np.asarray(horizontal_angles, dtype=float).ravel()
+        v = np.asarray(vertical_angles, dtype=float).ravel()
+        chunks = max(1, int(np.ceil(len(h) / self.chunk_size)))
+        workers = min(self.workers, chunks)
+        if workers <= 1:
+            valid, hit_points = sweep_angles(
+                self.stl, self.water_jet, h, v, self.num_segments
+            )
+        else:
+            valid, hit_points = self.sweep_parallel(
+                np.array_split(h, chunks), np.array_split(v, chunks), workers
+            )
+        result = SweepResult(
+            horizontal_angles=h, vertical_angles=v, valid=valid, hit_points=hit_points
+        )
+        return result
+
+    def sweep_parallel(self, h_chunks, v_chunks, workers: int):
+        """
+        Sweep the given chunks of angle pairs with a process pool.
+        """
+        arrays = {"mesh_data": np.asarray(self.stl.stl_mesh.data)}
+        arrays.update(self.stl.bvh.to_arrays())
+        shared = SharedArrays.create(arrays)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=init_sweep_worker,
+                initargs=(shared.name, shared.layout, self.water_jet),
+            ) as executor:
+                results = list(
+                    executor.map(
+                        sweep_worker_chunk,
+                        h_chunks,
+                        v_chunks,
+                        [self.num_segments] * len(h_chunks),
+                    )
+                )
+        finally:
+            shared.unlink()
+        valid = np.concatenate([chunk_valid for chunk_valid, _points in results])
+        hit_points = np.concatenate([points for _valid, points in results])
+        return valid, hit_points
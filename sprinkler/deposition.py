@@ -0,0 +1,252 @@
+"""
+Created on 2024-09-09
+
+@author: wf
+"""
+
+import math
+import os
+from dataclasses import dataclass
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from sprinkler.sprinkler_config import Lawn
+
+
+@dataclass
+class DepositionStats:
+    """
+    Statistics of the water deposited on the lawn
+    """
+
+    total_liters: float  # liters deposited on the lawn
+    lost_liters: float  # liters deposited outside of the lawn
+    mean_mm: float
+    min_mm: float
+    max_mm: float
+    coverage: float  # mean fraction of the target rainfall reached per cell (0..1)
+    uniformity: float  # Christiansen uniformity coefficient (1 = uniform)
+    low_quarter_uniformity: float  # mean of the driest quarter / mean (0..1)
+    dry_ratio: float  # fraction of cells below the dry threshold
+
+
+class DepositionGrid:
+    """
+    Raster of the liters of water deposited per lawn cell.
+
+    Each impact spreads its water with a Gaussian kernel over the neighbouring cells,
+    all impacts of a batch are accumulated with a single scatter-add.
+    """
+
+    def __init__(self, lawn: Lawn, cell_size: float = 0.1, spread: float = 0.25):
+        """
+        Initialize the grid.
+
+        Args:
+            lawn (Lawn): the lawn to cover - its lower left corner is at (0, 0)
+            cell_size (float): cell size in m
+            spread (float): standard deviation of the impact spread kernel in m
+        """
+        self.lawn = lawn
+        self.cell_size = cell_size
+        self.spread = spread
+        self.nx = max(1, math.ceil(lawn.width / cell_size))
+        self.ny = max(1, math.ceil(lawn.length / cell_size))
+        self.liters = np.zeros((self.nx, self.ny))
+        self.lost_liters = 0.0
+        # cell areas in m² - border cells are clipped to the lawn
+        widths = np.minimum(cell_size, lawn.width - np.arange(self.nx) * cell_size)
+        lengths = np.minimum(cell_size, lawn.length - np.arange(self.ny) * cell_size)
+        self.cell_areas = np.outer(widths, lengths)
+        self.init_kernel()
+
+    def init_kernel(self):
+        """
+        Precompute the cell offsets and normalized weights of the spread kernel
+        truncated at two standard deviations.
+        """
+        radius = int(math.ceil(2 * self.spread / self.cell_size))
+        offsets = np.arange(-radius, radius + 1)
+        di, dj = np.meshgrid(offsets, offsets, indexing="ij")
+        distances_sq = (di**2 + dj**2) * self.cell_size**2
+        if self.spread > 0:
+            weights = np.exp(-distances_sq / (2 * self.spread**2))
+        else:
+            weights = (distances_sq == 0).astype(float)
+        inside = distances_sq <= (2 * self.spread) ** 2
+        self.kernel_di = di[inside]
+        self.kernel_dj = dj[inside]
+        self.kernel_weights = weights[inside] / weights[inside].sum()
+
+    def reset(self):
+        self.liters[:] = 0
+        self.lost_liters = 0.0
+
+    def deposit(self, impacts, liters):
+        """
+        Add water at the given impact points.
+
+        Args:
+            impacts: impact points of shape (n, 2) or (n, 3) in m - z is ignored
+            liters: liters per impact - scalar or array of shape (n,)
+        """
+        impacts = np.atleast_2d(np.asarray(impacts, dtype=float))
+        liters = np.broadcast_to(np.asarray(liters, dtype=float), (len(impacts),))
+        ci = np.floor(impacts[:, 0] / self.cell_size).astype(np.int64)
+        cj = np.floor(impacts[:, 1] / self.cell_size).astype(np.int64)
+        i = ci[:, np.newaxis] + self.kernel_di
+        j = cj[:, np.newaxis] + self.kernel_dj
+        amounts = liters[:, np.newaxis] * self.kernel_weights
+        on_lawn = (i >= 0) & (i < self.nx) & (j >= 0) & (j < self.ny)
+        self.liters += np.bincount(
+            (i * self.ny + j)[on_lawn],
+            weights=amounts[on_lawn],
+            minlength=self.nx * self.ny,
+        ).reshape(self.nx, self.ny)
+        self.lost_liters += float(amounts[~on_lawn].sum())
+
+    @property
+    def total_liters(self) -> float:
+        return float(self.liters.sum())
+
+    def rain_mm(self) -> np.ndarray:
+        """
+        Get the rain equivalent per cell - 1 liter per m² is 1 mm.
+
+        Returns:
+            np.ndarray: mm per cell of shape (nx, ny)
+        """
+        return self.liters / self.cell_areas
+
+    def dry_spots(self, threshold_mm: float = None) -> np.ndarray:
+        """
+        Get the cells that received less than the given amount of water.
+
+        Args:
+            threshold_mm (float): the threshold - default: half of the lawn's rainfall target
+
+        Returns:
+            np.ndarray: boolean mask of shape (nx, ny)
+        """
+        if threshold_mm is None:
+            threshold_mm = self.lawn.rainfall_mm / 2
+        return self.rain_mm() < threshold_mm
+
+    def cell_centers(self, mask: np.ndarray) -> np.ndarray:
+        """
+        Get the centers of the cells selected by the given mask.
+
+        Returns:
+            np.ndarray: (x, y) coordinates in m of shape (k, 2)
+        """
+        i, j = np.nonzero(mask)
+        return (np.stack([i, j], axis=1) + 0.5) * self.cell_size
+
+    def stats(
+        self, target_mm: float = None, threshold_mm: float = None
+    ) -> DepositionStats:
+        """
+        Get the statistics of the deposited water.
+
+        Args:
+            target_mm (float): the rainfall target - default: the lawn's rainfall_mm
+            threshold_mm (float): the dry spot threshold - see dry_spots
+
+        Returns:
+            DepositionStats: the statistics
+        """
+        if target_mm is None:
+            target_mm = self.lawn.rainfall_mm
+        mm = self.rain_mm().ravel()
+        mean = float(mm.mean())
+        if mean > 0:
+            uniformity = 1 - float(np.abs(mm - mean).mean()) / mean
+            low_quarter = np.sort(mm)[: max(1, len(mm) // 4)]
+            low_quarter_uniformity = float(low_quarter.mean()) / mean
+        else:
+            uniformity = 0.0
+            low_quarter_uniformity = 0.0
+        coverage = float(np.minimum(mm / target_mm, 1).mean()) if target_mm > 0 else 1.0
+        stats = DepositionStats(
+            total_liters=self.total_liters,
+            lost_liters=self.lost_liters,
+            mean_mm=mean,
+            min_mm=float(mm.min()),
+            max_mm=float(mm.max()),
+            coverage=coverage,
+            uniformity=uniformity,
+            low_quarter_uniformity=low_quarter_uniformity,
+            dry_ratio=float(self.dry_spots(threshold_mm).mean()),
+        )
+        return stats
+
+    def create_heatmap(self, title: str = "Water depth"):
+        """
+        Create a top view heatmap of the rain per cell - the whole grid
+        is drawn as a single raster image.
+
+        Args:
+            title (str): the title of the plot
+
+        Returns:
+            Tuple: the matplotlib figure and axes
+        """
+        fig, ax = plt.subplots(figsize=(6, 10))
+        image = ax.imshow(
+            self.rain_mm().T,
+            origin="lower",
+            extent=(0, self.nx * self.cell_size, 0, self.ny * self.cell_size),
+            cmap="Blues",
+            interpolation="nearest",
+        )
+        fig.colorbar(image, ax=ax, label="mm")
+        ax.set_xlabel("X (m)")
+        ax.set_ylabel("Y (m)")
+        ax.set_title(title)
+        return fig, ax
+
+    def save_heatmap(self, path: str, title: str = "Water depth"):
+        """
+        Save the heatmap - the format (e.g. png or svg) is derived from the file extension.
+
+        Args:
+            path (str): the file path
+            title (str): the title of the plot
+        """
+        fig, _ax = self.create_heatmap(title)
+        try:
+            fig.savefig(path, bbox_inches="tight")
+        finally:
+            plt.close(fig)
+
+    def save_npy(self, path: str):
+        """
+        Save the raw rain per cell in mm as .npy file.
+
+        Args:
+            path (str): the file path
+        """
+        np.save(path, self.rain_mm())
+
+    def export(self, base_path: str, formats=("png", "svg", "npy")) -> list:
+        """
+        Export the deposition in the given formats.
+
+        Args:
+            base_path (str): the file path without extension
+            formats: the formats to export
+
+        Returns:
+            list: the paths of the exported files
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(base_path)), exist_ok=True)
+        paths = []
+        for file_format in formats:
+            path = f"{base_path}.{file_format}"
+            if file_format == "npy":
+                self.save_npy(path)
+            else:
+                self.save_heatmap(path)
+            paths.append(path)
+        return paths
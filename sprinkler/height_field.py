@@ -0,0 +1,210 @@
+"""
+Created on 2024-09-07
+
+@author: wf
+"""
+
+import math
+from typing import Dict
+
+import numpy as np
+
+
+class HeightField:
+    """
+    2D raster of the maximum height of a mesh over each grid cell.
+
+    Answers "is this point below the top surface at (x, y)?" by array indexing.
+    Overhangs like a tree crown are treated as solid down to the ground,
+    so the answer is conservative for points below them.
+    """
+
+    def __init__(
+        self,
+        origin_x: float,
+        origin_y: float,
+        resolution: float,
+        heights: np.ndarray,
+    ):
+        """
+        Initialize the height field.
+
+        Args:
+            origin_x (float): x coordinate of the lower left grid corner in m
+            origin_y (float): y coordinate of the lower left grid corner in m
+            resolution (float): cell size in m
+            heights (np.ndarray): maximum heights in m of shape (nx, ny), -inf where empty
+        """
+        self.origin_x = origin_x
+        self.origin_y = origin_y
+        self.resolution = resolution
+        self.heights = heights
+
+    @classmethod
+    def from_triangles(
+        cls,
+        triangles: np.ndarray,
+        resolution: float = 0.02,
+        scale: float = 0.001,
+        chunk_size: int = 1 << 20,
+    ) -> "HeightField":
+        """
+        Rasterize the given triangles.
+
+        Each cell gets the maximum of the triangle planes at its center plus
+        the heights of edge samples - so that vertical faces and triangles
+        smaller than a cell are not lost.
+
+        Args:
+            triangles (np.ndarray): triangle vertices of shape (m, 3, 3)
+            resolution (float): cell size in m
+            scale (float): factor to convert the triangle coordinates to m
+            chunk_size (int): maximum number of (triangle, cell) pairs to process at once
+
+        Returns:
+            HeightField: the rasterized height field
+        """
+        triangles = np.asarray(triangles, dtype=np.float64) * scale
+        low = triangles.min(axis=(0, 1))
+        high = triangles.max(axis=(0, 1))
+        nx = max(1, int(math.ceil((high[0] - low[0]) / resolution)))
+        ny = max(1, int(math.ceil((high[1] - low[1]) / resolution)))
+        height_field = cls(low[0], low[1], resolution, np.full((nx, ny), -np.inf))
+        flat = height_field.heights.reshape(-1)
+
+        # edge samples at half the resolution
+        for i, j in [(0, 1), (1, 2), (2, 0)]:
+            start = triangles[:, i]
+            end = triangles[:, j]
+            length = np.hypot(*(end - start)[:, :2].T)
+            samples = np.ceil(2 * length / resolution).astype(int) + 1
+            tri_index = np.repeat(np.arange(len(triangles)), samples)
+            offsets = np.arange(samples.sum()) - np.repeat(
+                np.cumsum(samples) - samples, samples
+            )
+            f = (offsets / np.maximum(np.repeat(samples, samples) - 1, 1))[
+                :, np.newaxis
+            ]
+            points = start[tri_index] + f * (end - start)[tri_index]
+            cells = height_field.cell_indices(points[:, 0], points[:, 1])
+            np.maximum.at(flat, cells, points[:, 2])
+
+        # cell centers covered by the xy projection of each triangle
+        tri_low = triangles[:, :, :2].min(axis=1)
+        tri_high = triangles[:, :, :2].max(axis=1)
+        i0 = np.floor((tri_low[:, 0] - low[0]) / resolution - 0.5).astype(int) + 1
+        i1 = np.floor((tri_high[:, 0] - low[0]) / resolution - 0.5).astype(int)
+        j0 = np.floor((tri_low[:, 1] - low[1]) / resolution - 0.5).astype(int) + 1
+        j1 = np.floor((tri_high[:, 1] - low[1]) / resolution - 0.5).astype(int)
+        i0, j0 = np.maximum(i0, 0), np.maximum(j0, 0)
+        i1, j1 = np.minimum(i1, nx - 1), np.minimum(j1, ny - 1)
+        ni = np.maximum(i1 - i0 + 1, 0)
+        nj = np.maximum(j1 - j0 + 1, 0)
+        counts = ni * nj
+        candidates = np.nonzero(counts)[0]
+        cumulative = np.cumsum(counts[candidates])
+        start_index = 0
+        # process the triangles in chunks of limited (triangle, cell) pair counts
+        while start_index < len(candidates):
+            done = cumulative[start_index - 1] if start_index > 0 else 0
+            end_index = np.searchsorted(cumulative, done + chunk_size, side="right")
+            end_index = max(end_index, start_index + 1)
+            chunk = candidates[start_index:end_index]
+            start_index = end_index
+            chunk_counts = counts[chunk]
+            tri_index = np.repeat(chunk, chunk_counts)
+            offsets = np.arange(chunk_counts.sum()) - np.repeat(
+                np.cumsum(chunk_counts) - chunk_counts, chunk_counts
+            )
+            cell_i = i0[tri_index] + offsets // nj[tri_index]
+            cell_j = j0[tri_index] + offsets % nj[tri_index]
+            x = low[0] + (cell_i + 0.5) * resolution
+            y = low[1] + (cell_j + 0.5) * resolution
+            a = triangles[tri_index, 0]
+            e1 = triangles[tri_index, 1] - a
+            e2 = triangles[tri_index, 2] - a
+            dx = x - a[:, 0]
+            dy = y - a[:, 1]
+            det = e1[:, 0] * e2[:, 1] - e2[:, 0] * e1[:, 1]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                u = (dx * e2[:, 1] - e2[:, 0] * dy) / det
+                v = (e1[:, 0] * dy - dx * e1[:, 1]) / det
+                inside = (det != 0) & (u >= 0) & (v >= 0) & (u + v <= 1)
+                z = a[:, 2] + u * e1[:, 2] + v * e2[:, 2]
+            np.maximum.at(flat, (cell_i * ny + cell_j)[inside], z[inside])
+        return height_field
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Get the grid parameters and the heights as arrays by name.
+        """
+        arrays = {
+            "grid": np.array([self.origin_x, self.origin_y, self.resolution]),
+            "heights": self.heights,
+        }
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "HeightField":
+        """
+        Create a height field from the arrays returned by to_arrays.
+        """
+        origin_x, origin_y, resolution = arrays["grid"].tolist()
+        return cls(origin_x, origin_y, resolution, arrays["heights"])
+
+    def cell_indices(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """
+        Get the flat cell indices for the given coordinates clamped to the grid.
+        """
+        nx, ny = self.heights.shape
+        i = np.clip(((x - self.origin_x) / self.resolution).astype(int), 0, nx - 1)
+        j = np.clip(((y - self.origin_y) / self.resolution).astype(int), 0, ny - 1)
+        return i * ny + j
+
+    def heights_at(self, x, y) -> np.ndarray:
+        """
+        Look up the surface heights at the given coordinates.
+
+        Args:
+            x: x coordinate(s) in m
+            y: y coordinate(s) in m
+
+        Returns:
+            np.ndarray: the heights in m, -inf outside of the grid or where there is no surface
+        """
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        y = np.atleast_1d(np.asarray(y, dtype=float))
+        nx, ny = self.heights.shape
+        i = np.floor((x - self.origin_x) / self.resolution)
+        j = np.floor((y - self.origin_y) / self.resolution)
+        outside = (i < 0) | (i >= nx) | (j < 0) | (j >= ny)
+        heights = self.heights.reshape(-1)[self.cell_indices(x, y)]
+        return np.where(outside, -np.inf, heights)
+
+    def points_below_surface(self, points: np.ndarray) -> np.ndarray:
+        """
+        Check which points are below the top surface.
+
+        Args:
+            points (np.ndarray): points in m of shape (n, 3)
+
+        Returns:
+            np.ndarray: boolean mask of shape (n,)
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        return points[:, 2] < self.heights_at(points[:, 0], points[:, 1])
+
+    def first_collision_indices(self, trajectories: np.ndarray) -> np.ndarray:
+        """
+        Find the first point of each trajectory that is below the surface.
+
+        Args:
+            trajectories (np.ndarray): trajectories in m of shape (n_jets, n_points, 3)
+
+        Returns:
+            np.ndarray: index of the first colliding point per jet or -1 if there is none
+        """
+        n_jets, n_points, _ = trajectories.shape
+        below = self.points_below_surface(trajectories.reshape(-1, 3))
+        below = below.reshape(n_jets, n_points)
+        return np.where(below.any(axis=1), below.argmax(axis=1), -1)
@@ -0,0 +1,234 @@
+"""
+Created on 2024-09-06
+
+@author: wf
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from sprinkler.sprinkler_config import Point3D, SprinklerConfig
+from sprinkler.waterjet import Parabolic
+
+
+class ImpactTable:
+    """
+    Precomputed lookup table mapping (horizontal angle, vertical angle)
+    to the impact point of the water jet on the lawn.
+
+    The table is a regular grid over the AngleRange.angles of a SprinklerConfig
+    and is queried with bilinear interpolation in O(1) per angle pair.
+    """
+
+    def __init__(
+        self,
+        h_min: float,
+        h_step: float,
+        v_min: float,
+        v_step: float,
+        impacts: np.ndarray,
+        times: np.ndarray,
+        signature: str = None,
+    ):
+        """
+        Initialize the table.
+
+        Args:
+            h_min (float): first horizontal angle of the grid (degrees)
+            h_step (float): horizontal angle step (degrees)
+            v_min (float): first vertical angle of the grid (degrees)
+            v_step (float): vertical angle step (degrees)
+            impacts (np.ndarray): impact points of shape (n_h, n_v, 3)
+            times (np.ndarray): times of flight of shape (n_h, n_v)
+            signature (str): signature of the configuration the table was built for
+        """
+        self.h_min = h_min
+        self.h_step = h_step
+        self.v_min = v_min
+        self.v_step = v_step
+        self.impacts = impacts
+        self.times = times
+        self.signature = signature
+
+    @staticmethod
+    def get_signature(config: SprinklerConfig, gravity: float = 9.8) -> str:
+        """
+        Get a signature of all configuration values the table depends on.
+
+        Args:
+            config (SprinklerConfig): the sprinkler configuration
+            gravity (float): gravitational acceleration in m/s²
+
+        Returns:
+            str: a short hex digest
+        """
+        head = config.sprinkler_head
+        values = {
+            "head": [head.x, head.y, head.z],
+            "velocity": config.hose.velocity,
+            "horizontal": [
+                config.angles.horizontal.min,
+                config.angles.horizontal.max,
+                config.angles.horizontal.step,
+            ],
+            "vertical": [
+                config.angles.vertical.min,
+                config.angles.vertical.max,
+                config.angles.vertical.step,
+            ],
+            "gravity": gravity,
+        }
+        digest = hashlib.sha256(json.dumps(values).encode()).hexdigest()
+        return digest[:16]
+
+    @classmethod
+    def from_config(
+        cls, config: SprinklerConfig, gravity: float = 9.8
+    ) -> "ImpactTable":
+        """
+        Build the table for the angle grid, sprinkler head and hose of the given configuration.
+
+        Args:
+            config (SprinklerConfig): the sprinkler configuration
+            gravity (float): gravitational acceleration in m/s²
+
+        Returns:
+            ImpactTable: the computed table
+        """
+        h_range = config.angles.horizontal
+        v_range = config.angles.vertical
+        h_angles = np.asarray(h_range.angles, dtype=float)
+        v_angles = np.asarray(v_range.angles, dtype=float)
+        h_grid, v_grid = np.meshgrid(h_angles, v_angles, indexing="ij")
+        head = config.sprinkler_head
+        times, _apexes, impacts = Parabolic.calculate_ballistics_batch(
+            start_position=Point3D(head.x, head.y, head.z),
+            initial_velocity=config.hose.velocity,
+            horizontal_angles=h_grid,
+            vertical_angles=v_grid,
+            gravity=gravity,
+        )
+        shape = h_grid.shape
+        table = cls(
+            h_min=h_range.min,
+            h_step=h_range.step,
+            v_min=v_range.min,
+            v_step=v_range.step,
+            impacts=impacts.reshape(shape + (3,)).astype(np.float32),
+            times=times.reshape(shape).astype(np.float32),
+            signature=cls.get_signature(config, gravity),
+        )
+        return table
+
+    def save(self, path: str):
+        """
+        Save the table as a compressed .npz file.
+
+        Args:
+            path (str): the file path
+        """
+        np.savez_compressed(
+            path,
+            grid=np.array([self.h_min, self.h_step, self.v_min, self.v_step]),
+            impacts=self.impacts,
+            times=self.times,
+            signature=np.array(self.signature or ""),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "ImpactTable":
+        """
+        Load a table saved with save.
+
+        Args:
+            path (str): the file path
+
+        Returns:
+            ImpactTable: the loaded table
+        """
+        with np.load(path) as npz:
+            h_min, h_step, v_min, v_step = npz["grid"].tolist()
+            table = cls(
+                h_min=h_min,
+                h_step=h_step,
+                v_min=v_min,
+                v_step=v_step,
+                impacts=npz["impacts"],
+                times=npz["times"],
+                signature=str(npz["signature"]) or None,
+            )
+        return table
+
+    @classmethod
+    def load_or_create(
+        cls, config: SprinklerConfig, cache_dir: str, gravity: float = 9.8
+    ) -> "ImpactTable":
+        """
+        Load the table for the given configuration from the cache directory
+        or compute and store it there if it does not exist yet.
+
+        Args:
+            config (SprinklerConfig): the sprinkler configuration
+            cache_dir (str): the directory to store the table files in
+            gravity (float): gravitational acceleration in m/s²
+
+        Returns:
+            ImpactTable: the table
+        """
+        signature = cls.get_signature(config, gravity)
+        path = os.path.join(cache_dir, f"impact_table_{signature}.npz")
+        if os.path.isfile(path):
+            table = cls.load(path)
+        else:
+            table = cls.from_config(config, gravity)
+            os.makedirs(cache_dir, exist_ok=True)
+            table.save(path)
+        return table
+
+    def lookup(self, horizontal_angles, vertical_angles) -> np.ndarray:
+        """
+        Look up the impact points for arrays of angle pairs using bilinear interpolation.
+        Angles outside of the grid are clamped to its border.
+
+        Args:
+            horizontal_angles: horizontal angle(s) in degrees
+            vertical_angles: vertical angle(s) in degrees (same shape)
+
+        Returns:
+            np.ndarray: impact points of shape (n, 3)
+        """
+        n_h, n_v = self.times.shape
+        h = np.atleast_1d(np.asarray(horizontal_angles, dtype=float)).ravel()
+        v = np.atleast_1d(np.asarray(vertical_angles, dtype=float)).ravel()
+        h_pos = np.clip((h - self.h_min) / self.h_step, 0, n_h - 1)
+        v_pos = np.clip((v - self.v_min) / self.v_step, 0, n_v - 1)
+        i0 = np.minimum(h_pos.astype(int), max(n_h - 2, 0))
+        j0 = np.minimum(v_pos.astype(int), max(n_v - 2, 0))
+        i1 = np.minimum(i0 + 1, n_h - 1)
+        j1 = np.minimum(j0 + 1, n_v - 1)
+        fh = (h_pos - i0)[:, np.newaxis]
+        fv = (v_pos - j0)[:, np.newaxis]
+        impacts = (
+            self.impacts[i0, j0] * (1 - fh) * (1 - fv)
+            + self.impacts[i1, j0] * fh * (1 - fv)
+            + self.impacts[i0, j1] * (1 - fh) * fv
+            + self.impacts[i1, j1] * fh * fv
+        )
+        return impacts
+
+    def impact_point(self, horizontal_angle: float, vertical_angle: float) -> Point3D:
+        """
+        Look up the impact point for a single angle pair.
+
+        Args:
+            horizontal_angle (float): the horizontal angle in degrees
+            vertical_angle (float): the vertical angle in degrees
+
+        Returns:
+            Point3D: the interpolated impact point
+        """
+        x, y, z = self.lookup(horizontal_angle, vertical_angle)[0].tolist()
+        return Point3D(x, y, z)
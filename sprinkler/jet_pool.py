@@ -0,0 +1,198 @@
+"""
+Created on 2024-09-09
+
+@author: wf
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+from nicegui import ui
+
+
+class JetPool:
+    """
+    Fixed size ring buffer of preallocated water jet objects in a scene.
+
+    All point clouds are created once and hidden - showing a jet reuses the
+    oldest one round-robin by updating its points in place, so no scene
+    objects are created or deleted while the simulation runs.
+    """
+
+    def __init__(
+        self,
+        scene: ui.scene,
+        size: int = 50,
+        color: str = "#1E90FF",
+        opacity: float = 0.7,
+        point_size: float = 0.05,
+    ):
+        """
+        Preallocate the jet objects.
+
+        Args:
+            scene (ui.scene): the scene to add the jets to
+            size (int): the number of jets visible at the same time
+            color (str): the color of the jets
+            opacity (float): the opacity of the jets
+            point_size (float): the size of the water droplets in m
+        """
+        if size < 1:
+            raise ValueError(f"jet pool size must be positive but is {size}")
+        self.size = size
+        self.jets = []
+        for _index in range(size):
+            jet = scene.point_cloud([[0, 0, 0]], point_size=point_size)
+            jet.material(color, opacity=opacity).visible(False)
+            self.jets.append(jet)
+        self.next_index = 0
+        self.used = 0
+
+    @property
+    def jet_capacity(self) -> int:
+        """
+        the number of jets visible at the same time
+        """
+        return self.size
+
+    def show(self, points: List[List[float]]):
+        """
+        Show the given points replacing the oldest jet once all jets are in use.
+
+        Args:
+            points (List[List[float]]): the points of the jet in m
+        """
+        jet = self.jets[self.next_index]
+        jet.set_points(points)
+        # slots are filled in order - only the ones not used yet are hidden
+        if self.used < self.size:
+            jet.visible(True)
+        self.next_index = (self.next_index + 1) % self.size
+        self.used = min(self.used + 1, self.size)
+
+    def clear(self):
+        """
+        Hide all jets.
+        """
+        for jet in self.jets[: self.used]:
+            jet.visible(False)
+        self.next_index = 0
+        self.used = 0
+
+    def delete(self):
+        """
+        Remove all jets from the scene.
+        """
+        for jet in self.jets:
+            jet.delete()
+        self.jets.clear()
+        self.used = 0
+
+
+class LinePool:
+    """
+    Fixed size ring buffer of preallocated line segments in a scene.
+
+    Scene lines can not change their end points, so every segment is a line
+    of unit length along the x-axis which is moved, rotated and scaled
+    onto the segment to show.
+    """
+
+    def __init__(
+        self,
+        scene: ui.scene,
+        size: int = 1000,
+        color: str = "#1E90FF",
+        opacity: float = 0.7,
+    ):
+        """
+        Preallocate the line segments.
+
+        Args:
+            scene (ui.scene): the scene to add the segments to
+            size (int): the number of segments visible at the same time
+            color (str): the color of the segments
+            opacity (float): the opacity of the segments
+        """
+        if size < 1:
+            raise ValueError(f"line pool size must be positive but is {size}")
+        self.size = size
+        self.lines = []
+        for _index in range(size):
+            line = scene.line([0, 0, 0], [1, 0, 0])
+            line.material(color, opacity=opacity).visible(False)
+            self.lines.append(line)
+        self.next_index = 0
+        self.used = 0
+        # the most segments of a jet shown so far
+        self.max_segments = 1
+
+    @property
+    def jet_capacity(self) -> int:
+        """
+        the number of jets that are surely visible at the same time - adaptively
+        sampled jets have varying numbers of segments so the longest one counts
+        """
+        return max(1, self.size // self.max_segments)
+
+    @staticmethod
+    def segment_transform(start, end) -> Tuple[float, List[List[float]]]:
+        """
+        Get the length and the rotation matrix that map the unit x-axis
+        onto the segment from start to end.
+
+        Args:
+            start: the start point
+            end: the end point
+
+        Returns:
+            Tuple[float, List[List[float]]]: the length and the 3x3 rotation matrix
+        """
+        d = np.asarray(end, dtype=float) - np.asarray(start, dtype=float)
+        length = float(np.linalg.norm(d))
+        if length == 0:
+            return 0.0, [[1, 0, 0], [0, 1, 0], [0, 0, 1]]
+        u = d / length
+        helper = np.array([1.0, 0, 0]) if abs(u[2]) > 0.9 else np.array([0, 0, 1.0])
+        n = np.cross(u, helper)
+        n /= np.linalg.norm(n)
+        w = np.cross(n, u)
+        R = np.stack([u, w, n], axis=1).round(6).tolist()
+        return length, R
+
+    def show(self, trajectory: List[Tuple[float, float, float]]):
+        """
+        Show the segments of the given trajectory replacing the oldest segments
+        once all segments are in use.
+
+        Args:
+            trajectory (List[Tuple[float, float, float]]): the points of the trajectory in m
+        """
+        self.max_segments = max(self.max_segments, len(trajectory) - 1)
+        for start, end in zip(trajectory[:-1], trajectory[1:]):
+            length, R = LinePool.segment_transform(start, end)
+            line = self.lines[self.next_index]
+            line.move(*start).rotate_R(R).scale(max(length, 1e-6), 1, 1)
+            # slots are filled in order - only the ones not used yet are hidden
+            if self.used < self.size:
+                line.visible(True)
+            self.next_index = (self.next_index + 1) % self.size
+            self.used = min(self.used + 1, self.size)
+
+    def clear(self):
+        """
+        Hide all segments.
+        """
+        for line in self.lines[: self.used]:
+            line.visible(False)
+        self.next_index = 0
+        self.used = 0
+
+    def delete(self):
+        """
+        Remove all segments from the scene.
+        """
+        for line in self.lines:
+            line.delete()
+        self.lines.clear()
+        self.used = 0
@@ -0,0 +1,209 @@
+"""
+Created on 2024-09-08
+
+@author: wf
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Callable, Dict, List
+
+import numpy as np
+
+
+class MeshCache:
+    """
+    Directory of .npy files holding the parsed vertex data of an STL file and
+    the acceleration structures derived from it.
+
+    The directory is keyed by the path, size and modification time of the STL file,
+    so a changed file gets a fresh cache and the stale directories of its earlier
+    versions are removed. Arrays are loaded memory mapped so that restart time
+    and resident memory do not grow with the size of the model.
+    """
+
+    SOURCE_FILE = "source.txt"
+
+    def __init__(self, cache_dir: str, stl_file_path: str):
+        """
+        Initialize the cache for the given STL file.
+
+        Args:
+            cache_dir (str): the base directory of all caches
+            stl_file_path (str): the path of the STL file
+        """
+        self.cache_dir = cache_dir
+        self.stl_file_path = stl_file_path
+        self.key = MeshCache.get_key(stl_file_path)
+        self.path = os.path.join(cache_dir, "stl", self.key)
+
+    @staticmethod
+    def get_key(stl_file_path: str) -> str:
+        """
+        Get the cache key for the given STL file.
+
+        Args:
+            stl_file_path (str): the path of the STL file
+
+        Returns:
+            str: a short hex digest of the absolute path, size and modification time
+        """
+        stat = os.stat(stl_file_path)
+        abs_path = os.path.abspath(stl_file_path)
+        signature = f"{abs_path}|{stat.st_size}|{stat.st_mtime_ns}"
+        return hashlib.sha256(signature.encode()).hexdigest()[:16]
+
+    def create_dir(self):
+        """
+        Create the directory of this cache recording the STL file it belongs to
+        and remove the directories of earlier versions of the same file.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, MeshCache.SOURCE_FILE), "w") as source_file:
+            source_file.write(os.path.abspath(self.stl_file_path))
+        self.prune_stale()
+
+    def prune_stale(self) -> List[str]:
+        """
+        Remove the cache directories of the same STL file with an outdated key.
+
+        Returns:
+            List[str]: the removed directories
+        """
+        abs_path = os.path.abspath(self.stl_file_path)
+        stl_dir = os.path.dirname(self.path)
+        removed = []
+        for key in os.listdir(stl_dir):
+            if key == self.key:
+                continue
+            path = os.path.join(stl_dir, key)
+            source_path = os.path.join(path, MeshCache.SOURCE_FILE)
+            if not os.path.isfile(source_path):
+                continue
+            with open(source_path) as source_file:
+                source = source_file.read()
+            if source == abs_path:
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(path)
+        return removed
+
+    def file_path(self, name: str) -> str:
+        """
+        Get the path of the .npy file for the array with the given name.
+        """
+        return os.path.join(self.path, f"{name}.npy")
+
+    def has(self, name: str) -> bool:
+        """
+        Check whether the array with the given name is cached.
+        """
+        return os.path.isfile(self.file_path(name))
+
+    def load(self, name: str, mmap_mode: str = "r") -> np.ndarray:
+        """
+        Load the array with the given name.
+
+        Args:
+            name (str): the name of the array
+            mmap_mode (str): the memory map mode - None to read the array into memory
+
+        Returns:
+            np.ndarray: the (memory mapped) array or None if it is not cached
+        """
+        if not self.has(name):
+            return None
+        return np.load(self.file_path(name), mmap_mode=mmap_mode)
+
+    def write_file(self, path: str, write: Callable[[str], None]):
+        """
+        Write a file in the cache directory via a temporary file which is
+        atomically renamed so that concurrent readers never see partial files.
+
+        Args:
+            path (str): the target path
+            write (Callable): function writing the content to the given path
+        """
+        if not os.path.isdir(self.path):
+            self.create_dir()
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def save(self, name: str, array: np.ndarray):
+        """
+        Save the array with the given name.
+
+        Args:
+            name (str): the name of the array
+            array (np.ndarray): the array to save
+        """
+
+        def write(path: str):
+            with open(path, "wb") as npy_file:
+                np.save(npy_file, np.ascontiguousarray(array))
+
+        self.write_file(self.file_path(name), write)
+
+    def get_or_create_file(self, filename: str, write: Callable[[str], None]) -> str:
+        """
+        Get the path of the file with the given name in the cache directory
+        creating it if it does not exist yet.
+
+        Args:
+            filename (str): the name of the file
+            write (Callable): function writing the content to the given path
+
+        Returns:
+            str: the path of the file
+        """
+        path = os.path.join(self.path, filename)
+        if not os.path.isfile(path):
+            self.write_file(path, write)
+        return path
+
+    def get_or_create(self, name: str, create: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        Load the array with the given name or create and save it.
+
+        Args:
+            name (str): the name of the array
+            create (Callable): function to create the array if it is not cached
+
+        Returns:
+            np.ndarray: the memory mapped array
+        """
+        array = self.load(name)
+        if array is None:
+            self.save(name, create())
+            array = self.load(name)
+        return array
+
+    def get_or_create_arrays(
+        self,
+        prefix: str,
+        names: List[str],
+        create: Callable[[], Dict[str, np.ndarray]],
+    ) -> Dict[str, np.ndarray]:
+        """
+        Load a group of arrays stored as prefix_name or create and save all of them.
+
+        Args:
+            prefix (str): the common prefix of the array names
+            names (List[str]): the names of the arrays in the group
+            create (Callable): function to create the dict of arrays by name
+
+        Returns:
+            Dict[str, np.ndarray]: the memory mapped arrays by name
+        """
+        if not all(self.has(f"{prefix}_{name}") for name in names):
+            arrays = create()
+            for name in names:
+                self.save(f"{prefix}_{name}", arrays[name])
+        return {name: self.load(f"{prefix}_{name}") for name in names}
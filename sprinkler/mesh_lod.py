@@ -0,0 +1,91 @@
+"""
+Created on 2024-09-08
+
+@author: wf
+"""
+
+import numpy as np
+import stl
+from stl import mesh
+
+
+class MeshLOD:
+    """
+    Level of detail variants of a mesh created by vertex clustering.
+
+    All vertices within a cell of a regular grid are merged into their mean,
+    triangles that collapse to a line or point are dropped.
+    The simplified mesh deviates from the original by at most about one cell size.
+    """
+
+    # cell sizes in mm by level name - 0 means the full mesh
+    LEVELS = {"full": 0.0, "medium": 50.0, "coarse": 200.0}
+
+    @classmethod
+    def cell_size(cls, level: str) -> float:
+        """
+        Get the cell size for the given level.
+
+        Args:
+            level (str): the level name
+
+        Returns:
+            float: the cell size in mm
+
+        Raises:
+            ValueError: if the level is unknown
+        """
+        if level not in cls.LEVELS:
+            raise ValueError(
+                f"unknown level of detail {level} - must be one of {list(cls.LEVELS)}"
+            )
+        return cls.LEVELS[level]
+
+    @staticmethod
+    def cluster_vertices(triangles: np.ndarray, cell_size: float) -> np.ndarray:
+        """
+        Simplify the given triangles by vertex clustering.
+
+        Args:
+            triangles (np.ndarray): triangle vertices of shape (m, 3, 3)
+            cell_size (float): the clustering cell size in the units of the triangles
+
+        Returns:
+            np.ndarray: the simplified triangle vertices of shape (k, 3, 3), k <= m
+        """
+        triangles = np.asarray(triangles, dtype=np.float64)
+        if cell_size <= 0 or len(triangles) == 0:
+            return triangles.copy()
+        vertices = triangles.reshape(-1, 3)
+        cells = np.floor((vertices - vertices.min(axis=0)) / cell_size).astype(np.int64)
+        _cells, cluster = np.unique(cells, axis=0, return_inverse=True)
+        cluster = cluster.reshape(-1)
+        sums = np.zeros((cluster.max() + 1, 3))
+        np.add.at(sums, cluster, vertices)
+        representatives = sums / np.bincount(cluster)[:, np.newaxis]
+        ids = cluster.reshape(-1, 3)
+        keep = (
+            (ids[:, 0] != ids[:, 1])
+            & (ids[:, 1] != ids[:, 2])
+            & (ids[:, 2] != ids[:, 0])
+        )
+        ids = ids[keep]
+        # drop duplicates of the same cluster triple keeping the first orientation
+        _unique, first = np.unique(np.sort(ids, axis=1), axis=0, return_index=True)
+        ids = ids[np.sort(first)]
+        return representatives[ids]
+
+    @staticmethod
+    def write_binary_stl(path: str, triangles: np.ndarray, name: str = "lod"):
+        """
+        Write the given triangles as a binary STL file.
+
+        Args:
+            path (str): the file path
+            triangles (np.ndarray): triangle vertices of shape (m, 3, 3)
+            name (str): the name to put into the header
+        """
+        data = np.zeros(len(triangles), dtype=mesh.Mesh.dtype)
+        data["vectors"] = triangles
+        lod_mesh = mesh.Mesh(data, calculate_normals=True, name=name)
+        lod_mesh.save(path, mode=stl.Mode.BINARY, update_normals=False)
@@ -0,0 +1,261 @@
+"""
+Created on 2024-09-08
+
+@author: wf
+"""
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+import numpy as np
+
+from sprinkler.broad_phase import BroadPhaseStats
+
+
+class SDF(ABC):
+    """
+    Signed distance field of an analytic shape - negative inside,
+    positive outside, evaluated vectorized over arrays of points in m.
+
+    Distances never overestimate the distance to the surface so that
+    sphere tracing can safely step by them.
+    """
+
+    @abstractmethod
+    def distance(self, points: np.ndarray) -> np.ndarray:
+        """
+        Get the signed distances of the given points.
+
+        Args:
+            points (np.ndarray): points of shape (n, 3)
+
+        Returns:
+            np.ndarray: signed distances of shape (n,)
+        """
+
+    @abstractmethod
+    def bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the axis aligned bounding box of the shape.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: the lower and upper corner
+        """
+
+    def __or__(self, other: "SDF") -> "Union":
+        return Union([self, other])
+
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        """
+        Check which of the given points are inside or on the surface.
+
+        Args:
+            points (np.ndarray): points of shape (n, 3)
+
+        Returns:
+            np.ndarray: boolean mask of shape (n,)
+        """
+        return self.distance(as_points(points)) <= 0
+
+    def first_collision_indices(self, trajectories: np.ndarray) -> np.ndarray:
+        """
+        Find the first point of each trajectory that is inside the shape.
+
+        Args:
+            trajectories (np.ndarray): trajectories of shape (n_jets, n_points, 3)
+
+        Returns:
+            np.ndarray: index of the first colliding point per jet or -1 if there is none
+        """
+        n_jets, n_points, _ = trajectories.shape
+        inside = self.contains(trajectories.reshape(-1, 3)).reshape(n_jets, n_points)
+        return np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+
+    def sphere_trace(
+        self,
+        trajectories: np.ndarray,
+        epsilon: float = 0.005,
+        max_steps: int = 64,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the first hit of each trajectory polyline by sphere tracing:
+        each jet advances along its polyline by the distance to the shape,
+        so free space is crossed in a few large steps instead of dense sampling.
+        Jets still marching after max_steps - e.g. grazing the surface - fall back
+        to the exact check of their trajectory points by first_collision_indices.
+
+        Args:
+            trajectories (np.ndarray): trajectories of shape (n_jets, n_points, 3)
+            epsilon (float): the distance at which a jet counts as hitting the shape
+            max_steps (int): the maximum number of steps per jet
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: boolean hit mask of shape (n_jets,) and
+            the hit points of shape (n_jets, 3) - NaN for jets which do not hit
+        """
+        n_jets, n_points, _ = trajectories.shape
+        segments = np.diff(trajectories, axis=1)
+        lengths = np.linalg.norm(segments, axis=2)
+        # arc length at the start of each segment
+        arc_starts = np.concatenate(
+            [np.zeros((n_jets, 1)), np.cumsum(lengths, axis=1)], axis=1
+        )
+        total = arc_starts[:, -1]
+        hit = np.zeros(n_jets, dtype=bool)
+        hit_points = np.full((n_jets, 3), np.nan)
+        jets = np.arange(n_jets)
+        arc = np.zeros(n_jets)
+        for _step in range(max_steps):
+            if len(jets) == 0:
+                break
+            # locate the segment of the current arc length of each active jet
+            segment = np.sum(arc_starts[jets, 1:-1] <= arc[:, np.newaxis], axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                f = (arc - arc_starts[jets, segment]) / lengths[jets, segment]
+            f = np.nan_to_num(f)[:, np.newaxis]
+            points = trajectories[jets, segment] + f * segments[jets, segment]
+            distances = self.distance(points)
+            is_hit = distances <= epsilon
+            hit[jets[is_hit]] = True
+            hit_points[jets[is_hit]] = points[is_hit]
+            # the arc length is never shorter than the straight distance
+            arc = arc + np.maximum(distances, epsilon)
+            active = ~is_hit & (arc <= total[jets])
+            jets = jets[active]
+            arc = arc[active]
+        if len(jets) > 0:
+            indices = self.first_collision_indices(trajectories[jets])
+            is_hit = indices >= 0
+            hit[jets[is_hit]] = True
+            hit_points[jets[is_hit]] = trajectories[jets[is_hit], indices[is_hit]]
+        return hit, hit_points
+
+
+def as_points(points) -> np.ndarray:
+    """
+    Convert the given points to a float array of shape (n, 3).
+    """
+    return np.atleast_2d(np.asarray(points, dtype=float))
+
+
+@dataclass
+class Box(SDF):
+    """
+    Axis aligned box given by its lower and upper corner
+    """
+
+    low: Tuple[float, float, float]
+    high: Tuple[float, float, float]
+
+    def bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        return np.asarray(self.low, dtype=float), np.asarray(self.high, dtype=float)
+
+    def distance(self, points: np.ndarray) -> np.ndarray:
+        low = np.asarray(self.low, dtype=float)
+        high = np.asarray(self.high, dtype=float)
+        q = np.abs(as_points(points) - (low + high) / 2) - (high - low) / 2
+        outside = np.linalg.norm(np.maximum(q, 0), axis=1)
+        inside = np.minimum(q.max(axis=1), 0)
+        return outside + inside
+
+
+@dataclass
+class Sphere(SDF):
+    """
+    Sphere given by its center and radius
+    """
+
+    center: Tuple[float, float, float]
+    radius: float
+
+    def bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        center = np.asarray(self.center, dtype=float)
+        return center - self.radius, center + self.radius
+
+    def distance(self, points: np.ndarray) -> np.ndarray:
+        offsets = as_points(points) - np.asarray(self.center, dtype=float)
+        return np.linalg.norm(offsets, axis=1) - self.radius
+
+
+@dataclass
+class Cylinder(SDF):
+    """
+    Vertical cylinder given by the center of its base, its radius and its height
+    """
+
+    base: Tuple[float, float, float]
+    radius: float
+    height: float
+
+    def bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        base = np.asarray(self.base, dtype=float)
+        extent = np.array([self.radius, self.radius, 0.0])
+        return base - extent, base + extent + [0, 0, self.height]
+
+    def distance(self, points: np.ndarray) -> np.ndarray:
+        offsets = as_points(points) - np.asarray(self.base, dtype=float)
+        radial = np.hypot(offsets[:, 0], offsets[:, 1]) - self.radius
+        axial = np.abs(offsets[:, 2] - self.height / 2) - self.height / 2
+        outside = np.hypot(np.maximum(radial, 0), np.maximum(axial, 0))
+        inside = np.minimum(np.maximum(radial, axial), 0)
+        return outside + inside
+
+
+@dataclass
+class Union(SDF):
+    """
+    Union of shapes - the minimum of their distances.
+
+    The bounding box of each shape serves as broad phase: the distance to the box
+    is a lower bound of the distance to the shape, so a shape is only evaluated
+    exactly for points where it could still be the closest one.
+    """
+
+    shapes: List[SDF]
+    stats: BroadPhaseStats = field(
+        default_factory=BroadPhaseStats, repr=False, compare=False
+    )
+
+    def __or__(self, other: SDF) -> "Union":
+        return Union(self.shapes + [other])
+
+    def bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.shapes:
+            return np.full(3, np.inf), np.full(3, -np.inf)
+        corners = [shape.bounds() for shape in self.shapes]
+        low = np.min([low for low, _high in corners], axis=0)
+        high = np.max([high for _low, high in corners], axis=0)
+        return low, high
+
+    def distance(self, points: np.ndarray) -> np.ndarray:
+        points = as_points(points)
+        distances = np.full(len(points), np.inf)
+        self.stats.queries += len(points)
+        self.stats.pairs += len(points) * len(self.shapes)
+        for shape in self.shapes:
+            lower = Box(*shape.bounds()).distance(points)
+            need = lower < distances
+            self.stats.exact_tests += int(np.count_nonzero(need))
+            if np.any(need):
+                distances[need] = np.minimum(
+                    distances[need], shape.distance(points[need])
+                )
+        return distances
+
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        points = as_points(points)
+        inside = np.zeros(len(points), dtype=bool)
+        in_any_box = np.zeros(len(points), dtype=bool)
+        self.stats.queries += len(points)
+        self.stats.pairs += len(points) * len(self.shapes)
+        for shape in self.shapes:
+            low, high = shape.bounds()
+            # points which are outside of the box or already known to be inside are skipped
+            need = ~inside & np.all((points >= low) & (points <= high), axis=1)
+            in_any_box |= need
+            self.stats.exact_tests += int(np.count_nonzero(need))
+            if np.any(need):
+                inside[need] = shape.contains(points[need])
+        self.stats.culled_queries += int(np.count_nonzero(~in_any_box))
+        return inside
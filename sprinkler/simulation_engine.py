@@ -0,0 +1,233 @@
+"""
+Created on 2024-09-09
+
+@author: wf
+"""
+
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+from sprinkler.deposition import DepositionGrid, DepositionStats
+from sprinkler.impact_table import ImpactTable
+from sprinkler.sprinkler_config import Point3D, SprinklerConfig
+from sprinkler.waterjet import WaterJet
+
+
+@dataclass
+class SimulationResult:
+    """
+    Time series of a headless simulation run sampled at regular intervals
+    """
+
+    times: np.ndarray  # simulated seconds
+    total_liters: np.ndarray  # liters sprinkled so far
+    coverage: np.ndarray  # fraction of the rainfall target reached (0..1)
+    uniformity: np.ndarray  # Christiansen uniformity coefficient (1 = uniform)
+    dry_ratio: np.ndarray  # fraction of dry cells
+    stats: DepositionStats  # statistics at the end of the run
+    deposition: DepositionGrid  # the final deposition
+
+
+class SimulationEngine:
+    """
+    Headless sprinkler simulation in simulated time.
+
+    The sprinkler head sweeps back and forth between the angle limits - by default
+    those of the configuration. Each tick the horizontal angle moves by speed degrees and
+    the vertical angle by half of it. The water of all ticks of a batch is
+    deposited on the lawn in one vectorized step, so a run progresses as fast
+    as the CPU allows instead of one tick per timer call.
+    """
+
+    def __init__(
+        self,
+        config: SprinklerConfig,
+        time_step: float = 0.05,
+        speed: float = 1.0,
+        flow_rate: float = None,
+        cell_size: float = 0.1,
+        impact_table: ImpactTable = None,
+        model: str = "parabolic",
+    ):
+        """
+        Initialize the engine.
+
+        Args:
+            config (SprinklerConfig): the sprinkler configuration
+            time_step (float): simulated seconds per tick
+            speed (float): horizontal angle step per tick in degrees
+            flow_rate (float): flow rate in l/min - default: the flow rate of the hose
+            cell_size (float): cell size of the deposition grid in m
+            impact_table (ImpactTable): optional precomputed impact points of the configuration
+                to look up instead of computing the ballistics of each tick
+            model (str): the trajectory model of the jets - see WaterJet.MODELS
+        """
+        self.time_step = time_step
+        self.speed = speed
+        self.cell_size = cell_size
+        head = config.sprinkler_head
+        self.water_jet = WaterJet(
+            start_position=Point3D(head.x, head.y, head.z),
+            hose=config.hose,
+            model=model,
+        )
+        self.set_config(config, impact_table=impact_table)
+        if flow_rate is not None:
+            self.flow_rate = flow_rate
+
+    def set_source(self, config: SprinklerConfig, impact_table: ImpactTable = None):
+        """
+        Take the sprinkler head and the hose of the given configuration
+        for the jets - the water sprinkled so far is kept.
+
+        Args:
+            config (SprinklerConfig): the sprinkler configuration
+            impact_table (ImpactTable): optional precomputed impact points of the configuration
+        """
+        model = self.water_jet.model
+        if impact_table is not None and model != "parabolic":
+            raise ValueError(
+                f"the impact table holds parabolic impacts and can not be used for the {model} model"
+            )
+        self.config = config
+        head = config.sprinkler_head
+        self.water_jet.start_position = Point3D(head.x, head.y, head.z)
+        self.water_jet.hose = config.hose
+        self.impact_table = impact_table
+
+    def set_config(self, config: SprinklerConfig, impact_table: ImpactTable = None):
+        """
+        Switch to the given configuration - besides the jet source the lawn,
+        the flow rate and the sweep limits are taken from it and the simulation is reset.
+
+        Args:
+            config (SprinklerConfig): the sprinkler configuration
+            impact_table (ImpactTable): optional precomputed impact points of the configuration
+        """
+        self.set_source(config, impact_table=impact_table)
+        self.flow_rate = config.hose.flow_rate
+        self.deposition = DepositionGrid(config.lawn, cell_size=self.cell_size)
+        # sweep limits in degrees
+        angles = config.angles
+        self.h_min, self.h_max = angles.horizontal.min, angles.horizontal.max
+        self.v_min, self.v_max = angles.vertical.min, angles.vertical.max
+        self.reset()
+
+    def reset(self):
+        """
+        Reset time, water and the sweep position.
+        """
+        self.time = 0.0
+        self.total_liters = 0.0
+        self.deposition.reset()
+        self.h_angle = self.h_min
+        self.v_angle = self.v_min
+        self.h_direction = 1
+        self.v_direction = 1
+
+    def sweep_angles(self, ticks: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Advance the sweep by the given number of ticks.
+
+        Args:
+            ticks (int): the number of ticks
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: the horizontal and vertical angles of each tick
+        """
+        h_angles = np.empty(ticks)
+        v_angles = np.empty(ticks)
+        h, v = self.h_angle, self.v_angle
+        h_dir, v_dir = self.h_direction, self.v_direction
+        for tick in range(ticks):
+            h_angles[tick] = h
+            v_angles[tick] = v
+            h += h_dir * self.speed
+            if h >= self.h_max or h <= self.h_min:
+                h_dir *= -1
+            v += v_dir * (self.speed / 2)
+            if v >= self.v_max or v <= self.v_min:
+                v_dir *= -1
+        self.h_angle, self.v_angle = h, v
+        self.h_direction, self.v_direction = h_dir, v_dir
+        return h_angles, v_angles
+
+    def emit(self, horizontal_angles, vertical_angles) -> np.ndarray:
+        """
+        Sprinkle one tick of water at each of the given angle pairs.
+
+        Args:
+            horizontal_angles: horizontal angles in degrees - one per tick
+            vertical_angles: vertical angles in degrees - one per tick
+
+        Returns:
+            np.ndarray: the impact points of shape (ticks, 3)
+        """
+        h = np.atleast_1d(np.asarray(horizontal_angles, dtype=float))
+        v = np.atleast_1d(np.asarray(vertical_angles, dtype=float))
+        if self.impact_table is not None:
+            impacts = self.impact_table.lookup(h, v)
+        else:
+            impacts = self.water_jet.calculate_impacts(h, v)
+        liters = self.flow_rate / 60 * self.time_step
+        self.deposition.deposit(impacts, liters)
+        self.total_liters += liters * len(h)
+        self.time += self.time_step * len(h)
+        return impacts
+
+    def step(self, ticks: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Advance the sweep and sprinkle the water of the given number of ticks.
+
+        Args:
+            ticks (int): the number of ticks
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: the horizontal and vertical angles of each tick
+        """
+        h_angles, v_angles = self.sweep_angles(ticks)
+        self.emit(h_angles, v_angles)
+        return h_angles, v_angles
+
+    def run(self, duration: float, sample_interval: float = 60.0) -> SimulationResult:
+        """
+        Run the simulation for the given simulated time.
+
+        Args:
+            duration (float): simulated seconds to run
+            sample_interval (float): simulated seconds between the time series samples
+
+        Returns:
+            SimulationResult: the time series and the final deposition
+        """
+        total_ticks = int(round(duration / self.time_step))
+        sample_ticks = max(1, int(round(sample_interval / self.time_step)))
+        samples = []
+        done = 0
+        while done < total_ticks:
+            ticks = min(sample_ticks, total_ticks - done)
+            self.step(ticks)
+            done += ticks
+            stats = self.deposition.stats()
+            samples.append(
+                (
+                    self.time,
+                    self.total_liters,
+                    stats.coverage,
+                    stats.uniformity,
+                    stats.dry_ratio,
+                )
+            )
+        series = np.array(samples).reshape(-1, 5)
+        result = SimulationResult(
+            times=series[:, 0],
+            total_liters=series[:, 1],
+            coverage=series[:, 2],
+            uniformity=series[:, 3],
+            dry_ratio=series[:, 4],
+            stats=self.deposition.stats(),
+            deposition=self.deposition,
+        )
+        return result
@@ -0,0 +1,310 @@
+"""
+Created on 2024-09-10
+
+@author: wf
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, List, Optional
+
+from nicegui import app
+
+from sprinkler.impact_table import ImpactTable
+from sprinkler.simulation_engine import SimulationEngine
+from sprinkler.sprinkler_config import SprinklerConfig
+from sprinkler.sprinkler_core import SprinklerSystem
+from sprinkler.waterjet import Point3D, WaterJet, trajectory_cache
+
+
+@dataclass
+class SimulationUpdate:
+    """
+    Compact state of the simulation after a tick - the same instance
+    is sent to all subscribed clients
+    """
+
+    tick: int
+    running: bool
+    time: float  # simulated seconds
+    total_liters: float  # liters sprinkled so far
+    coverage: float  # fraction of the rainfall target reached (0..1)
+    uniformity: float  # Christiansen uniformity coefficient (1 = uniform)
+    dry_ratio: float  # fraction of dry cells
+    h_angle: Optional[float] = None  # angles of the jet of this tick in degrees
+    v_angle: Optional[float] = None
+    reset: bool = False  # the simulation has been reset - clear all jets
+    # the nozzle position and initial velocity of the jets - only set when
+    # the simulation is started since the configuration might have changed
+    start_position: Optional[Point3D] = None
+    velocity: Optional[float] = None
+    # trajectory points by sampling - computed once on demand
+    points: Dict[Hashable, List[List[float]]] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+
+
+class SimulationService:
+    """
+    Server-wide sprinkler simulation shared by all browser sessions.
+
+    A single timer advances a single SimulationEngine and each tick is computed
+    once - the resulting SimulationUpdate is fanned out to all subscribers which
+    only have to render it. The control values are shared as well so that all
+    sessions see and steer the same sprinkler.
+    """
+
+    def __init__(
+        self,
+        sprinkler_system: SprinklerSystem,
+        cell_size: float = 0.1,
+        model: str = "parabolic",
+    ):
+        """
+        Initialize the service.
+
+        Args:
+            sprinkler_system (SprinklerSystem): the sprinkler system to simulate
+            cell_size (float): cell size of the deposition grid in m
+            model (str): the trajectory model of the jets - see WaterJet.MODELS
+        """
+        self.sprinkler_system = sprinkler_system
+        self.timer = None
+        self.init_control_values()
+        head = sprinkler_system.config.sprinkler_head
+        self.water_jet = WaterJet(
+            start_position=Point3D(head.x, head.y, head.z),
+            hose=sprinkler_system.config.hose,
+            cache=trajectory_cache,
+            model=model,
+        )
+        self.engine = SimulationEngine(
+            sprinkler_system.config,
+            speed=self.simulation_speed,
+            flow_rate=self.flow_rate,
+            cell_size=cell_size,
+            impact_table=self.impact_table,
+            model=model,
+        )
+        self.subscribers: List[Callable[[SimulationUpdate], None]] = []
+        self.tick_count = 0
+        self.last_update = self.create_update()
+
+    def init_control_values(self):
+        """
+        initialize the control values
+        """
+        angles = self.sprinkler_system.config.angles
+        self.h_angle_min = angles.horizontal.min
+        self.h_angle_max = angles.horizontal.max
+        self.v_angle_min = angles.vertical.min
+        self.v_angle_max = angles.vertical.max
+        self.h_angle = angles.horizontal.initial
+        self.v_angle = angles.vertical.initial
+        self.water_pressure = self.sprinkler_system.config.hose.pressure
+        self.simulation_speed = 1
+        self.is_dynamic = False
+        self.flow_rate = self.sprinkler_system.config.hose.flow_rate
+
+    @property
+    def impact_table(self) -> Optional[ImpactTable]:
+        """
+        the precomputed impact points of the current configuration - those
+        are parabolic impacts so there is none for the other models
+        """
+        if self.water_jet.model != "parabolic":
+            return None
+        return self.sprinkler_system.impact_table
+
+    @property
+    def is_running(self) -> bool:
+        return self.timer is not None
+
+    @property
+    def is_dynamic(self) -> bool:
+        return self._is_dynamic
+
+    @is_dynamic.setter
+    def is_dynamic(self, is_dynamic: bool):
+        # switching the mode of a running simulation changes its pace right away
+        self._is_dynamic = is_dynamic
+        if self.timer is not None:
+            self.timer.interval = self.tick_interval
+
+    @property
+    def tick_interval(self) -> float:
+        """
+        the time between two ticks in seconds - the dynamic simulation
+        runs in real time steps of the engine
+        """
+        return self.engine.time_step if self.is_dynamic else 0.5
+
+    def subscribe(self, callback: Callable[[SimulationUpdate], None]):
+        """
+        Subscribe to the updates - the callback immediately gets the latest state.
+
+        Args:
+            callback (Callable[[SimulationUpdate], None]): the callback to call on each update
+        """
+        if callback not in self.subscribers:
+            self.subscribers.append(callback)
+        callback(self.last_update)
+
+    def unsubscribe(self, callback: Callable[[SimulationUpdate], None]):
+        """
+        Unsubscribe the given callback.
+        """
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def publish(self, update: SimulationUpdate):
+        """
+        Send the given update to all subscribers.
+        """
+        self.last_update = update
+        for callback in list(self.subscribers):
+            callback(update)
+
+    def create_update(
+        self, h_angle: float = None, v_angle: float = None, reset: bool = False
+    ) -> SimulationUpdate:
+        """
+        Create an update from the current state of the engine.
+        """
+        stats = self.engine.deposition.stats()
+        update = SimulationUpdate(
+            tick=self.tick_count,
+            running=self.is_running,
+            time=self.engine.time,
+            total_liters=self.engine.total_liters,
+            coverage=stats.coverage,
+            uniformity=stats.uniformity,
+            dry_ratio=stats.dry_ratio,
+            h_angle=h_angle,
+            v_angle=v_angle,
+            reset=reset,
+        )
+        return update
+
+    def update_source(self):
+        """
+        take the nozzle position and the hose from the current configuration
+        for the drawn and the simulated jets
+        """
+        config = self.sprinkler_system.config
+        head = config.sprinkler_head
+        self.water_jet.start_position = Point3D(head.x, head.y, head.z)
+        self.water_jet.hose = config.hose
+        self.engine.set_source(config, impact_table=self.impact_table)
+
+    def set_config(self, config: SprinklerConfig):
+        """
+        Switch the simulation to the given configuration - the control values
+        and the engine are reinitialized and all subscribers are reset.
+
+        Args:
+            config (SprinklerConfig): the new sprinkler configuration
+        """
+        self.sprinkler_system.config = config
+        self.init_control_values()
+        self.update_source()
+        self.engine.set_config(config, impact_table=self.impact_table)
+        self.tick_count = 0
+        update = self.create_update(reset=True)
+        # a running simulation continues with the new jet source
+        update.start_position = self.water_jet.start_position
+        update.velocity = self.water_jet.hose.velocity
+        self.publish(update)
+
+    def update_engine(self):
+        """
+        pass the current control values to the simulation engine
+        """
+        self.engine.speed = self.simulation_speed
+        self.engine.flow_rate = self.flow_rate
+        self.engine.h_min, self.engine.h_max = self.h_angle_min, self.h_angle_max
+        self.engine.v_min, self.engine.v_max = self.v_angle_min, self.v_angle_max
+
+    def tick(self):
+        """
+        Advance the simulation by one tick and publish the result.
+
+        In dynamic mode the sprinkler head sweeps, otherwise
+        it keeps sprinkling at the current angles.
+        """
+        self.update_engine()
+        if self.is_dynamic:
+            h_angles, v_angles = self.engine.step()
+            h_angle, v_angle = float(h_angles[0]), float(v_angles[0])
+        else:
+            h_angle, v_angle = self.h_angle, self.v_angle
+            self.engine.emit([h_angle], [v_angle])
+        self.tick_count += 1
+        self.publish(self.create_update(h_angle, v_angle))
+
+    def start(self):
+        """
+        Start the simulation timer unless it is already running and
+        send the jet source to all subscribers.
+        """
+        if self.is_running:
+            return
+        self.update_source()
+        self.timer = app.timer(self.tick_interval, self.tick)
+        update = self.create_update()
+        update.start_position = self.water_jet.start_position
+        update.velocity = self.water_jet.hose.velocity
+        self.publish(update)
+
+    def stop(self):
+        """
+        Stop the simulation timer.
+        """
+        if not self.is_running:
+            return
+        self.timer.cancel()
+        self.timer = None
+        self.publish(self.create_update())
+
+    def reset(self):
+        """
+        Stop the simulation and reset time, water and the sweep position.
+        """
+        if self.is_running:
+            self.timer.cancel()
+            self.timer = None
+        self.engine.reset()
+        self.tick_count = 0
+        self.publish(self.create_update(reset=True))
+
+    def trajectory_points(
+        self, update: SimulationUpdate, num_segments: int = 20, tolerance: float = None
+    ) -> List[List[float]]:
+        """
+        Get the trajectory of the jet of the given update - computed once
+        per tick and sampling for all subscribers.
+
+        Args:
+            update (SimulationUpdate): an update with jet angles
+            num_segments (int): the number of equal time segments
+            tolerance (float): if given sample adaptively with this chord error in m instead -
+                only available for the parabolic model
+
+        Returns:
+            List[List[float]]: the trajectory points in m with mm precision
+        """
+        if self.water_jet.model != "parabolic":
+            tolerance = None
+        key = num_segments if tolerance is None else ("adaptive", tolerance)
+        points = update.points.get(key)
+        if points is None:
+            self.water_jet.set_angles(update.h_angle, update.v_angle)
+            if tolerance is None:
+                trajectory = self.water_jet.calculate_trajectory(num_segments)
+            else:
+                trajectory = self.water_jet.calculate_adaptive_trajectory(
+                    tolerance=tolerance
+                )
+            # mm precision keeps the messages small
+            points = [[round(value, 3) for value in p.to_tuple()] for p in trajectory]
+            update.points[key] = points
+        return points
@@ -9,6 +9,9 @@ from argparse import ArgumentParser
 
 from ngwidgets.cmd import WebserverCmd
 
+from sprinkler.mesh_lod import MeshLOD
+from sprinkler.sprinkler_sim import SprinklerSimulation
+from sprinkler.waterjet import WaterJet
 from sprinkler.webserver import NiceSprinklerWebServer
 
 
@@ -45,6 +48,30 @@ class NiceSprinklerCmd(WebserverCmd):
             default="example_garden.stl",
             help="path to sprinkler configuration file [default: %(default)s]",
         )
+        parser.add_argument(
+            "--web-lod",
+            default="full",
+            choices=list(MeshLOD.LEVELS),
+            help="level of detail of the garden model shown in the browser [default: %(default)s]",
+        )
+        parser.add_argument(
+            "--collision-lod",
+            default="full",
+            choices=list(MeshLOD.LEVELS),
+            help="level of detail of the garden model for collision checks [default: %(default)s]",
+        )
+        parser.add_argument(
+            "--jet-mode",
+            default="client",
+            choices=SprinklerSimulation.JET_MODES,
+            help="how the water jets are drawn in the browser [default: %(default)s]",
+        )
+        parser.add_argument(
+            "--model",
+            default="parabolic",
+            choices=WaterJet.MODELS,
+            help="trajectory model of the simulated jets - drag needs --jet-mode compact or lines [default: %(default)s]",
+        )
         return parser
 
 
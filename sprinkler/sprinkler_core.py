@@ -4,6 +4,9 @@ Created on 2024-08-13
 @author: wf
 """
 
+import os
+
+from sprinkler.impact_table import ImpactTable
 from sprinkler.sprinkler_config import SprinklerConfig
 from sprinkler.stl3d import STL3D
 
@@ -12,9 +15,59 @@ class SprinklerSystem:
     Main sprinkler system class
     """
 
-    def __init__(self, config_path: str, stl_file_path: str):
+    def __init__(
+        self,
+        config_path: str,
+        stl_file_path: str,
+        cache_dir: str = None,
+        web_lod: str = "full",
+        collision_lod: str = "full",
+    ):
         self.stl_file_path = stl_file_path
+        if cache_dir is None:
+            cache_dir = SprinklerSystem.default_cache_dir()
+        self.cache_dir = cache_dir
         self.config = SprinklerConfig.load_from_yaml_file(config_path)
-        self.stl=STL3D(stl_file_path)
+        self.stl=STL3D(stl_file_path, cache_dir=self.cache_dir)
+        # level of detail of the garden model for the browser and for collision checks
+        self.web_lod = web_lod
+        self.collision_lod = collision_lod
+        # precomputed angle to impact point mapping - loaded lazily on first use
+        self._impact_table = None
+
+    @property
+    def impact_table(self) -> ImpactTable:
+        """
+        the angle to impact point table of the current configuration -
+        loaded from the cache if available, otherwise computed and cached
+
+        the table is replaced when the configuration values it depends on change
+        e.g. when the hose is calibrated in place
+        """
+        signature = ImpactTable.get_signature(self.config)
+        if self._impact_table is None or self._impact_table.signature != signature:
+            self._impact_table = ImpactTable.load_or_create(self.config, self.cache_dir)
+        return self._impact_table
+
+    @property
+    def web_stl_path(self) -> str:
+        """
+        the path of the garden model file to be rendered in the browser
+        """
+        return self.stl.get_lod_path(self.web_lod)
+
+    @property
+    def collision_stl(self) -> STL3D:
+        """
+        the garden model to be used for collision checks
+        """
+        return self.stl.get_lod(self.collision_lod)
 
+    @classmethod
+    def default_cache_dir(cls) -> str:
+        """
+        get the default directory for precomputed data
+        """
+        cache_dir = os.path.join(os.path.expanduser("~"), ".nicesprinkler", "cache")
+        return cache_dir
 
@@ -10,9 +10,13 @@ from typing import List
 from ngwidgets.scene_frame import SceneFrame
 from nicegui import ui
 
+from sprinkler.jet_pool import JetPool, LinePool
+from sprinkler.simulation_engine import SimulationEngine
+from sprinkler.simulation_service import SimulationService, SimulationUpdate
 from sprinkler.slider import SimpleSlider
 from sprinkler.sprinkler_core import SprinklerSystem
-from sprinkler.waterjet import Point3D, WaterJet  # Import the existing WaterJet module
+from sprinkler.update_coalescer import UpdateCoalescer
+from sprinkler.water_jets import WaterJets
 
 
 class SprinklerSimulation:
@@ -20,9 +24,57 @@ class SprinklerSimulation:
     Simulate lawn sprinkling
     """
 
-    def __init__(self, solution, sprinkler_system: SprinklerSystem):
+    # "lines": one pooled scene line per trajectory segment
+    # "compact": one pooled point cloud per jet
+    # "client": only the angles of each jet are sent - the browser computes the arc
+    JET_MODES = ["lines", "compact", "client"]
+
+    def __init__(
+        self,
+        solution,
+        sprinkler_system: SprinklerSystem,
+        service: SimulationService = None,
+        cell_size: float = 0.1,
+        jet_mode: str = "compact",
+        jet_pool_size: int = 50,
+        line_pool_size: int = 1000,
+        jet_segments: int = 60,
+        jet_tolerance: float = 0.02,
+        max_fps: float = 10.0,
+    ):
+        """
+        Initialize the simulation view.
+
+        Args:
+            solution: the web solution of the client
+            sprinkler_system (SprinklerSystem): the sprinkler system to show
+            service (SimulationService): the shared simulation - default: a private one
+            cell_size (float): cell size of the deposition grid of a private simulation in m
+            jet_mode (str): how the jets are drawn - see JET_MODES
+            jet_pool_size (int): the number of jets visible at the same time
+            line_pool_size (int): the number of line segments in "lines" mode
+            jet_segments (int): the number of segments per jet
+            jet_tolerance (float): the chord error of the adaptively sampled jets in "lines" mode in m
+            max_fps (float): the maximum number of updates per second sent to the client
+        """
+        if jet_mode not in SprinklerSimulation.JET_MODES:
+            raise ValueError(
+                f"unknown jet mode {jet_mode} - use one of {SprinklerSimulation.JET_MODES}"
+            )
         self.solution = solution
         self.sprinkler_system = sprinkler_system
+        # a private simulation lives and dies with this view
+        self.owns_service = service is None
+        if service is None:
+            service = SimulationService(sprinkler_system, cell_size=cell_size)
+        model = service.water_jet.model
+        if jet_mode == "client" and model != "parabolic":
+            # the browser evaluates parabolas only
+            raise ValueError(
+                f"the client jet mode can not show the {model} model - use compact or lines"
+            )
+        # the simulation is computed by the service - this view only renders its updates
+        self.service = service
 
         self.lawn_width = self.sprinkler_system.config.lawn.width
         self.lawn_length = self.sprinkler_system.config.lawn.length
@@ -34,30 +86,43 @@ class SprinklerSimulation:
         self.scene = None
         self.sprinkler_head = None
         self.sprinkler_model = None
-        self.init_control_values()
 
-        self.water_lines = []
-        self.total_water_sprinkled = 0  # in liters
-        self.sprinkling_time = 0  # in seconds
+        # preallocated jet objects reused round-robin - created with the scene
+        self.jet_mode = jet_mode
+        self.jet_pool_size = jet_pool_size
+        self.line_pool_size = line_pool_size
+        self.jet_segments = jet_segments
+        self.jet_tolerance = jet_tolerance
+        self.jet_pool = None
+        self.jet_count = 0
+        # scene and label changes of all ticks within a client frame are sent at once
+        self.updates = UpdateCoalescer(max_fps=max_fps)
 
         self.time_label = None
         self.flow_label = None
         self.coverage_label = None
+        self.uniformity_label = None
+
+    @property
+    def engine(self) -> SimulationEngine:
+        """
+        the engine of the shared simulation
+        """
+        return self.service.engine
+
+    @property
+    def total_water_sprinkled(self) -> float:
+        """
+        liters sprinkled so far
+        """
+        return self.engine.total_liters
 
-    def init_control_values(self):
+    @property
+    def sprinkling_time(self) -> float:
         """
-        initialize the control values
+        simulated seconds so far
         """
-        self.h_angle_min = self.sprinkler_system.config.angles.horizontal.min
-        self.h_angle_max = self.sprinkler_system.config.angles.horizontal.max
-        self.v_angle_min = self.sprinkler_system.config.angles.vertical.min
-        self.v_angle_max = self.sprinkler_system.config.angles.vertical.max
-        self.h_angle = self.sprinkler_system.config.angles.horizontal.initial
-        self.v_angle = self.sprinkler_system.config.angles.vertical.initial
-        self.water_pressure = self.sprinkler_system.config.hose.pressure
-        self.simulation_speed = 1
-        self.is_dynamic = False
-        self.flow_rate = self.sprinkler_system.config.hose.flow_rate
+        return self.engine.time
 
     def setup_scene_frame(self):
         with ui.column():
@@ -69,6 +134,23 @@ class SprinklerSimulation:
                         self.setup_controls()
                 with self.splitter.before as self.scene_parent:
                     self.setup_scene()
+        self.subscribe()
+
+    def subscribe(self):
+        """
+        subscribe to the shared simulation until the client is gone
+        """
+        self.service.subscribe(self.on_update)
+        self.solution.client.on_delete(self.on_delete)
+
+    def on_delete(self):
+        """
+        stop listening when the client is gone - a private
+        simulation is stopped so that its timer does not keep running
+        """
+        self.service.unsubscribe(self.on_update)
+        if self.owns_service:
+            self.service.stop()
 
     def setup_scene(self):
         scene = ui.scene(
@@ -80,40 +162,43 @@ class SprinklerSimulation:
         self.add_garden3d()
         self.add_lawn()
         self.add_sprinkler()
+        self.add_jet_pool()
         self.move_camera()
 
     def setup_controls(self):
+        # the controls steer the shared simulation
+        service = self.service
         with self.scene_frame.button_row:
             with ui.expansion("Controls", icon="work").classes("w-full"):
                 with ui.card() as self.controls_card:
                     SimpleSlider.add_slider(
-                        min=self.h_angle_min,
-                        max=self.h_angle_max,
-                        value=(self.h_angle_min, self.h_angle_max),
+                        min=service.h_angle_min,
+                        max=service.h_angle_max,
+                        value=(service.h_angle_min, service.h_angle_max),
                         label="Horizontal Angle °",
-                        target=self,
+                        target=service,
                         bind_prop="h_angle",
                         minmax=True,
                     )
                     SimpleSlider.add_slider(
-                        min=self.v_angle_min,
-                        max=self.v_angle_max,
-                        value=(self.v_angle_min, self.v_angle_max),
+                        min=service.v_angle_min,
+                        max=service.v_angle_max,
+                        value=(service.v_angle_min, service.v_angle_max),
                         label="Vertical Angle °",
-                        target=self,
+                        target=service,
                         bind_prop="v_angle",
                         minmax=True,
                     )
                     SimpleSlider.add_slider(
                         min=0.1,
                         max=10,
-                        value=self.simulation_speed,
+                        value=service.simulation_speed,
                         label="Simulation Speed (x)",
-                        target=self,
+                        target=service,
                         bind_prop="simulation_speed",
                     )
-                    ui.switch("Dynamic Simulation").bind_value(self, "is_dynamic")
-                    self.flow_number = ui.number().bind_value(self, "flow_rate")
+                    ui.switch("Dynamic Simulation").bind_value(service, "is_dynamic")
+                    self.flow_number = ui.number().bind_value(service, "flow_rate")
 
     def setup_buttons(self):
         self.scene_frame.setup_button_row()
@@ -135,28 +220,36 @@ class SprinklerSimulation:
             self.time_label = ui.label("Time: 00:00")
             self.flow_label = ui.label("Total Flow: 0.00 L")
             self.coverage_label = ui.label("Coverage:  0.0%")
+            self.uniformity_label = ui.label("Uniformity:  0.0%")
 
     def toggle_simulation(self):
-        self.solution.toggle_icon(self.simulation_button)
-        if self.has_icon_name(self.simulation_button, "stop_circle"):
-            self.start_simulation()
-        else:
-            self.stop_simulation()
+        try:
+            if self.service.is_running:
+                self.stop_simulation()
+            else:
+                self.start_simulation()
+        except Exception as ex:
+            self.solution.handle_exception(ex)
 
     def start_simulation(self):
-        if self.is_dynamic:
-            self.simulate_dynamic()
-        else:
-            self.simulate_static()
+        # the service sends the jet source of the current configuration to all clients
+        self.service.start()
 
     def stop_simulation(self):
-        if hasattr(self, "update_timer"):
-            self.update_timer.cancel()
+        self.service.stop()
 
     def has_icon_name(self, button, icon_name):
         result = button._props["icon"] == icon_name
         return result
 
+    def sync_simulation_button(self, running: bool):
+        """
+        show whether the shared simulation is running - it might
+        have been started or stopped by another client
+        """
+        if running != self.has_icon_name(self.simulation_button, "stop_circle"):
+            self.solution.toggle_icon(self.simulation_button)
+
     def toggle_flow_measurement(self):
         """
         toggle the flow measurement
@@ -172,120 +265,125 @@ class SprinklerSimulation:
             ) * 60  # Convert to l/min
             ui.notify(f"Flow rate: {flow_rate:.2f} l/min")
 
-    def update_water_info(self):
+    def update_water_info(self, update: SimulationUpdate):
         """
         update time an flow labels
         """
-        lawn = self.sprinkler_system.config.lawn
-        total_water_needed = (
-            lawn.rain_mm_to_l()
-        )  # Uses the default rainfall_mm if not specified
-
-        coverage = min(100, (self.total_water_sprinkled / total_water_needed) * 100)
-        minutes, seconds = divmod(int(self.sprinkling_time), 60)
+        # the share of the lawn's rainfall target reached per cell
+        coverage = update.coverage * 100
+        minutes, seconds = divmod(int(update.time), 60)
         self.time_label.set_text(f"Time: {minutes:02d}:{seconds:02d}")
-        self.flow_label.set_text(f"Total Flow: {self.total_water_sprinkled:.2f} L")
+        self.flow_label.set_text(f"Total Flow: {update.total_liters:.2f} L")
         self.coverage_label.set_text(f"Coverage: {coverage:.2f}%")
+        self.uniformity_label.set_text(
+            f"Uniformity: {update.uniformity * 100:.1f}% dry: {update.dry_ratio * 100:.1f}%"
+        )
 
     def reset_simulation(self):
         try:
-            self.stop_simulation()
-            self.solution.toggle_icon(self.simulation_button)
-            self.solution.toggle_icon(self.flow_measurement_button)
-            self.total_water_sprinkled = 0
-            self.sprinkling_time = 0
-            self.update_water_info()
-
-            # Remove all water lines
-            for line in self.water_lines:
-                line.delete()
-            self.water_lines.clear()
+            if self.has_icon_name(self.flow_measurement_button, "clock_stop"):
+                self.solution.toggle_icon(self.flow_measurement_button)
+            self.service.reset()
         except Exception as ex:
             self.solution.handle_exception(ex)
 
-    def simulate_static(self):
-        def update_static():
-            try:
-                sprinkler_pos = self.sprinkler_system.config.sprinkler_head
-                jet = WaterJet(
-                    start_position=Point3D(
-                        sprinkler_pos.x, sprinkler_pos.y, sprinkler_pos.z
-                    ),
-                    hose=self.sprinkler_system.config.hose,
-                )
-                jet.set_angles(self.h_angle, self.v_angle)
-                trajectory = jet.calculate_trajectory()
-                self.draw_water_line(trajectory)
-                self.update_water_info()
-
-                if self.has_icon_name(self.simulation_button, "play_circle"):
-                    self.update_timer.cancel()
-            except Exception as ex:
-                self.solution.handle_exception(ex)
-
-        self.update_timer = ui.timer(0.5, update_static)
-
-    def simulate_dynamic(self):
-        self.current_h_angle = self.h_angle_min
-        self.current_v_angle = self.v_angle_min
-        self.h_direction = 1
-        self.v_direction = 1
-
-        def update_dynamic():
-            try:
-                sprinkler_pos = self.sprinkler_system.config.sprinkler_head
-                jet = WaterJet(
-                    start_position=Point3D(
-                        sprinkler_pos.x, sprinkler_pos.y, sprinkler_pos.z
-                    ),
-                    hose=self.sprinkler_system.config.hose,
-                )
-                jet.set_angles(self.current_h_angle, self.current_v_angle)
-                trajectory = jet.calculate_trajectory()
-                self.draw_water_line(trajectory)
-                self.update_water_info()
-
-                # Update angles
-                self.current_h_angle += self.h_direction * self.simulation_speed
-                if (
-                    self.current_h_angle >= self.h_angle_max
-                    or self.current_h_angle <= self.h_angle_min
-                ):
-                    self.h_direction *= -1
-
-                self.current_v_angle += self.v_direction * (self.simulation_speed / 2)
-                if (
-                    self.current_v_angle >= self.v_angle_max
-                    or self.current_v_angle <= self.v_angle_min
-                ):
-                    self.v_direction *= -1
-
-                if self.has_icon_name(self.simulation_button, "play_circle"):
-                    self.update_timer.cancel()
-            except Exception as ex:
-                self.solution.handle_exception(ex)
-
-        self.update_timer = ui.timer(0.05, update_dynamic)
-
-    def draw_water_line(self, trajectory: List[Point3D]):
-        for i in range(len(trajectory) - 1):
-            start = trajectory[i].to_tuple()
-            end = trajectory[i + 1].to_tuple()
-            line = self.scene.line(start, end)
-            line.material("#1E90FF", opacity=0.7)
-            self.water_lines.append(line)
-
-        # Calculate water sprinkled
-        time_step = 0.05  # seconds
-        self.total_water_sprinkled += (
-            self.flow_rate / 60
-        ) * time_step  # Convert l/min to l/s
-        self.sprinkling_time += time_step
-
-        # Remove old lines if there are too many
-        while len(self.water_lines) > 1000:
-            old_line = self.water_lines.pop(0)
-            old_line.delete()
+    def on_update(self, update: SimulationUpdate):
+        """
+        render an update of the shared simulation - the jets and labels
+        of all updates within a client frame are sent at once
+        """
+        try:
+            if update.reset:
+                self.updates.clear()
+                if self.jet_pool:
+                    self.jet_pool.clear()
+            self.sync_simulation_button(update.running)
+            if update.velocity is not None:
+                self.submit_source(update)
+            if update.h_angle is not None:
+                self.submit_jet(update)
+            self.submit_water_info(update)
+            self.updates.flush(force=not update.running)
+        except Exception as ex:
+            self.solution.handle_exception(ex)
+
+    def submit_jet(self, update: SimulationUpdate):
+        """
+        schedule drawing the jet of the given update with the next frame - a jet
+        that would reuse the pool slot of a still pending one replaces it
+        """
+        slots = self.jet_pool.jet_capacity if self.jet_pool else self.jet_pool_size
+        self.updates.submit(
+            ("jet", self.jet_count % slots),
+            lambda: self.draw_jet(update),
+        )
+        self.jet_count += 1
+
+    def submit_source(self, update: SimulationUpdate):
+        """
+        schedule changing the jet source of the browser computed jets
+        """
+        if self.jet_mode == "client":
+            self.updates.submit(
+                "source",
+                lambda: self.jet_pool.set_source(
+                    update.start_position, update.velocity
+                ),
+            )
+
+    def submit_water_info(self, update: SimulationUpdate):
+        """
+        schedule the label update with the next frame
+        """
+        self.updates.submit("water_info", lambda: self.update_water_info(update))
+
+    def add_jet_pool(self):
+        """
+        preallocate the jet objects of the selected jet mode
+        """
+        if self.jet_mode == "lines":
+            self.jet_pool = LinePool(self.scene, size=self.line_pool_size)
+        elif self.jet_mode == "client":
+            # the source the shared simulation currently sprinkles with
+            water_jet = self.service.water_jet
+            self.jet_pool = WaterJets(
+                self.scene,
+                start_position=water_jet.start_position,
+                velocity=water_jet.hose.velocity,
+                size=self.jet_pool_size,
+                segments=self.jet_segments,
+            )
+        else:
+            self.jet_pool = JetPool(self.scene, size=self.jet_pool_size)
+
+    def draw_jet(self, update: SimulationUpdate):
+        """
+        draw the jet of the given update in the selected jet mode - trajectories
+        are computed once by the service for all clients
+        """
+        if self.jet_mode == "lines":
+            points = self.service.trajectory_points(
+                update, tolerance=self.jet_tolerance
+            )
+            self.draw_water_line(points)
+        elif self.jet_mode == "client":
+            self.jet_pool.add_jet(update.h_angle, update.v_angle)
+        else:
+            self.draw_water_points(
+                self.service.trajectory_points(update, self.jet_segments)
+            )
+
+    def draw_water_points(self, points: List[List[float]]):
+        """
+        draw the trajectory as a single point cloud reusing the oldest pooled jet
+        """
+        self.jet_pool.show(points)
+
+    def draw_water_line(self, points: List[List[float]]):
+        """
+        draw the trajectory segments reusing the oldest pooled lines
+        """
+        self.jet_pool.show(points)
 
     def add_lawn(self):
         with self.scene.group().move(x=self.cx, y=self.cy):
@@ -294,8 +392,8 @@ class SprinklerSimulation:
             ).material("#7CFC00")
 
     def add_garden3d(self):
-        stl_filename = os.path.basename(self.sprinkler_system.stl_file_path)
-        stl_url = f"/examples/{stl_filename}"
+        stl_filename = os.path.basename(self.sprinkler_system.web_stl_path)
+        stl_url = f"/garden/{stl_filename}"
         self.garden_model = self.scene_frame.load_stl(
             stl_filename, stl_url, scale=0.001
         )
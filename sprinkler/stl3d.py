@@ -4,21 +4,279 @@ Created on 2024-09-04
 @author: wf
 """
 
+from dataclasses import dataclass
+import os
+import tempfile
 import numpy as np
 from stl import mesh
-from typing import List
+from typing import List, Optional, Tuple
 import matplotlib.pyplot as plt
 from mpl_toolkits import mplot3d
 from mpl_toolkits.mplot3d import Axes3D
+from sprinkler.broad_phase import BroadPhaseStats, trajectory_bounds
+from sprinkler.bvh import MeshBVH
+from sprinkler.height_field import HeightField
+from sprinkler.mesh_cache import MeshCache
+from sprinkler.mesh_lod import MeshLOD
 from sprinkler.sprinkler_config import Point3D
+from sprinkler.waterjet import WaterJet
+
+@dataclass
+class MeshHit:
+    """
+    first intersection of a polyline with the mesh
+    """
+
+    point: Point3D  # intersection point in m
+    triangle_index: int  # index of the triangle in stl_mesh.vectors
+    segment_index: int  # index of the polyline segment
+    t: float  # fraction of the segment before the intersection
+
 
 class STL3D:
     """
     Standard Tessellation Language (STL) 3D model file support with visualization.
     """
 
-    def __init__(self, stl_file_path: str):
-        self.stl_mesh = mesh.Mesh.from_file(stl_file_path)
+    def __init__(self, stl_file_path: str, cache_dir: str = None):
+        """
+        Load the STL file.
+
+        Args:
+            stl_file_path (str): the path of the STL file
+            cache_dir (str): optional directory to cache the parsed mesh and its
+                derived indexes in - cached arrays are memory mapped on the next load
+        """
+        self.stl_file_path = stl_file_path
+        self.mesh_cache = MeshCache(cache_dir, stl_file_path) if cache_dir else None
+        data = STL3D.read_binary_stl(stl_file_path)
+        if data is not None:
+            self.stl_mesh = mesh.Mesh(data, calculate_normals=False)
+        elif self.mesh_cache:
+            # ASCII STL - parse once and memory map the binary records afterwards
+            data = self.mesh_cache.get_or_create(
+                "mesh_data", lambda: mesh.Mesh.from_file(stl_file_path).data
+            )
+            self.stl_mesh = mesh.Mesh(data, calculate_normals=False)
+        else:
+            self.stl_mesh = mesh.Mesh.from_file(stl_file_path)
+        self.init_indexes()
+
+    def init_indexes(self, bvh: MeshBVH = None):
+        """
+        Initialize the collision query state for the loaded mesh - the derived
+        arrays are built or loaded on first use so that opening a mesh
+        does not touch its triangles.
+
+        Args:
+            bvh (MeshBVH): the bounding volume hierarchy of the mesh if already available
+        """
+        # bounding volume hierarchy for collision queries - coordinates in mm
+        self._bvh = bvh
+        # counters of the exact segment/triangle tests avoided by the broad phase
+        self.collision_stats = BroadPhaseStats()
+        self.ray_jitter = np.array([1.2345e-4, 2.3456e-4])  # mm
+        # unit normals and plane offsets of the triangles
+        self._unit_normals = None
+        self._plane_offsets = None
+        # height fields by resolution - rasterized on first use
+        self.height_fields = {}
+        # simplified variants by level of detail name - created on first use
+        self.lods = {}
+
+    @classmethod
+    def from_arrays(
+        cls, mesh_data: np.ndarray, bvh: MeshBVH, stl_file_path: str = None
+    ) -> "STL3D":
+        """
+        Create a mesh from triangle records that are already in memory
+        e.g. in shared memory of a worker process - nothing is read or copied.
+
+        Args:
+            mesh_data (np.ndarray): structured triangle records with the numpy-stl dtype
+            bvh (MeshBVH): the bounding volume hierarchy of the triangles
+            stl_file_path (str): the path of the file the records stem from if any
+
+        Returns:
+            STL3D: the mesh
+        """
+        stl = cls.__new__(cls)
+        stl.stl_file_path = stl_file_path
+        stl.mesh_cache = None
+        stl.stl_mesh = mesh.Mesh(mesh_data, calculate_normals=False)
+        stl.init_indexes(bvh)
+        return stl
+
+    @staticmethod
+    def read_binary_stl(stl_file_path: str) -> Optional[np.ndarray]:
+        """
+        Memory map the triangle records of a binary STL file without copying.
+
+        A binary STL file has an 80 byte header, the number of triangles as uint32
+        and 50 byte records of normal, three vertices and attribute - which is
+        exactly the structured dtype of numpy-stl.
+
+        Args:
+            stl_file_path (str): the path of the STL file
+
+        Returns:
+            Optional[np.ndarray]: read only structured array of the triangle records
+            or None if the file is not a binary STL file
+        """
+        header_size = 84
+        dtype = np.dtype(mesh.Mesh.dtype)
+        file_size = os.path.getsize(stl_file_path)
+        if file_size < header_size:
+            return None
+        with open(stl_file_path, "rb") as stl_file:
+            stl_file.seek(80)
+            count = int(np.frombuffer(stl_file.read(4), dtype="<u4")[0])
+        # ASCII files start with "solid" - but so do some binary files,
+        # so the size is the reliable criterion
+        if file_size != header_size + count * dtype.itemsize:
+            return None
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        data = np.memmap(
+            stl_file_path,
+            dtype=dtype,
+            mode="r",
+            offset=header_size,
+            shape=(count,),
+        )
+        return data
+
+    def get_lod_path(self, level: str) -> str:
+        """
+        Get the path of the binary STL file for the given level of detail,
+        simplifying the mesh on first use.
+
+        Args:
+            level (str): one of the MeshLOD.LEVELS names
+
+        Returns:
+            str: the path of the original file for "full" or of the cached simplified file
+        """
+        cell_size = MeshLOD.cell_size(level)
+        if cell_size <= 0:
+            return self.stl_file_path
+        lod_cache = self.mesh_cache or MeshCache(
+            os.path.join(tempfile.gettempdir(), "nicesprinkler"), self.stl_file_path
+        )
+        basename = os.path.splitext(os.path.basename(self.stl_file_path))[0]
+        path = lod_cache.get_or_create_file(
+            f"{basename}_{level}.stl",
+            lambda lod_path: MeshLOD.write_binary_stl(
+                lod_path,
+                MeshLOD.cluster_vertices(self.stl_mesh.vectors, cell_size),
+                name=f"{basename} {level}",
+            ),
+        )
+        return path
+
+    def get_lod(self, level: str) -> "STL3D":
+        """
+        Get the mesh for the given level of detail - coarse levels trade
+        precision for speed e.g. for broad phase checks.
+
+        Args:
+            level (str): one of the MeshLOD.LEVELS names
+
+        Returns:
+            STL3D: this mesh for "full" or the simplified mesh
+        """
+        if MeshLOD.cell_size(level) <= 0:
+            return self
+        lod = self.lods.get(level)
+        if lod is None:
+            cache_dir = self.mesh_cache.cache_dir if self.mesh_cache else None
+            lod = STL3D(self.get_lod_path(level), cache_dir=cache_dir)
+            self.lods[level] = lod
+        return lod
+
+    @property
+    def bvh(self) -> MeshBVH:
+        """
+        the bounding volume hierarchy - built or loaded from the mesh cache on first use
+        """
+        if self._bvh is None:
+            self._bvh = self.init_bvh()
+        return self._bvh
+
+    @property
+    def unit_normals(self) -> np.ndarray:
+        """
+        the unit normals of the triangles - computed or loaded on first use
+        """
+        if self._unit_normals is None:
+            self.init_planes()
+        return self._unit_normals
+
+    @property
+    def plane_offsets(self) -> np.ndarray:
+        """
+        the plane offsets of the triangles in mm - computed or loaded on first use
+        """
+        if self._plane_offsets is None:
+            self.init_planes()
+        return self._plane_offsets
+
+    def init_bvh(self) -> MeshBVH:
+        """
+        Build the bounding volume hierarchy or load it from the mesh cache.
+        """
+        if self.mesh_cache is None:
+            return MeshBVH.build(self.stl_mesh.vectors)
+        arrays = self.mesh_cache.get_or_create_arrays(
+            "bvh",
+            MeshBVH.ARRAY_NAMES,
+            lambda: MeshBVH.build(self.stl_mesh.vectors).to_arrays(),
+        )
+        return MeshBVH.from_arrays(arrays)
+
+    def init_planes(self):
+        """
+        Precompute the unit normals and plane offsets of all triangles as
+        contiguous arrays - the normals stored in the STL file are not relied upon
+        since exporters often write zero or unnormalized normals.
+        """
+        names = ["unit_normals", "plane_offsets"]
+        if self.mesh_cache and all(self.mesh_cache.has(name) for name in names):
+            self._unit_normals = self.mesh_cache.load("unit_normals")
+            self._plane_offsets = self.mesh_cache.load("plane_offsets")
+            return
+        vectors = self.stl_mesh.vectors.astype(np.float64)
+        normals = np.cross(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # degenerate triangles get NaN normals and never count as "above"
+            normals /= np.linalg.norm(normals, axis=1)[:, np.newaxis]
+        self._unit_normals = np.ascontiguousarray(normals)
+        self._plane_offsets = np.einsum("ij,ij->i", normals, vectors[:, 0])
+        if self.mesh_cache:
+            self.mesh_cache.save("unit_normals", self._unit_normals)
+            self.mesh_cache.save("plane_offsets", self._plane_offsets)
+
+    def points_above_triangles(
+        self, points: np.ndarray, chunk_size: int = 1024
+    ) -> np.ndarray:
+        """
+        Check for a batch of points whether each is above any triangle plane.
+
+        Args:
+            points (np.ndarray): points in mm of shape (n, 3)
+            chunk_size (int): number of points per matrix product to limit memory use
+
+        Returns:
+            np.ndarray: boolean mask of shape (n,)
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        above = np.zeros(len(points), dtype=bool)
+        for start in range(0, len(points), chunk_size):
+            chunk = points[start : start + chunk_size]
+            with np.errstate(invalid="ignore"):
+                distances = chunk @ self.unit_normals.T - self.plane_offsets
+                above[start : start + chunk_size] = np.any(distances > 0, axis=1)
+        return above
 
     def point_above_triangle(self, point: np.ndarray, triangle: np.ndarray) -> bool:
         """Check if a point is above a triangle in 3D space"""
@@ -32,10 +290,321 @@ class STL3D:
     def is_point_colliding_with_mesh(self, point: Point3D) -> bool:
         """Check if the point collides with any STL mesh element"""
         point_3d = np.array([point.x * 1000, point.y * 1000, point.z * 1000])  # Convert m to mm
-        for triangle in self.stl_mesh.vectors:
-            if self.point_above_triangle(point_3d, triangle):
-                return True
-        return False
+        return bool(self.points_above_triangles(point_3d)[0])
+
+    def points_colliding_with_mesh(self, points: np.ndarray) -> np.ndarray:
+        """
+        Batch version of is_point_colliding_with_mesh
+
+        Args:
+            points (np.ndarray): points in m of shape (n, 3)
+
+        Returns:
+            np.ndarray: boolean mask of shape (n,)
+        """
+        return self.points_above_triangles(np.asarray(points, dtype=np.float64) * 1000)
+
+    def get_height_field(self, resolution: float = 0.02) -> HeightField:
+        """
+        Get the max height raster of the mesh for the given resolution,
+        rasterizing it on first use.
+
+        Args:
+            resolution (float): cell size in m
+
+        Returns:
+            HeightField: the height field in m
+        """
+        height_field = self.height_fields.get(resolution)
+        if height_field is None:
+            if self.mesh_cache:
+                arrays = self.mesh_cache.get_or_create_arrays(
+                    f"height_field_{resolution:g}",
+                    ["grid", "heights"],
+                    lambda: HeightField.from_triangles(
+                        self.stl_mesh.vectors, resolution=resolution, scale=0.001
+                    ).to_arrays(),
+                )
+                height_field = HeightField.from_arrays(arrays)
+            else:
+                height_field = HeightField.from_triangles(
+                    self.stl_mesh.vectors, resolution=resolution, scale=0.001
+                )
+            self.height_fields[resolution] = height_field
+        return height_field
+
+    def points_below_surface(
+        self, points: np.ndarray, resolution: float = 0.02
+    ) -> np.ndarray:
+        """
+        Check which points are below the top surface of the mesh by
+        looking up the height field.
+
+        Args:
+            points (np.ndarray): points in m of shape (n, 3)
+            resolution (float): cell size of the height field in m
+
+        Returns:
+            np.ndarray: boolean mask of shape (n,)
+        """
+        return self.get_height_field(resolution).points_below_surface(points)
+
+    def is_point_below_surface(self, point: Point3D, resolution: float = 0.02) -> bool:
+        """Check if the point (in m) is below the top surface of the mesh"""
+        return bool(self.points_below_surface([point.to_tuple()], resolution)[0])
+
+    def points_inside_mesh(self, points: np.ndarray) -> np.ndarray:
+        """
+        Check which points are inside the closed STL mesh by counting
+        the crossings of a vertical ray from each point upwards.
+
+        Args:
+            points (np.ndarray): points in m of shape (n, 3)
+
+        Returns:
+            np.ndarray: boolean mask of shape (n,)
+        """
+        points_mm = np.atleast_2d(np.asarray(points, dtype=float)) * 1000
+        # shift the rays by a tiny odd offset so that they do not pass exactly
+        # through vertices or edges of grid aligned models
+        points_mm[:, :2] += self.ray_jitter
+        ray_end = points_mm.copy()
+        ray_end[:, 2] = np.inf
+        queries, triangles = self.bvh.query_boxes(points_mm, ray_end)
+        vertices = self.stl_mesh.vectors[triangles].astype(float)
+        p = points_mm[queries]
+        a = vertices[:, 0]
+        e1 = vertices[:, 1] - a
+        e2 = vertices[:, 2] - a
+        d = p - a
+        # barycentric coordinates of the point in the xy projection of the triangle
+        det = e1[:, 0] * e2[:, 1] - e2[:, 0] * e1[:, 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            u = (d[:, 0] * e2[:, 1] - e2[:, 0] * d[:, 1]) / det
+            v = (e1[:, 0] * d[:, 1] - d[:, 0] * e1[:, 1]) / det
+            covered = (det != 0) & (u >= 0) & (v >= 0) & (u + v < 1)
+            z_plane = a[:, 2] + u * e1[:, 2] + v * e2[:, 2]
+            crossing = covered & (z_plane > p[:, 2])
+        counts = np.bincount(queries[crossing], minlength=len(points_mm))
+        return counts % 2 == 1
+
+    def is_point_inside_mesh(self, point: Point3D) -> bool:
+        """Check if the point (in m) is inside the closed STL mesh"""
+        return bool(self.points_inside_mesh([point.to_tuple()])[0])
+
+    def first_collision_indices(self, trajectories: np.ndarray) -> np.ndarray:
+        """
+        Find the first point of each trajectory that is inside the mesh.
+
+        Args:
+            trajectories (np.ndarray): trajectories in m of shape (n_jets, n_points, 3)
+
+        Returns:
+            np.ndarray: index of the first colliding point per jet or -1 if there is none
+        """
+        n_jets, n_points, _ = trajectories.shape
+        inside = self.points_inside_mesh(trajectories.reshape(-1, 3))
+        inside = inside.reshape(n_jets, n_points)
+        return np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+
+    @staticmethod
+    def moller_trumbore(
+        origins: np.ndarray, directions: np.ndarray, triangles: np.ndarray
+    ) -> np.ndarray:
+        """
+        Möller–Trumbore ray triangle intersection vectorized over pairs of rays
+        and triangles.
+
+        Args:
+            origins (np.ndarray): ray origins of shape (k, 3)
+            directions (np.ndarray): ray directions of shape (k, 3)
+            triangles (np.ndarray): triangle vertices of shape (k, 3, 3)
+
+        Returns:
+            np.ndarray: ray parameter t of the intersection (origin + t * direction)
+            or NaN where the ray misses the triangle
+        """
+        v0 = triangles[:, 0]
+        e1 = triangles[:, 1] - v0
+        e2 = triangles[:, 2] - v0
+        p = np.cross(directions, e2)
+        det = np.einsum("ij,ij->i", e1, p)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv_det = 1.0 / det
+            s = origins - v0
+            u = np.einsum("ij,ij->i", s, p) * inv_det
+            q = np.cross(s, e1)
+            v = np.einsum("ij,ij->i", directions, q) * inv_det
+            t = np.einsum("ij,ij->i", e2, q) * inv_det
+            hit = (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1)
+        return np.where(hit, t, np.nan)
+
+    def intersect_segments(
+        self, starts: np.ndarray, ends: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the first intersection of each line segment with the mesh.
+
+        Args:
+            starts (np.ndarray): segment start points in m of shape (n, 3)
+            ends (np.ndarray): segment end points in m of shape (n, 3)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: the fraction t of each segment before its first
+            intersection (NaN if there is none) and the index of the hit triangle (-1 if none)
+        """
+        starts_mm = np.atleast_2d(np.asarray(starts, dtype=float)) * 1000
+        ends_mm = np.atleast_2d(np.asarray(ends, dtype=float)) * 1000
+        n = len(starts_mm)
+        queries, triangles = self.bvh.query_segments(starts_mm, ends_mm)
+        self.collision_stats.pairs += n * len(self.stl_mesh.vectors)
+        self.collision_stats.exact_tests += len(queries)
+        directions = ends_mm - starts_mm
+        t = self.moller_trumbore(
+            starts_mm[queries],
+            directions[queries],
+            self.stl_mesh.vectors[triangles].astype(float),
+        )
+        valid = (t >= 0) & (t <= 1)
+        queries = queries[valid]
+        triangles = triangles[valid]
+        t = t[valid]
+        first_t = np.full(n, np.nan)
+        first_triangle = np.full(n, -1, dtype=np.int64)
+        if len(t) > 0:
+            # sort by segment and t - the first entry per segment is its first hit
+            order = np.lexsort((t, queries))
+            queries = queries[order]
+            first = np.ones(len(queries), dtype=bool)
+            first[1:] = queries[1:] != queries[:-1]
+            first_t[queries[first]] = t[order][first]
+            first_triangle[queries[first]] = triangles[order][first]
+        return first_t, first_triangle
+
+    def cull_trajectories(self, trajectories: np.ndarray) -> np.ndarray:
+        """
+        Broad phase: check which trajectories may hit the mesh at all by testing
+        their bounding boxes against the bounding volume hierarchy.
+
+        Args:
+            trajectories (np.ndarray): trajectories in m of shape (n_jets, n_points, 3)
+
+        Returns:
+            np.ndarray: boolean mask of shape (n_jets,) - False for jets whose
+            bounding box does not overlap any leaf box and which therefore cannot hit
+        """
+        low, high = trajectory_bounds(trajectories)
+        jets, _triangles = self.bvh.query_boxes(low * 1000, high * 1000)
+        candidates = np.zeros(len(trajectories), dtype=bool)
+        candidates[jets] = True
+        culled = int(np.count_nonzero(~candidates))
+        self.collision_stats.queries += len(trajectories)
+        self.collision_stats.culled_queries += culled
+        # the segments of culled jets would all have been tested against all triangles
+        segments = trajectories.shape[1] - 1
+        self.collision_stats.pairs += culled * segments * len(self.stl_mesh.vectors)
+        return candidates
+
+    def intersect_trajectories(
+        self, trajectories: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find the first intersection of each trajectory polyline with the mesh.
+
+        Args:
+            trajectories (np.ndarray): trajectories in m of shape (n_jets, n_points, 3)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: per jet the index of the first
+            hit segment (-1 if none), the hit point in m (NaN if none) and the hit
+            triangle index (-1 if none)
+        """
+        n_jets, n_points, _ = trajectories.shape
+        segment_index = np.full(n_jets, -1, dtype=np.int64)
+        points = np.full((n_jets, 3), np.nan)
+        triangle_index = np.full(n_jets, -1, dtype=np.int64)
+        candidates = np.nonzero(self.cull_trajectories(trajectories))[0]
+        if len(candidates) == 0:
+            return segment_index, points, triangle_index
+        starts = trajectories[candidates, :-1].reshape(-1, 3)
+        ends = trajectories[candidates, 1:].reshape(-1, 3)
+        t, triangles = self.intersect_segments(starts, ends)
+        hit = ~np.isnan(t).reshape(len(candidates), n_points - 1)
+        candidate_segments = np.where(hit.any(axis=1), hit.argmax(axis=1), -1)
+        segment_index[candidates] = candidate_segments
+        hits = np.nonzero(candidate_segments >= 0)[0]
+        flat = hits * (n_points - 1) + candidate_segments[hits]
+        jets = candidates[hits]
+        points[jets] = starts[flat] + t[flat, np.newaxis] * (ends[flat] - starts[flat])
+        triangle_index[jets] = triangles[flat]
+        return segment_index, points, triangle_index
+
+    def intersect_polyline(self, trajectory: List[Point3D]) -> Optional[MeshHit]:
+        """
+        Find the first intersection of the given polyline with the mesh.
+
+        Args:
+            trajectory (List[Point3D]): the points of the polyline in m
+
+        Returns:
+            Optional[MeshHit]: the first hit or None if the polyline does not hit the mesh
+        """
+        points = np.array([p.to_tuple() for p in trajectory], dtype=float)
+        if not self.cull_trajectories(points[np.newaxis])[0]:
+            return None
+        t, triangles = self.intersect_segments(points[:-1], points[1:])
+        hits = np.nonzero(~np.isnan(t))[0]
+        if len(hits) == 0:
+            return None
+        i = int(hits[0])
+        x, y, z = (points[i] + t[i] * (points[i + 1] - points[i])).tolist()
+        mesh_hit = MeshHit(
+            point=Point3D(x, y, z),
+            triangle_index=int(triangles[i]),
+            segment_index=i,
+            t=float(t[i]),
+        )
+        return mesh_hit
+
+    def points_near_mesh(self, points: np.ndarray, margin: float = 0.1) -> np.ndarray:
+        """
+        Check which of the given points are close to a triangle of the mesh
+        by querying the bounding volume hierarchy with a box around each point.
+
+        Args:
+            points (np.ndarray): points in m of shape (n, 3)
+            margin (float): half the edge length of the query boxes in m
+
+        Returns:
+            np.ndarray: boolean mask of shape (n,)
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        queries, _triangles = self.bvh.query_boxes(
+            (points - margin) * 1000, (points + margin) * 1000
+        )
+        near = np.zeros(len(points), dtype=bool)
+        near[queries] = True
+        return near
+
+    def intersect_jet(
+        self, water_jet: WaterJet, tolerance: float = 0.02
+    ) -> Optional[MeshHit]:
+        """
+        Find the first intersection of the given jet with the mesh. The trajectory
+        is sampled adaptively - coarse in free space and with a finer tolerance
+        near the ground and near the mesh.
+
+        Args:
+            water_jet (WaterJet): the jet with its angles set
+            tolerance (float): the maximum chord error in free space in m
+
+        Returns:
+            Optional[MeshHit]: the first hit or None if the jet does not hit the mesh
+        """
+        trajectory = water_jet.calculate_adaptive_trajectory(
+            tolerance=tolerance, refine=self.points_near_mesh
+        )
+        return self.intersect_polyline(trajectory)
 
     def visualize(self, ax: Axes3D):
         """Visualize the STL model"""
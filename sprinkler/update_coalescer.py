@@ -0,0 +1,97 @@
+"""
+Created on 2024-09-10
+
+@author: wf
+"""
+
+import time
+from typing import Callable, Dict, Hashable
+
+
+class UpdateCoalescer:
+    """
+    Gathers UI updates of one or more simulation ticks and applies them
+    in a single flush at most max_fps times per second.
+
+    Updates are submitted as callables under a key - a later update with the
+    same key replaces the pending one, so e.g. a label changed on every tick
+    is only sent once per frame. All updates of a flush are applied in one go
+    and thus leave the server in the same websocket batch.
+    """
+
+    def __init__(self, max_fps: float = 10.0):
+        """
+        Initialize the coalescer.
+
+        Args:
+            max_fps (float): the maximum number of flushes per second
+        """
+        if max_fps <= 0:
+            raise ValueError(f"max_fps must be positive but is {max_fps}")
+        self.max_fps = max_fps
+        self.pending: Dict[Hashable, Callable[[], None]] = {}
+        self.last_flush = None
+        # statistics
+        self.submitted = 0
+        self.applied = 0
+        self.flushes = 0
+
+    @property
+    def frame_interval(self) -> float:
+        """
+        the minimum time between two flushes in seconds
+        """
+        return 1.0 / self.max_fps
+
+    def submit(self, key: Hashable, update: Callable[[], None]):
+        """
+        Submit an update replacing any pending update with the same key.
+
+        Args:
+            key (Hashable): the key of the updated target
+            update (Callable[[], None]): the update to apply on the next flush
+        """
+        self.pending[key] = update
+        self.submitted += 1
+
+    def is_due(self, now: float = None) -> bool:
+        """
+        Check whether the next frame is due.
+
+        Args:
+            now (float): the current monotonic time - default: time.monotonic()
+        """
+        if now is None:
+            now = time.monotonic()
+        due = self.last_flush is None or now - self.last_flush >= self.frame_interval
+        return due
+
+    def flush(self, now: float = None, force: bool = False) -> int:
+        """
+        Apply all pending updates if the next frame is due.
+
+        Args:
+            now (float): the current monotonic time - default: time.monotonic()
+            force (bool): if True flush regardless of the frame rate
+
+        Returns:
+            int: the number of updates applied
+        """
+        if now is None:
+            now = time.monotonic()
+        if not self.pending or not (force or self.is_due(now)):
+            return 0
+        updates = list(self.pending.values())
+        self.pending.clear()
+        self.last_flush = now
+        for update in updates:
+            update()
+        self.applied += len(updates)
+        self.flushes += 1
+        return len(updates)
+
+    def clear(self):
+        """
+        Drop all pending updates.
+        """
+        self.pending.clear()
@@ -0,0 +1,110 @@
+// water jets evaluated in the browser from their angles
+// all jets share one point buffer which is added to the three.js scene of a ui.scene
+import SceneLib from "nicegui-scene";
+const { THREE } = SceneLib;
+
+// write the points of the parabola of the given jet up to the given age into positions
+export function arc_points(positions, offset, jet, source, segments, age) {
+  const h_rad = (jet.h_angle * Math.PI) / 180;
+  const v_rad = (jet.v_angle * Math.PI) / 180;
+  const [x0, y0, z0] = source.start;
+  const g = source.gravity;
+  const v0_x = source.velocity * Math.cos(v_rad) * Math.cos(h_rad);
+  const v0_y = source.velocity * Math.cos(v_rad) * Math.sin(h_rad);
+  const v0_z = source.velocity * Math.sin(v_rad);
+  const t_max = (v0_z + Math.sqrt(v0_z * v0_z + 2 * g * z0)) / g;
+  for (let i = 0; i <= segments; i++) {
+    // points ahead of the water front wait at the front
+    const t = Math.min((t_max * i) / segments, age);
+    const index = 3 * (offset + i);
+    positions[index] = x0 + v0_x * t;
+    positions[index + 1] = y0 + v0_y * t;
+    positions[index + 2] = Math.max(0, z0 + v0_z * t - 0.5 * g * t * t);
+  }
+  return t_max;
+}
+
+export default {
+  template: "<div></div>",
+  props: {
+    sceneId: Number,
+    size: Number,
+    segments: Number,
+    start: Array,
+    velocity: Number,
+    gravity: Number,
+    color: String,
+    opacity: Number,
+    pointSize: Number,
+    animate: Boolean,
+  },
+  mounted() {
+    this.jets = new Array(this.size).fill(null);
+    this.next_jet = 0;
+    this.used = 0;
+    this.attach();
+  },
+  unmounted() {
+    cancelAnimationFrame(this.frame);
+    clearTimeout(this.attach_timer);
+    if (this.points) {
+      this.points.removeFromParent();
+      this.geometry.dispose();
+      this.material.dispose();
+    }
+  },
+  methods: {
+    attach() {
+      // the scene element is mounted and initialized independently
+      const host = getElement(this.sceneId);
+      if (!host || !host.scene) {
+        this.attach_timer = setTimeout(() => this.attach(), 100);
+        return;
+      }
+      this.positions = new Float32Array(this.size * (this.segments + 1) * 3);
+      this.geometry = new THREE.BufferGeometry();
+      this.geometry.setAttribute("position", new THREE.BufferAttribute(this.positions, 3));
+      this.geometry.setDrawRange(0, 0);
+      this.material = new THREE.PointsMaterial({
+        color: this.color,
+        size: this.pointSize,
+        transparent: true,
+        opacity: this.opacity,
+      });
+      this.points = new THREE.Points(this.geometry, this.material);
+      this.points.frustumCulled = false;
+      host.scene.add(this.points);
+      this.update();
+    },
+    add_jet(h_angle, v_angle) {
+      const born = this.animate ? performance.now() / 1000 : -Infinity;
+      this.jets[this.next_jet] = { h_angle, v_angle, born, done: false };
+      this.next_jet = (this.next_jet + 1) % this.size;
+      this.used = Math.min(this.used + 1, this.size);
+    },
+    clear() {
+      this.jets.fill(null);
+      this.next_jet = 0;
+      this.used = 0;
+      if (this.geometry) this.geometry.setDrawRange(0, 0);
+    },
+    update() {
+      // only jets whose water front is still moving are evaluated
+      this.frame = requestAnimationFrame(() => this.update());
+      const now = performance.now() / 1000;
+      const source = { start: this.start, velocity: this.velocity, gravity: this.gravity };
+      let changed = false;
+      this.jets.forEach((jet, slot) => {
+        if (!jet || jet.done) return;
+        const age = now - jet.born;
+        const t_max = arc_points(this.positions, slot * (this.segments + 1), jet, source, this.segments, age);
+        jet.done = age >= t_max;
+        changed = true;
+      });
+      if (changed) {
+        this.geometry.attributes.position.needsUpdate = true;
+        this.geometry.setDrawRange(0, this.used * (this.segments + 1));
+      }
+    },
+  },
+};
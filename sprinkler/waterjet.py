@@ -5,9 +5,25 @@ Author: wf
 """
 
 import math
-from typing import List
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, List, Tuple
 
-from sprinkler.sprinkler_config import Hose, Point3D
+import numpy as np
+
+from sprinkler.sprinkler_config import Angles, Hose, Point3D
+
+
+@dataclass
+class JetBallistics:
+    """
+    Closed form key figures of a single water jet
+    """
+
+    time_of_flight: float  # time until the jet hits the ground (s)
+    apex: Point3D  # highest point of the jet (m)
+    impact: Point3D  # point where the jet hits the ground (m)
 
 
 class Parabolic:
@@ -60,19 +76,596 @@ class Parabolic:
 
         return points
 
-    def get_line_segments(self) -> List[tuple]:
+    def get_line_segments(self, tolerance: float = 0.02) -> List[tuple]:
         """
-        Get the trajectory as a list of line segments for rendering.
+        Get the trajectory as a list of line segments for rendering
+        sampled adaptively with the given chord error tolerance.
 
         Returns:
             List[tuple]: A list of tuples, each containing two points representing a line segment.
         """
-        points = self.calculate_trajectory()
+        points = self.calculate_adaptive_trajectory(tolerance=tolerance)
         return [
             (points[i].to_tuple(), points[i + 1].to_tuple())
             for i in range(len(points) - 1)
         ]
 
+    def position_at(self, t: np.ndarray) -> np.ndarray:
+        """
+        Get the positions of the jet at the given times.
+
+        Args:
+            t (np.ndarray): times in s
+
+        Returns:
+            np.ndarray: positions of shape (len(t), 3)
+        """
+        v0_x, v0_y, v0_z = Parabolic.velocity_components(
+            self.initial_velocity, self.horizontal_angle, self.vertical_angle
+        )
+        t = np.asarray(t, dtype=float)
+        positions = np.empty((len(t), 3))
+        positions[:, 0] = self.start_position.x + v0_x * t
+        positions[:, 1] = self.start_position.y + v0_y * t
+        positions[:, 2] = self.start_position.z + v0_z * t - 0.5 * self.gravity * t**2
+        return positions
+
+    def calculate_adaptive_times(
+        self,
+        tolerance: float = 0.02,
+        ground_height: float = 0.5,
+        ground_tolerance: float = None,
+        refine: Callable[[np.ndarray], np.ndarray] = None,
+        max_points: int = 256,
+    ) -> np.ndarray:
+        """
+        Get sample times such that no chord of the sampled polyline deviates more
+        than the tolerance from the trajectory.
+
+        The initial times are spaced by the local curvature so that every chord
+        has about the allowed error - steep parts of the jet get longer segments
+        than the apex. For a parabola the maximum distance between arc and chord is
+        at the parameter midpoint, so the check is exact. Intervals exceeding their
+        limit e.g. near the ground are split into k equal parts where k² is the
+        ratio of their error to the limit.
+
+        Args:
+            tolerance (float): the maximum chord error in m
+            ground_height (float): below this height the ground tolerance applies
+            ground_tolerance (float): the maximum chord error near the ground - default: tolerance/4
+            refine (Callable): optional function mapping an (n, 3) array of points to a boolean
+                mask of points near obstacles, where the ground tolerance applies as well
+            max_points (int): the maximum number of points
+
+        Returns:
+            np.ndarray: the sorted sample times starting with 0 and ending with the time of flight
+        """
+        if ground_tolerance is None:
+            ground_tolerance = tolerance / 4
+        v0_x, v0_y, v0_z = Parabolic.velocity_components(
+            self.initial_velocity, self.horizontal_angle, self.vertical_angle
+        )
+        t_max = float(Parabolic.flight_time(v0_z, self.start_position.z, self.gravity))
+        # start with the optimal spacing for the tolerance: the chord error of an
+        # interval dt is g_n * dt² / 8 with g_n the gravity component normal to the jet
+        grid = np.linspace(0, t_max, 257)
+        speed_xy = float(np.hypot(v0_x, v0_y))
+        v_z = v0_z - self.gravity * grid
+        with np.errstate(divide="ignore", invalid="ignore"):
+            g_normal = np.nan_to_num(self.gravity * speed_xy / np.hypot(speed_xy, v_z))
+        density = np.sqrt(g_normal / (8 * tolerance))
+        cumulative = np.concatenate(
+            [[0.0], np.cumsum((density[1:] + density[:-1]) / 2 * np.diff(grid))]
+        )
+        n = int(min(max(1, np.ceil(cumulative[-1])), max_points - 1))
+        times = np.interp(np.linspace(0, cumulative[-1], n + 1), cumulative, grid)
+        times[-1] = t_max
+        while len(times) < max_points:
+            t0 = times[:-1]
+            t1 = times[1:]
+            t_mid = 0.5 * (t0 + t1)
+            p0 = self.position_at(t0)
+            p1 = self.position_at(t1)
+            pm = self.position_at(t_mid)
+            chord = p1 - p0
+            chord_length = np.linalg.norm(chord, axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                error = np.linalg.norm(np.cross(pm - p0, chord), axis=1) / chord_length
+            error = np.nan_to_num(error)
+            limit = np.full(len(t_mid), tolerance)
+            near = np.minimum(p0[:, 2], p1[:, 2]) < ground_height
+            if refine is not None:
+                near |= np.asarray(refine(pm), dtype=bool)
+            limit[near] = ground_tolerance
+            split = error > limit
+            if not np.any(split):
+                break
+            # the chord error grows with the square of the interval length
+            parts = np.ceil(np.sqrt(error[split] / limit[split])).astype(int)
+            new_times = np.concatenate(
+                [
+                    start + (end - start) * np.arange(1, n) / n
+                    for start, end, n in zip(t0[split], t1[split], parts)
+                ]
+            )[: max_points - len(times)]
+            times = np.sort(np.concatenate([times, new_times]))
+        return times
+
+    def calculate_adaptive_trajectory(
+        self,
+        tolerance: float = 0.02,
+        ground_height: float = 0.5,
+        ground_tolerance: float = None,
+        refine: Callable[[np.ndarray], np.ndarray] = None,
+        max_points: int = 256,
+    ) -> List[Point3D]:
+        """
+        Calculate the trajectory with adaptive sampling - sparse on the nearly straight
+        parts and dense near the apex, near the ground and near obstacles.
+
+        see calculate_adaptive_times for the arguments
+
+        Returns:
+            List[Point3D]: A list of points representing the trajectory.
+        """
+        times = self.calculate_adaptive_times(
+            tolerance=tolerance,
+            ground_height=ground_height,
+            ground_tolerance=ground_tolerance,
+            refine=refine,
+            max_points=max_points,
+        )
+        positions = self.position_at(times)
+        positions[:, 2] = np.maximum(0, positions[:, 2])  # Ensure z is not negative
+        return Parabolic.to_points(positions)
+
+    @staticmethod
+    def velocity_components(
+        initial_velocity: float, horizontal_angles, vertical_angles
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Split the initial velocity into its x, y and z components.
+
+        Args:
+            initial_velocity (float): The initial velocity in m/s.
+            horizontal_angles: horizontal angle(s) in degrees (scalar or array).
+            vertical_angles: vertical angle(s) in degrees (scalar or array).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: the v0_x, v0_y and v0_z components.
+        """
+        v_rad = np.radians(vertical_angles)
+        h_rad = np.radians(horizontal_angles)
+        v0_xy = initial_velocity * np.cos(v_rad)
+        v0_x = v0_xy * np.cos(h_rad)
+        v0_y = v0_xy * np.sin(h_rad)
+        v0_z = initial_velocity * np.sin(v_rad)
+        return v0_x, v0_y, v0_z
+
+    @staticmethod
+    def flight_time(v0_z, start_z: float, gravity: float = 9.8):
+        """
+        Time until the jet reaches ground level z=0.
+
+        Args:
+            v0_z: vertical velocity component(s) in m/s (scalar or array).
+            start_z (float): height of the start position in m.
+            gravity (float): gravitational acceleration in m/s².
+
+        Returns:
+            the time(s) of flight in s.
+        """
+        return (v0_z + np.sqrt(v0_z**2 + 2 * gravity * start_z)) / gravity
+
+    def calculate_ballistics(self) -> JetBallistics:
+        """
+        Calculate time of flight, apex and impact point from the ballistic
+        equations without sampling the trajectory.
+
+        Returns:
+            JetBallistics: the key figures of this jet
+        """
+        times, apexes, impacts = Parabolic.calculate_ballistics_batch(
+            start_position=self.start_position,
+            initial_velocity=self.initial_velocity,
+            horizontal_angles=self.horizontal_angle,
+            vertical_angles=self.vertical_angle,
+            gravity=self.gravity,
+        )
+        ballistics = JetBallistics(
+            time_of_flight=float(times[0]),
+            apex=Point3D(*apexes[0].tolist()),
+            impact=Point3D(*impacts[0].tolist()),
+        )
+        return ballistics
+
+    @classmethod
+    def calculate_ballistics_batch(
+        cls,
+        start_position: Point3D,
+        initial_velocity: float,
+        horizontal_angles,
+        vertical_angles,
+        gravity: float = 9.8,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Calculate time of flight, apex and impact point for arrays of angle pairs.
+
+        Args:
+            start_position (Point3D): The common start position of all jets.
+            initial_velocity (float): The initial velocity in m/s.
+            horizontal_angles: array of horizontal angles in degrees.
+            vertical_angles: array of vertical angles in degrees (same shape).
+            gravity (float): gravitational acceleration in m/s².
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: times of flight of shape (n_jets,),
+            apex points and impact points of shape (n_jets, 3)
+        """
+        h_angles = np.atleast_1d(np.asarray(horizontal_angles, dtype=float)).ravel()
+        v_angles = np.atleast_1d(np.asarray(vertical_angles, dtype=float)).ravel()
+        v0_x, v0_y, v0_z = cls.velocity_components(initial_velocity, h_angles, v_angles)
+        t_max = cls.flight_time(v0_z, start_position.z, gravity)
+        # jets aimed downwards have their apex at the start position
+        t_apex = np.maximum(0, v0_z) / gravity
+        start = np.array(start_position.to_tuple(), dtype=float)
+
+        def position_at(t: np.ndarray) -> np.ndarray:
+            positions = np.empty((len(t), 3))
+            positions[:, 0] = v0_x * t
+            positions[:, 1] = v0_y * t
+            positions[:, 2] = v0_z * t - 0.5 * gravity * t**2
+            return positions + start
+
+        apexes = position_at(t_apex)
+        impacts = position_at(t_max)
+        impacts[:, 2] = 0
+        return t_max, apexes, impacts
+
+    @classmethod
+    def calculate_trajectories(
+        cls,
+        start_position: Point3D,
+        initial_velocity: float,
+        horizontal_angles,
+        vertical_angles,
+        num_segments: int = 20,
+        gravity: float = 9.8,
+    ) -> np.ndarray:
+        """
+        Calculate the trajectories of many jets in one vectorized pass.
+
+        Args:
+            start_position (Point3D): The common start position of all jets.
+            initial_velocity (float): The initial velocity in m/s.
+            horizontal_angles: array of horizontal angles in degrees.
+            vertical_angles: array of vertical angles in degrees (same shape).
+            num_segments (int): Number of segments to divide each trajectory into.
+            gravity (float): gravitational acceleration in m/s².
+
+        Returns:
+            np.ndarray: float array of shape (n_jets, num_segments + 1, 3)
+        """
+        h_angles = np.asarray(horizontal_angles, dtype=float).ravel()
+        v_angles = np.asarray(vertical_angles, dtype=float).ravel()
+        v0_x, v0_y, v0_z = cls.velocity_components(initial_velocity, h_angles, v_angles)
+        t_max = cls.flight_time(v0_z, start_position.z, gravity)
+        # (n_jets, num_segments + 1) sample times
+        t = t_max[:, np.newaxis] * (np.arange(num_segments + 1) / num_segments)
+        trajectories = np.empty((len(h_angles), num_segments + 1, 3))
+        trajectories[:, :, 0] = start_position.x + v0_x[:, np.newaxis] * t
+        trajectories[:, :, 1] = start_position.y + v0_y[:, np.newaxis] * t
+        z = start_position.z + v0_z[:, np.newaxis] * t - 0.5 * gravity * t**2
+        trajectories[:, :, 2] = np.maximum(0, z)  # Ensure z is not negative
+        return trajectories
+
+    @staticmethod
+    def to_points(trajectory: np.ndarray) -> List[Point3D]:
+        """
+        Convert a single (n_points, 3) trajectory array to a list of points.
+        """
+        return [Point3D(float(x), float(y), float(z)) for x, y, z in trajectory]
+
+
+class DragModel:
+    """
+    Trajectory model with quadratic air drag: a = g - k * |v| * v
+
+    The drag coefficient k (1/m) and the initial velocity are fitted
+    to the measured max_height and max_distance of a Hose. Many jets are
+    integrated at once with a fixed step midpoint (RK2) scheme on NumPy arrays.
+    """
+
+    def __init__(
+        self,
+        drag_coefficient: float,
+        initial_velocity: float,
+        gravity: float = 9.8,
+        time_step: float = 0.01,
+        max_time: float = 30.0,
+    ):
+        """
+        Initialize the drag model.
+
+        Args:
+            drag_coefficient (float): the quadratic drag coefficient k in 1/m
+            initial_velocity (float): the initial velocity in m/s
+            gravity (float): gravitational acceleration in m/s²
+            time_step (float): the fixed integration time step in s
+            max_time (float): the maximum time of flight to integrate in s
+        """
+        self.drag_coefficient = drag_coefficient
+        self.initial_velocity = initial_velocity
+        self.gravity = gravity
+        self.time_step = time_step
+        self.max_time = max_time
+
+    @classmethod
+    def from_hose(cls, hose: Hose, gravity: float = 9.8) -> "DragModel":
+        """
+        Create a drag model fitted to the measurements of the given hose.
+
+        Args:
+            hose (Hose): the hose with max_distance and max_height
+            gravity (float): gravitational acceleration in m/s²
+
+        Returns:
+            DragModel: the fitted model
+        """
+        k, v0 = cls.fit(hose.max_distance, hose.max_height, gravity)
+        return cls(drag_coefficient=k, initial_velocity=v0, gravity=gravity)
+
+    @staticmethod
+    def vertical_velocity(k, max_height: float, gravity: float = 9.8):
+        """
+        Initial velocity of a vertical jet reaching max_height with drag coefficient k
+        (closed form solution of the vertical motion with quadratic drag).
+        """
+        k = np.asarray(k, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            v0 = np.sqrt(gravity * np.expm1(2 * k * max_height) / k)
+        return np.where(k > 0, v0, math.sqrt(2 * gravity * max_height))
+
+    @classmethod
+    @lru_cache(maxsize=32)
+    def fit(
+        cls, max_distance: float, max_height: float, gravity: float = 9.8
+    ) -> Tuple[float, float]:
+        """
+        Fit drag coefficient and initial velocity so that a vertical jet reaches
+        max_height and the farthest reaching jet launched at ground level lands
+        at max_distance.
+
+        Without drag the range is 2 * max_height - if the measured max_distance
+        is not shorter than that the measurements are not drag limited and k=0 is used.
+
+        Args:
+            max_distance (float): the maximum horizontal distance in m
+            max_height (float): the maximum vertical height in m
+            gravity (float): gravitational acceleration in m/s²
+
+        Returns:
+            Tuple[float, float]: the drag coefficient k in 1/m and the initial velocity in m/s
+        """
+        if max_height <= 0 or max_distance >= 2 * max_height:
+            return 0.0, math.sqrt(2 * gravity * max(max_height, 0))
+        # evaluate the range for a grid of drag coefficients and launch angles in one batch
+        # beyond k=0.3 the fitted velocities get unrealistic and the range
+        # is no longer monotonic - shorter distances are clamped to that limit
+        ks = np.geomspace(1e-4, 0.3, 41)
+        v_angles = np.arange(10.0, 46.0, 1.0)
+        k_grid, a_grid = np.meshgrid(ks, v_angles, indexing="ij")
+        v0_grid = cls.vertical_velocity(k_grid, max_height, gravity)
+        model = cls(drag_coefficient=k_grid.ravel(), initial_velocity=v0_grid.ravel())
+        model.gravity = gravity
+        trajectories = model.calculate_trajectories(
+            Point3D(0, 0, 0), np.zeros(k_grid.size), a_grid.ravel(), num_segments=1
+        )
+        ranges = trajectories[:, -1, 0].reshape(k_grid.shape).max(axis=1)
+        # the range decreases with increasing drag - interpolate in log(k)
+        k = float(np.exp(np.interp(max_distance, ranges[::-1], np.log(ks)[::-1])))
+        v0 = float(cls.vertical_velocity(k, max_height, gravity))
+        return k, v0
+
+    def calculate_trajectories(
+        self,
+        start_position: Point3D,
+        horizontal_angles,
+        vertical_angles,
+        num_segments: int = 20,
+    ) -> np.ndarray:
+        """
+        Integrate the trajectories of many jets at once.
+
+        Args:
+            start_position (Point3D): The common start position of all jets.
+            horizontal_angles: array of horizontal angles in degrees.
+            vertical_angles: array of vertical angles in degrees (same shape).
+            num_segments (int): Number of equal time segments of the returned trajectories.
+
+        Returns:
+            np.ndarray: float array of shape (n_jets, num_segments + 1, 3)
+        """
+        h_angles = np.atleast_1d(np.asarray(horizontal_angles, dtype=float)).ravel()
+        v_angles = np.atleast_1d(np.asarray(vertical_angles, dtype=float)).ravel()
+        n_jets = len(h_angles)
+        k = np.broadcast_to(np.asarray(self.drag_coefficient, dtype=float), (n_jets,))[
+            :, np.newaxis
+        ]
+        v0 = np.broadcast_to(np.asarray(self.initial_velocity, dtype=float), (n_jets,))
+        velocity = np.stack(
+            Parabolic.velocity_components(v0, h_angles, v_angles), axis=1
+        )
+        position = np.tile(
+            np.array(start_position.to_tuple(), dtype=float), (n_jets, 1)
+        )
+        g = np.array([0, 0, self.gravity])
+        # keep the explicit scheme stable for strong drag
+        stiffness = float(np.max(k[:, 0] * v0)) if n_jets else 0.0
+        dt = min(self.time_step, 0.1 / stiffness) if stiffness > 0 else self.time_step
+
+        def acceleration(v: np.ndarray) -> np.ndarray:
+            speed = np.sqrt(np.einsum("ij,ij->i", v, v))[:, np.newaxis]
+            return -g - k * speed * v
+
+        positions = [position]
+        max_steps = int(math.ceil(self.max_time / dt))
+        for _step in range(max_steps):
+            if not np.any(position[:, 2] >= 0):
+                break
+            # midpoint (RK2) step
+            v_mid = velocity + 0.5 * dt * acceleration(velocity)
+            position = position + dt * v_mid
+            velocity = velocity + dt * acceleration(v_mid)
+            positions.append(position)
+        path = np.stack(positions, axis=1)  # (n_jets, n_steps + 1, 3)
+        z = path[:, :, 2]
+        # first step at which each jet is below ground
+        below = z < 0
+        below[:, -1] = True
+        i_below = np.argmax(below, axis=1)
+        i_above = np.maximum(i_below - 1, 0)
+        z_above = z[np.arange(n_jets), i_above]
+        z_below = z[np.arange(n_jets), i_below]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = np.where(z_below < 0, z_above / (z_above - z_below), 0.0)
+        t_impact = (i_above + np.where(i_below > 0, fraction, 0.0)) * dt
+        # resample at equal time segments with linear interpolation
+        t = t_impact[:, np.newaxis] * (np.arange(num_segments + 1) / num_segments)
+        step_pos = t / dt
+        i0 = np.minimum(np.floor(step_pos).astype(int), path.shape[1] - 1)
+        i1 = np.minimum(i0 + 1, path.shape[1] - 1)
+        f = (step_pos - i0)[:, :, np.newaxis]
+        p0 = np.take_along_axis(path, i0[:, :, np.newaxis], axis=1)
+        p1 = np.take_along_axis(path, i1[:, :, np.newaxis], axis=1)
+        trajectories = p0 + f * (p1 - p0)
+        trajectories[:, :, 2] = np.maximum(0, trajectories[:, :, 2])
+        return trajectories
+
+
+class TrajectoryCache:
+    """
+    Bounded LRU cache of calculated trajectories.
+
+    Entries are keyed by the quantized angles, the start position, the hose velocity
+    and the number of segments. The cache is cleared automatically when the velocity
+    of the hose changes e.g. via Hose.calibrate or Hose.recalculate.
+
+    A lookup returns the trajectory of the quantized angles - each angle is off
+    by at most half the angle resolution, which moves the end of a jet of range r
+    by up to r * radians(angle_resolution / 2) e.g. 13 mm for 15 m at 0.1°.
+    The points are stored as immutable tuples and every lookup gets its own copies.
+    """
+
+    def __init__(self, maxsize: int = 4096, angle_resolution: float = 0.1):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize (int): maximum number of trajectories to keep
+            angle_resolution (float): angles are quantized to multiples of this value (degrees)
+        """
+        self.maxsize = maxsize
+        self.angle_resolution = angle_resolution
+        self.entries = OrderedDict()
+        self.velocity = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def quantize(self, angle: float) -> int:
+        """
+        Quantize the given angle to a multiple of my angle resolution.
+        """
+        return round(angle / self.angle_resolution)
+
+    def clear(self):
+        """
+        Remove all cached trajectories.
+        """
+        self.entries.clear()
+
+    def get_trajectory(
+        self,
+        start_position: Point3D,
+        hose: Hose,
+        horizontal_angle: float,
+        vertical_angle: float,
+        num_segments: int = 20,
+    ) -> List[Point3D]:
+        """
+        Get the trajectory for the given angles from the cache, calculating
+        it for the quantized angles on a miss.
+
+        The trajectory is the one of the quantized angles, not of the requested
+        ones - see the class documentation for the resulting error.
+
+        Args:
+            start_position (Point3D): The starting position of the water jet.
+            hose (Hose): The hose configuration providing the velocity.
+            horizontal_angle (float): The horizontal angle of the spray.
+            vertical_angle (float): The vertical angle of the spray.
+            num_segments (int): Number of segments to divide the trajectory into.
+
+        Returns:
+            List[Point3D]: new points of the trajectory of the quantized angles
+        """
+        if hose.velocity != self.velocity:
+            if self.entries:
+                self.invalidations += 1
+                self.clear()
+            self.velocity = hose.velocity
+        h_key = self.quantize(horizontal_angle)
+        v_key = self.quantize(vertical_angle)
+        key = (h_key, v_key, start_position.to_tuple(), hose.velocity, num_segments)
+        points = self.entries.get(key)
+        if points is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        else:
+            self.misses += 1
+            parabolic = Parabolic(
+                start_position=start_position,
+                initial_velocity=hose.velocity,
+                horizontal_angle=h_key * self.angle_resolution,
+                vertical_angle=v_key * self.angle_resolution,
+            )
+            trajectory = parabolic.calculate_trajectory(num_segments)
+            points = tuple(p.to_tuple() for p in trajectory)
+            self.entries[key] = points
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return [Point3D(*p) for p in points]
+
+    @property
+    def hit_ratio(self) -> float:
+        """
+        the ratio of cache hits to all lookups
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        """
+        Get the cache statistics.
+
+        Returns:
+            dict: size, hits, misses, invalidations and hit ratio
+        """
+        stats = {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hit_ratio,
+        }
+        return stats
+
+
+# trajectory cache shared by all water jets of this process
+trajectory_cache = TrajectoryCache()
+
 
 class WaterJet:
     """
@@ -80,16 +673,32 @@ class WaterJet:
     Handles the configuration of the water jet and calculates the trajectory using the Parabolic class.
     """
 
-    def __init__(self, start_position: Point3D, hose: Hose):
+    MODELS = ["parabolic", "drag"]
+
+    def __init__(
+        self,
+        start_position: Point3D,
+        hose: Hose,
+        cache: TrajectoryCache = None,
+        model: str = "parabolic",
+    ):
         """
         Initialize the WaterJet with a starting position and hose configuration.
 
         Args:
             start_position (Point3D): The starting position of the water jet.
             hose (Hose): The hose configuration providing velocity and other properties.
+            cache (TrajectoryCache): optional trajectory cache to look up parabolic trajectories
+            model (str): the trajectory model - "parabolic" (no air resistance) or "drag"
         """
+        if model not in WaterJet.MODELS:
+            raise ValueError(
+                f"unknown trajectory model {model} - use one of {WaterJet.MODELS}"
+            )
         self.start_position = start_position
         self.hose = hose
+        self.cache = cache
+        self.model = model
         self.horizontal_angle = None
         self.vertical_angle = None
         self.parabolic = None  # Initialize as None
@@ -125,17 +734,174 @@ class WaterJet:
             raise ValueError(
                 "Parabolic trajectory is not initialized. Call set_angles first."
             )
+        if self.model == "drag":
+            trajectories = self.calculate_trajectories(
+                [self.horizontal_angle], [self.vertical_angle], num_segments
+            )
+            return Parabolic.to_points(trajectories[0])
+        if self.cache is not None:
+            # the cached trajectory is the one of the angles quantized
+            # to the cache's angle resolution
+            return self.cache.get_trajectory(
+                start_position=self.start_position,
+                hose=self.hose,
+                horizontal_angle=self.horizontal_angle,
+                vertical_angle=self.vertical_angle,
+                num_segments=num_segments,
+            )
         return self.parabolic.calculate_trajectory(num_segments)
 
-    def get_line_segments(self) -> List[tuple]:
+    def calculate_adaptive_trajectory(
+        self,
+        tolerance: float = 0.02,
+        ground_height: float = 0.5,
+        ground_tolerance: float = None,
+        refine: Callable[[np.ndarray], np.ndarray] = None,
+        max_points: int = 256,
+    ) -> List[Point3D]:
         """
-        Get the trajectory as a list of line segments for rendering.
+        Calculate the trajectory with adaptive sampling by chord error tolerance.
+
+        see Parabolic.calculate_adaptive_times for the arguments
+
+        Returns:
+            List[Point3D]: A list of points representing the trajectory.
+        """
+        if self.parabolic is None:
+            raise ValueError(
+                "Parabolic trajectory is not initialized. Call set_angles first."
+            )
+        if self.model != "parabolic":
+            raise ValueError(
+                f"adaptive sampling is not available for the {self.model} model"
+            )
+        return self.parabolic.calculate_adaptive_trajectory(
+            tolerance=tolerance,
+            ground_height=ground_height,
+            ground_tolerance=ground_tolerance,
+            refine=refine,
+            max_points=max_points,
+        )
+
+    def get_line_segments(self, tolerance: float = 0.02) -> List[tuple]:
+        """
+        Get the trajectory as a list of line segments for rendering - parabolic
+        trajectories are sampled adaptively with the given chord error tolerance.
 
         Returns:
             List[tuple]: A list of tuples, each containing two points representing a line segment.
         """
+        if self.model == "parabolic":
+            points = self.calculate_adaptive_trajectory(tolerance=tolerance)
+        else:
+            points = self.calculate_trajectory()
+        return [
+            (points[i].to_tuple(), points[i + 1].to_tuple())
+            for i in range(len(points) - 1)
+        ]
+
+    def calculate_trajectories(
+        self, horizontal_angles, vertical_angles, num_segments: int = 20
+    ) -> np.ndarray:
+        """
+        Calculate the trajectories for arrays of angle pairs in one vectorized pass
+        using my start position and hose.
+
+        Args:
+            horizontal_angles: array of horizontal angles in degrees.
+            vertical_angles: array of vertical angles in degrees (same shape).
+            num_segments (int): Number of segments to divide each trajectory into.
+
+        Returns:
+            np.ndarray: float array of shape (n_jets, num_segments + 1, 3)
+        """
+        if self.model == "drag":
+            drag_model = DragModel.from_hose(self.hose)
+            return drag_model.calculate_trajectories(
+                start_position=self.start_position,
+                horizontal_angles=horizontal_angles,
+                vertical_angles=vertical_angles,
+                num_segments=num_segments,
+            )
+        return Parabolic.calculate_trajectories(
+            start_position=self.start_position,
+            initial_velocity=self.hose.velocity,
+            horizontal_angles=horizontal_angles,
+            vertical_angles=vertical_angles,
+            num_segments=num_segments,
+        )
+
+    def calculate_ballistics(self) -> JetBallistics:
+        """
+        Calculate time of flight, apex and impact point of the current angles.
+        The closed form solution is based on the parabolic model.
+
+        Returns:
+            JetBallistics: the key figures of this jet
+        """
         if self.parabolic is None:
             raise ValueError(
                 "Parabolic trajectory is not initialized. Call set_angles first."
             )
-        return self.parabolic.get_line_segments()
+        return self.parabolic.calculate_ballistics()
+
+    def calculate_impacts(self, horizontal_angles, vertical_angles) -> np.ndarray:
+        """
+        Calculate the impact points for arrays of angle pairs with my trajectory model.
+
+        Args:
+            horizontal_angles: array of horizontal angles in degrees.
+            vertical_angles: array of vertical angles in degrees (same shape).
+
+        Returns:
+            np.ndarray: impact points of shape (n_jets, 3)
+        """
+        if self.model == "drag":
+            # the last point of an integrated trajectory is its impact point
+            trajectories = self.calculate_trajectories(
+                horizontal_angles, vertical_angles, num_segments=1
+            )
+            return trajectories[:, -1]
+        _times, _apexes, impacts = self.calculate_ballistics_batch(
+            horizontal_angles, vertical_angles
+        )
+        return impacts
+
+    def calculate_ballistics_batch(
+        self, horizontal_angles, vertical_angles
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Calculate time of flight, apex and impact point for arrays of angle pairs
+        using my start position and hose.
+
+        Args:
+            horizontal_angles: array of horizontal angles in degrees.
+            vertical_angles: array of vertical angles in degrees (same shape).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: times of flight of shape (n_jets,),
+            apex points and impact points of shape (n_jets, 3)
+        """
+        return Parabolic.calculate_ballistics_batch(
+            start_position=self.start_position,
+            initial_velocity=self.hose.velocity,
+            horizontal_angles=horizontal_angles,
+            vertical_angles=vertical_angles,
+        )
+
+    @staticmethod
+    def angle_grid(angles: Angles) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get all horizontal/vertical angle pairs of the given angle configuration.
+
+        Args:
+            angles (Angles): the angle configuration
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: flat arrays of horizontal and vertical angles
+            with one entry per angle pair (horizontal major order)
+        """
+        h_grid, v_grid = np.meshgrid(
+            angles.horizontal.angles, angles.vertical.angles, indexing="ij"
+        )
+        return h_grid.ravel(), v_grid.ravel()
@@ -10,6 +10,7 @@ from ngwidgets.input_webserver import InputWebserver, InputWebSolution
 from ngwidgets.webserver import WebserverConfig
 from nicegui import Client, app, ui
 
+from sprinkler.simulation_service import SimulationService
 from sprinkler.sprinkler_core import SprinklerConfig, SprinklerSystem
 from sprinkler.sprinkler_head import SprinklerHeadView
 from sprinkler.sprinkler_sim import SprinklerSimulation
@@ -37,6 +38,10 @@ class NiceSprinklerWebServer(InputWebserver):
         """Constructs all the necessary attributes for the WebServer object."""
         InputWebserver.__init__(self, config=NiceSprinklerWebServer.get_config())
         self.sprinkler_system = None
+        # the simulation shared by all browser sessions
+        self.simulation_service = None
+        self.jet_mode = "client"
+        self.model = "parabolic"
 
         @ui.page("/remote")
         async def remote(client: Client):
@@ -67,11 +72,32 @@ class NiceSprinklerWebServer(InputWebserver):
         )
 
         # Create SprinklerSystem
-        self.sprinkler_system = SprinklerSystem(self.config_path, self.stl_path)
+        self.sprinkler_system = SprinklerSystem(
+            self.config_path,
+            self.stl_path,
+            web_lod=getattr(self.args, "web_lod", "full"),
+            collision_lod=getattr(self.args, "collision_lod", "full"),
+        )
+        self.model = getattr(self.args, "model", self.model)
+        self.jet_mode = getattr(self.args, "jet_mode", self.jet_mode)
+        if self.jet_mode == "client" and self.model != "parabolic":
+            raise ValueError(
+                f"the client jet mode can not show the {self.model} model - use --jet-mode compact or lines"
+            )
+        self.simulation_service = SimulationService(
+            self.sprinkler_system, model=self.model
+        )
         stl_directory = os.path.dirname(self.stl_path)
 
         # Add the static files route for serving the STL files
         app.add_static_files("/examples", stl_directory)
+        # only the garden model in the level of detail selected for the browser
+        # and not the rest of the cache directory it lives in
+        web_stl_path = self.sprinkler_system.web_stl_path
+        app.add_static_file(
+            local_file=web_stl_path,
+            url_path=f"/garden/{os.path.basename(web_stl_path)}",
+        )
         pass
 
     @classmethod
@@ -122,7 +148,12 @@ class NiceSprinklerSolution(InputWebSolution):
         """Generates the home page with a 3D viewer and controls for the sprinkler."""
         self.setup_menu()
         with ui.column():
-            self.simulation = SprinklerSimulation(self, self.webserver.sprinkler_system)
+            self.simulation = SprinklerSimulation(
+                self,
+                self.webserver.sprinkler_system,
+                service=self.webserver.simulation_service,
+                jet_mode=self.webserver.jet_mode,
+            )
             self.simulation.setup_scene_frame()
 
         await self.setup_footer()
@@ -138,9 +169,8 @@ class NiceSprinklerSolution(InputWebSolution):
         """Updates the simulation configuration based on user input."""
         try:
             new_config = SprinklerConfig.from_yaml(e.value)
-            self.webserver.sprinkler_system.config = new_config
-            self.simulation.sprinkler_system = self.webserver.sprinkler_system
-            self.reset_simulation()
+            # resets the shared simulation of all sessions
+            self.webserver.simulation_service.set_config(new_config)
             ui.notify("Configuration updated successfully")
         except Exception as ex:
             ui.notify(f"Error updating configuration: {str(ex)}", color="red")
@@ -3,11 +3,17 @@ Created on 2024-09-05
 
 @author: wf
 """
-from sprinkler.stl3d import STL3D
-from mpl_toolkits.mplot3d import Axes3D
-from sprinkler.sprinkler_config import Point3D, Lawn
+
 from typing import List
 
+import numpy as np
+from mpl_toolkits.mplot3d import Axes3D
+
+from sprinkler.sdf import Box, Sphere, Union
+from sprinkler.sprinkler_config import Lawn, Point3D
+from sprinkler.stl3d import STL3D
+
+
 class Garden3D(STL3D):
     def __init__(self, stl_file_path: str, lawn: Lawn):
         super().__init__(stl_file_path)
@@ -19,49 +25,82 @@ class Garden3D(STL3D):
         self.horse_chestnut_y = 7.35
         self.horse_chestnut_trunk_height = 6
         self.horse_chestnut_crown_diameter = 5.5
+        # analytic garden elements as signed distance fields
+        self.left_hedge = Box(
+            (0, 0, 0), (self.hedge_width, self.lawn.length - 1.2, self.hedge_height)
+        )
+        self.second_hedge = Box(
+            (self.hedge_width, 9, 0), (2 * self.hedge_width, 9 + 1.2, self.hedge_height)
+        )
+        trunk_half = 0.45 / 2
+        self.horse_chestnut = Box(
+            (self.horse_chestnut_x - trunk_half, self.horse_chestnut_y - trunk_half, 0),
+            (
+                self.horse_chestnut_x + trunk_half,
+                self.horse_chestnut_y + trunk_half,
+                self.horse_chestnut_trunk_height,
+            ),
+        ) | Sphere(
+            (
+                self.horse_chestnut_x,
+                self.horse_chestnut_y,
+                self.horse_chestnut_trunk_height,
+            ),
+            self.horse_chestnut_crown_diameter / 2,
+        )
+        self.obstacles = (
+            Union([self.left_hedge, self.second_hedge]) | self.horse_chestnut
+        )
 
     def is_point_within_boundaries(self, point: Point3D) -> bool:
         """Check if the point is within the lawn boundaries"""
-        return (0 <= point.x <= self.lawn.width and
-                0 <= point.y <= self.lawn.length and
-                point.z >= 0)
+        return bool(self.points_within_boundaries([point.to_tuple()])[0])
+
+    def points_within_boundaries(self, points: np.ndarray) -> np.ndarray:
+        """Check which of the points (n, 3) are within the lawn boundaries"""
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        x, y, z = points.T
+        return (
+            (0 <= x)
+            & (x <= self.lawn.width)
+            & (0 <= y)
+            & (y <= self.lawn.length)
+            & (z >= 0)
+        )
 
     def is_point_colliding_with_left_hedge(self, point: Point3D) -> bool:
         """Check if the point collides with the left hedge"""
-        return (0 <= point.x <= self.hedge_width and
-                0 <= point.y <= self.lawn.length - 1.2 and
-                0 <= point.z <= self.hedge_height)
+        return bool(self.left_hedge.contains(point.to_tuple())[0])
 
     def is_point_colliding_with_second_hedge(self, point: Point3D) -> bool:
         """Check if the point collides with the second hedge"""
-        return (self.hedge_width <= point.x <= 2 * self.hedge_width and
-                9 <= point.y <= 9 + 1.2 and
-                0 <= point.z <= self.hedge_height)
+        return bool(self.second_hedge.contains(point.to_tuple())[0])
 
     def is_point_colliding_with_horse_chestnut(self, point: Point3D) -> bool:
-        """Check if the point collides with the horse chestnut tree"""
-        # Check collision with trunk
-        if (abs(point.x - self.horse_chestnut_x) <= 0.45 / 2 and
-            abs(point.y - self.horse_chestnut_y) <= 0.45 / 2 and
-            0 <= point.z <= self.horse_chestnut_trunk_height):
-            return True
-
-        # Check collision with crown
-        dx = point.x - self.horse_chestnut_x
-        dy = point.y - self.horse_chestnut_y
-        dz = point.z - self.horse_chestnut_trunk_height
-        distance = (dx**2 + dy**2 + dz**2)**0.5
-        return distance <= self.horse_chestnut_crown_diameter / 2
+        """Check if the point collides with the horse chestnut tree (trunk or crown)"""
+        return bool(self.horse_chestnut.contains(point.to_tuple())[0])
 
     def is_point_colliding_with_mesh(self, point: Point3D) -> bool:
         """Check if the point collides with any garden element"""
-        if self.is_point_colliding_with_left_hedge(point):
-            return True
-        if self.is_point_colliding_with_second_hedge(point):
-            return True
-        if self.is_point_colliding_with_horse_chestnut(point):
-            return True
-        return super().is_point_colliding_with_mesh(point)
+        return bool(self.points_colliding_with_mesh([point.to_tuple()])[0])
+
+    def points_colliding_with_mesh(self, points: np.ndarray) -> np.ndarray:
+        """Check which of the points (n, 3) collide with any garden element"""
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        return self.obstacles.contains(points) | super().points_colliding_with_mesh(
+            points
+        )
+
+    def first_invalid_index(self, trajectory: List[Point3D]) -> int:
+        """
+        Get the index of the first point of the trajectory that collides with
+        the garden or is out of bounds - -1 if there is none
+        """
+        points = np.array([point.to_tuple() for point in trajectory], dtype=float)
+        invalid = ~self.points_within_boundaries(
+            points
+        ) | self.points_colliding_with_mesh(points)
+        return int(invalid.argmax()) if invalid.any() else -1
 
     def is_trajectory_valid(self, trajectory: List[Point3D]) -> bool:
         """
@@ -69,22 +108,15 @@ class Garden3D(STL3D):
         a) within the boundaries of the garden
         b) not hitting any objects of the 3D STL model or garden elements
         """
-        for point in trajectory:
-            if not self.is_point_within_boundaries(point):
-                return False
-            if self.is_point_colliding_with_mesh(point):
-                return False
-        return True
+        return self.first_invalid_index(trajectory) < 0
 
     def find_collision_point(self, trajectory: List[Point3D]) -> Point3D:
         """
         Find the first point in the trajectory that collides with the mesh or goes out of bounds.
         Returns None if no collision is found.
         """
-        for point in trajectory:
-            if not self.is_point_within_boundaries(point) or self.is_point_colliding_with_mesh(point):
-                return point
-        return None
+        index = self.first_invalid_index(trajectory)
+        return trajectory[index] if index >= 0 else None
 
     def visualize(self, ax: Axes3D):
         """Visualize the garden layout in 3D"""
@@ -94,19 +126,31 @@ class Garden3D(STL3D):
         lawn_x = [0, self.lawn.width, self.lawn.width, 0, 0]
         lawn_y = [0, 0, self.lawn.length, self.lawn.length, 0]
         lawn_z = [0, 0, 0, 0, 0]
-        ax.plot(lawn_x, lawn_y, lawn_z, 'g-')
+        ax.plot(lawn_x, lawn_y, lawn_z, "g-")
 
         # Plot left hedge
         hedge_x = [0, self.hedge_width, self.hedge_width, 0, 0]
         hedge_y = [0, 0, self.lawn.length - 1.2, self.lawn.length - 1.2, 0]
         hedge_z = [self.hedge_height] * 5
-        ax.plot(hedge_x, hedge_y, hedge_z, 'g-')
+        ax.plot(hedge_x, hedge_y, hedge_z, "g-")
 
         # Plot second hedge
-        second_hedge_x = [self.hedge_width, 2 * self.hedge_width, 2 * self.hedge_width, self.hedge_width, self.hedge_width]
+        second_hedge_x = [
+            self.hedge_width,
+            2 * self.hedge_width,
+            2 * self.hedge_width,
+            self.hedge_width,
+            self.hedge_width,
+        ]
         second_hedge_y = [9, 9, 10.2, 10.2, 9]
         second_hedge_z = [self.hedge_height] * 5
-        ax.plot(second_hedge_x, second_hedge_y, second_hedge_z, 'g-')
+        ax.plot(second_hedge_x, second_hedge_y, second_hedge_z, "g-")
 
         # Plot horse chestnut tree
-        ax.plot([self.horse_chestnut_x], [self.horse_chestnut_y], [self.horse_chestnut_trunk_height], 'bo', markersize=10)
\ No newline at end of file
+        ax.plot(
+            [self.horse_chestnut_x],
+            [self.horse_chestnut_y],
+            [self.horse_chestnut_trunk_height],
+            "bo",
+            markersize=10,
+        )
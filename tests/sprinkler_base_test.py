@@ -5,6 +5,8 @@ Created on 03.09.2024
 """
 
 import os
+import shutil
+import tempfile
 
 from ngwidgets.basetest import Basetest
 
@@ -24,3 +26,16 @@ class SprinklerBasetest(Basetest):
         self.config_path = os.path.join(examples_dir, "example_config.yaml")
         self.stl_path = os.path.join(examples_dir, "example_garden.stl")
         self.config = SprinklerConfig.load_from_yaml_file(self.config_path)
+        self.cache_dir = tempfile.mkdtemp(prefix="nicesprinkler_test_")
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+
+    @staticmethod
+    def make_drag_limited(config: SprinklerConfig) -> SprinklerConfig:
+        """
+        calibrate the hose of the given configuration to measurements whose range is
+        shorter than the parabola allows so that the drag model gets a positive coefficient
+        - the example hose reaches 13.6 m at 5.7 m height which is not drag limited
+        """
+        hose = config.hose
+        hose.calibrate(max_distance=9, max_height=6, flow_rate=hose.flow_rate)
+        return config
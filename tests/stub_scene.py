@@ -0,0 +1,79 @@
+"""
+Created on 2024-09-10
+
+@author: wf
+"""
+
+from typing import List
+
+
+class StubObject:
+    """
+    scene object recording the calls a view makes on it
+    """
+
+    def __init__(self, scene: "StubScene", kind: str):
+        self.scene = scene
+        self.kind = kind
+        self.calls = []
+        self.points = None
+        self.is_visible = True
+
+    def record(self, name: str, *args) -> "StubObject":
+        self.calls.append((name, args))
+        self.scene.calls.append((self, name, args))
+        return self
+
+    def material(self, color: str = "#ffffff", opacity: float = 1.0):
+        return self.record("material", color, opacity)
+
+    def visible(self, value: bool = True):
+        self.is_visible = value
+        return self.record("visible", value)
+
+    def move(self, x: float = 0.0, y: float = 0.0, z: float = 0.0):
+        return self.record("move", x, y, z)
+
+    def rotate_R(self, R: List[List[float]]):
+        return self.record("rotate_R", R)
+
+    def scale(self, sx: float = 1.0, sy: float = None, sz: float = None):
+        return self.record("scale", sx, sy, sz)
+
+    def set_points(self, points: List[List[float]]):
+        self.points = points
+        return self.record("set_points", points)
+
+    def delete(self):
+        self.scene.objects.remove(self)
+        return self.record("delete")
+
+
+class StubScene:
+    """
+    stand-in for a ui.scene that records the objects created and
+    the calls made on them without a browser
+    """
+
+    def __init__(self):
+        self.objects = []
+        self.calls = []
+
+    def add(self, kind: str) -> StubObject:
+        scene_object = StubObject(self, kind)
+        self.objects.append(scene_object)
+        return scene_object
+
+    def point_cloud(self, points: List[List[float]], point_size: float = 1.0):
+        scene_object = self.add("point_cloud")
+        scene_object.points = points
+        return scene_object
+
+    def line(self, start: List[float], end: List[float]):
+        return self.add("line")
+
+    def calls_named(self, name: str) -> list:
+        """
+        get the (object, args) of all calls with the given name
+        """
+        return [(obj, args) for obj, call, args in self.calls if call == name]
@@ -0,0 +1,74 @@
+"""
+Created on 2024-09-06
+
+@author: wf
+"""
+
+import numpy as np
+
+from sprinkler.aiming import AimingSolver
+from sprinkler.sprinkler_config import Point3D
+from sprinkler.waterjet import WaterJet
+from tests.sprinkler_base_test import SprinklerBasetest
+
+
+class TestAiming(SprinklerBasetest):
+    """
+    test the inverse aiming solver
+    """
+
+    def setUp(self, debug=False, profile=True):
+        SprinklerBasetest.setUp(self, debug=debug, profile=profile)
+        self.solver = AimingSolver.from_config(self.config)
+        self.jet = WaterJet(
+            start_position=self.solver.start_position, hose=self.config.hose
+        )
+
+    def test_round_trip(self):
+        """
+        aiming at impact points must return the angles that produced them
+        """
+        h_angles = np.array([-80.0, -30.0, 0.0, 45.0, 85.0])
+        v_angles = np.array([5.0, 20.0, 35.0, 50.0, 58.0])
+        _times, _apexes, impacts = self.jet.calculate_ballistics_batch(
+            h_angles, v_angles
+        )
+        solution = self.solver.solve(impacts)
+        np.testing.assert_allclose(h_angles, solution.horizontal_angles)
+        # each angle is either the low or the high arc solution
+        low_diff = np.abs(np.nan_to_num(solution.low_angles, nan=999) - v_angles)
+        high_diff = np.abs(np.nan_to_num(solution.high_angles, nan=999) - v_angles)
+        self.assertTrue(np.all(np.minimum(low_diff, high_diff) < 1e-6))
+
+    def test_limits(self):
+        """
+        unreachable targets and motor limits give no solution
+        """
+        head = self.solver.start_position
+        targets = np.array(
+            [
+                [head.x, head.y + 100, 0],  # too far
+                [head.x - 5, head.y, 0],  # behind the sprinkler
+                [head.x + 6, head.y + 6, 0],
+            ]
+        )
+        solution = self.solver.solve(targets)
+        self.assertFalse(solution.low_valid[0])
+        self.assertFalse(solution.high_valid[0])
+        # behind the sprinkler is reachable but outside of the horizontal motor range
+        self.assertAlmostEqual(180, solution.horizontal_angles[1])
+        self.assertFalse(solution.low_valid[1])
+        self.assertFalse(solution.high_valid[1])
+        unlimited = AimingSolver(head, self.config.hose).solve(targets)
+        self.assertTrue(unlimited.low_valid[1])
+        # the high arc needs more than the max vertical motor angle of 60°
+        self.assertTrue(solution.low_valid[2])
+        self.assertFalse(solution.high_valid[2])
+        angle_pairs = self.solver.aim(Point3D(head.x + 6, head.y + 6, 0))
+        self.assertEqual(1, len(angle_pairs))
+        h_angle, v_angle = angle_pairs[0]
+        self.assertAlmostEqual(45, h_angle)
+        self.jet.set_angles(h_angle, v_angle)
+        impact = self.jet.calculate_ballistics().impact
+        self.assertAlmostEqual(head.x + 6, impact.x)
+        self.assertAlmostEqual(head.y + 6, impact.y)
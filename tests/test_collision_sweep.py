@@ -0,0 +1,62 @@
+"""
+Created on 2024-09-08
+
+@author: wf
+"""
+
+import numpy as np
+
+from sprinkler.collision_sweep import CollisionSweep, SharedArrays
+from sprinkler.sprinkler_core import SprinklerSystem
+from tests.sprinkler_base_test import SprinklerBasetest
+
+
+class TestCollisionSweep(SprinklerBasetest):
+    """
+    test the parallel collision sweep over the angle grid
+    """
+
+    def setUp(self, debug=True, profile=True):
+        SprinklerBasetest.setUp(self, debug=debug, profile=profile)
+        self.system = SprinklerSystem(
+            self.config_path, self.stl_path, cache_dir=self.cache_dir
+        )
+
+    def test_shared_arrays(self):
+        """
+        test packing arrays into shared memory
+        """
+        arrays = {
+            "a": np.arange(5, dtype=np.int64),
+            "b": np.ones((3, 3), dtype=np.float32),
+            "mesh_data": np.asarray(self.system.stl.stl_mesh.data[:3]),
+        }
+        shared = SharedArrays.create(arrays)
+        try:
+            attached = SharedArrays.attach(shared.name, shared.layout)
+            for name, array in attached.arrays().items():
+                self.assertTrue(np.array_equal(arrays[name], array))
+            attached.close()
+        finally:
+            shared.unlink()
+
+    def test_sweep(self):
+        """
+        test that the parallel sweep matches the sweep in the calling process
+        """
+        serial = CollisionSweep.from_system(self.system, workers=1)
+        angles = self.system.config.angles
+        result = serial.sweep_grid(angles)
+        n = len(angles.horizontal.angles) * len(angles.vertical.angles)
+        self.assertEqual((n,), result.valid.shape)
+        self.assertEqual((n, 3), result.hit_points.shape)
+        self.assertTrue(np.all(np.isnan(result.hit_points[result.valid])))
+        self.assertFalse(np.any(np.isnan(result.hit_points[~result.valid])))
+        parallel = CollisionSweep.from_system(self.system, workers=2, chunk_size=1024)
+        parallel_result = parallel.sweep_grid(angles)
+        self.assertTrue(np.array_equal(result.valid, parallel_result.valid))
+        self.assertTrue(
+            np.allclose(result.hit_points, parallel_result.hit_points, equal_nan=True)
+        )
+        if self.debug:
+            print(f"{n} jets, {result.valid_ratio:.1%} valid")
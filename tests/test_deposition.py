@@ -0,0 +1,94 @@
+"""
+Created on 2024-09-09
+
+@author: wf
+"""
+
+import os
+import tempfile
+
+import numpy as np
+from ngwidgets.basetest import Basetest
+
+from sprinkler.deposition import DepositionGrid
+from sprinkler.sprinkler_config import Lawn
+
+
+class TestDeposition(Basetest):
+    """
+    test the water deposition grid
+    """
+
+    def setUp(self, debug=False, profile=True):
+        Basetest.setUp(self, debug=debug, profile=profile)
+        self.lawn = Lawn(width=6.1, length=14.6)
+
+    def test_deposit(self):
+        """
+        test that deposited water is conserved and lands where it is aimed
+        """
+        grid = DepositionGrid(self.lawn, cell_size=0.1, spread=0.25)
+        self.assertEqual((61, 146), grid.liters.shape)
+        self.assertAlmostEqual(self.lawn.area, grid.cell_areas.sum())
+        grid.deposit([[3.05, 7.05, 0]], 2.0)
+        self.assertAlmostEqual(2.0, grid.total_liters)
+        self.assertEqual(
+            (30, 70), np.unravel_index(grid.liters.argmax(), grid.liters.shape)
+        )
+        # half of the water of an impact on the border is lost
+        grid.deposit([[0.0, 7.05]], 1.0)
+        self.assertAlmostEqual(3.0, grid.total_liters + grid.lost_liters)
+        self.assertGreater(grid.lost_liters, 0.3)
+        # a batch of impacts in one call
+        impacts = np.random.default_rng(42).uniform([0, 0], [6.1, 14.6], (1000, 2))
+        grid.reset()
+        grid.deposit(impacts, np.full(1000, 0.01))
+        self.assertAlmostEqual(10.0, grid.total_liters + grid.lost_liters)
+        grid.reset()
+        self.assertEqual(0, grid.total_liters)
+
+    def test_stats(self):
+        """
+        test the rain and uniformity statistics
+        """
+        grid = DepositionGrid(self.lawn, cell_size=0.5, spread=0)
+        stats = grid.stats()
+        self.assertEqual(0, stats.coverage)
+        self.assertEqual(1.0, stats.dry_ratio)
+        # uniform rain of 10 mm on every cell
+        grid.liters[:] = grid.cell_areas * 10
+        stats = grid.stats()
+        self.assertAlmostEqual(10, stats.mean_mm)
+        self.assertAlmostEqual(1.0, stats.coverage)
+        self.assertAlmostEqual(1.0, stats.uniformity)
+        self.assertAlmostEqual(1.0, stats.low_quarter_uniformity)
+        self.assertEqual(0, stats.dry_ratio)
+        # one dry corner
+        grid.liters[:2, :2] = 0
+        stats = grid.stats()
+        self.assertLess(stats.uniformity, 1.0)
+        self.assertEqual(4, grid.dry_spots().sum())
+        self.assertTrue(
+            np.allclose(
+                [[0.25, 0.25], [0.25, 0.75], [0.75, 0.25], [0.75, 0.75]],
+                grid.cell_centers(grid.dry_spots()),
+            )
+        )
+
+    def test_export(self):
+        """
+        test the heatmap and raw exports
+        """
+        grid = DepositionGrid(self.lawn, cell_size=0.05)
+        impacts = np.random.default_rng(42).normal([3, 7], [1, 2], (5000, 2))
+        grid.deposit(impacts, 0.01)
+        base_path = os.path.join(tempfile.mkdtemp(), "heatmap")
+        paths = grid.export(base_path)
+        self.assertEqual(3, len(paths))
+        for path in paths:
+            self.assertTrue(os.path.isfile(path))
+        self.assertTrue(np.array_equal(grid.rain_mm(), np.load(f"{base_path}.npy")))
+        with open(f"{base_path}.svg") as svg_file:
+            svg = svg_file.read()
+        # raster images for the heatmap and the colorbar instead of one element per cell
+        self.assertEqual(2, svg.count("<image"))
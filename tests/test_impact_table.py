@@ -0,0 +1,63 @@
+"""
+Created on 2024-09-06
+
+@author: wf
+"""
+
+import os
+
+import numpy as np
+
+from sprinkler.impact_table import ImpactTable
+from sprinkler.sprinkler_config import Point3D
+from sprinkler.waterjet import WaterJet
+from tests.sprinkler_base_test import SprinklerBasetest
+
+
+class TestImpactTable(SprinklerBasetest):
+    """
+    test the precomputed angle to impact point lookup table
+    """
+
+    def setUp(self, debug=False, profile=True):
+        SprinklerBasetest.setUp(self, debug=debug, profile=profile)
+        head = self.config.sprinkler_head
+        self.jet = WaterJet(
+            start_position=Point3D(head.x, head.y, head.z), hose=self.config.hose
+        )
+
+    def test_lookup(self):
+        """
+        test grid values and bilinear interpolation
+        """
+        table = ImpactTable.from_config(self.config)
+        self.assertEqual((86, 76, 3), table.impacts.shape)
+        # grid points are exact
+        self.jet.set_angles(-85, -75)
+        expected = self.jet.calculate_ballistics().impact
+        actual = table.impact_point(-85, -75)
+        self.assertAlmostEqual(expected.x, actual.x, 4)
+        self.assertAlmostEqual(expected.y, actual.y, 4)
+        # in between grid points the interpolation is close to the exact value
+        h_angles = np.array([0.3, 12.7, -44.1])
+        v_angles = np.array([20.5, 33.3, 5.9])
+        _times, _apexes, exact = self.jet.calculate_ballistics_batch(h_angles, v_angles)
+        interpolated = table.lookup(h_angles, v_angles)
+        np.testing.assert_allclose(exact, interpolated, atol=0.15)
+
+    def test_load_or_create(self):
+        """
+        test storing and loading the table in the cache directory
+        """
+        table = ImpactTable.load_or_create(self.config, self.cache_dir)
+        files = os.listdir(self.cache_dir)
+        self.assertEqual([f"impact_table_{table.signature}.npz"], files)
+        loaded = ImpactTable.load_or_create(self.config, self.cache_dir)
+        self.assertEqual(table.signature, loaded.signature)
+        np.testing.assert_array_equal(table.impacts, loaded.impacts)
+        # a recalibrated hose needs a different table
+        hose = self.config.hose
+        hose.calibrate(hose.max_distance, hose.max_height + 1, hose.flow_rate)
+        other = ImpactTable.load_or_create(self.config, self.cache_dir)
+        self.assertNotEqual(table.signature, other.signature)
+        self.assertEqual(2, len(os.listdir(self.cache_dir)))
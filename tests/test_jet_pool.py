@@ -0,0 +1,96 @@
+"""
+Created on 2024-09-09
+
+@author: wf
+"""
+
+import numpy as np
+from ngwidgets.basetest import Basetest
+
+from sprinkler.jet_pool import JetPool, LinePool
+from tests.stub_scene import StubScene
+
+
+class TestJetPool(Basetest):
+    """
+    test the pools of preallocated jet objects
+    """
+
+    def test_segment_transform(self):
+        """
+        test that the transform maps the unit x-axis onto known segments
+        """
+        length, R = LinePool.segment_transform((1, 2, 3), (3, 2, 3))
+        self.assertAlmostEqual(2, length)
+        self.assertTrue(np.allclose([1, 0, 0], np.array(R)[:, 0]))
+        # vertical segments use the other helper axis
+        length, R = LinePool.segment_transform((0, 0, 0), (0, 0, -5))
+        self.assertAlmostEqual(5, length)
+        self.assertTrue(np.allclose([0, 0, -1], np.array(R)[:, 0]))
+        # degenerate segments are not rotated
+        self.assertEqual(
+            (0.0, [[1, 0, 0], [0, 1, 0], [0, 0, 1]]),
+            LinePool.segment_transform((1, 1, 1), (1, 1, 1)),
+        )
+        starts = np.random.default_rng(3).uniform(-10, 10, (20, 3))
+        ends = np.random.default_rng(4).uniform(-10, 10, (20, 3))
+        for start, end in zip(starts, ends):
+            length, R = LinePool.segment_transform(start, end)
+            R = np.array(R)
+            self.assertAlmostEqual(np.linalg.norm(end - start), length)
+            # a proper rotation scaled along x lands on the end point
+            self.assertTrue(np.allclose(np.eye(3), R @ R.T, atol=1e-5))
+            self.assertAlmostEqual(1, np.linalg.det(R), places=5)
+            self.assertTrue(np.allclose(end, start + R @ [length, 0, 0], atol=1e-4))
+
+    def test_line_pool(self):
+        """
+        test that the segments are reused round-robin
+        """
+        scene = StubScene()
+        pool = LinePool(scene, size=5)
+        lines = list(scene.objects)
+        self.assertEqual(5, len(lines))
+        scene.calls.clear()
+        trajectory = [(0, 0, 1), (1, 0, 2), (2, 0, 2), (3, 0, 0)]
+        self.assertEqual(5, pool.jet_capacity)
+        pool.show(trajectory)
+        self.assertEqual((3, 3), (pool.next_index, pool.used))
+        # only one jet of 3 segments fits into 5 lines
+        self.assertEqual(1, pool.jet_capacity)
+        pool.show(trajectory)
+        self.assertEqual((1, 5), (pool.next_index, pool.used))
+        self.assertEqual(lines, scene.objects)
+        moves = scene.calls_named("move")
+        self.assertEqual([lines[i % 5] for i in range(6)], [m[0] for m in moves])
+        self.assertEqual(trajectory[:-1] * 2, [m[1] for m in moves])
+        scales = [args[0] for _line, args in scene.calls_named("scale")]
+        self.assertTrue(np.allclose([np.sqrt(2), 1, np.sqrt(5)] * 2, scales))
+        # each line is only made visible once
+        visible = scene.calls_named("visible")
+        self.assertEqual(lines, [line for line, _args in visible])
+        pool.clear()
+        self.assertEqual((0, 0), (pool.next_index, pool.used))
+        self.assertFalse(any(line.is_visible for line in lines))
+        pool.show(trajectory)
+        self.assertEqual(3, sum(line.is_visible for line in lines))
+
+    def test_jet_pool(self):
+        """
+        test that the point clouds are reused round-robin
+        """
+        scene = StubScene()
+        pool = JetPool(scene, size=3)
+        clouds = list(scene.objects)
+        scene.calls.clear()
+        jets = [[[0, 0, jet], [1, 0, 0]] for jet in range(4)]
+        for jet in jets:
+            pool.show(jet)
+        self.assertEqual((1, 3), (pool.next_index, pool.used))
+        self.assertEqual(clouds, scene.objects)
+        self.assertEqual([jets[3], jets[1], jets[2]], [c.points for c in clouds])
+        self.assertEqual(clouds, [c for c, _args in scene.calls_named("visible")])
+        pool.clear()
+        self.assertFalse(any(cloud.is_visible for cloud in clouds))
+        pool.show(jets[0])
+        self.assertEqual([True, False, False], [c.is_visible for c in clouds])
@@ -0,0 +1,135 @@
+"""
+Created on 2024-09-08
+
+@author: wf
+"""
+
+import numpy as np
+from ngwidgets.basetest import Basetest
+
+from sprinkler.sdf import SDF, Box, Cylinder, Sphere, Union
+from sprinkler.sprinkler_config import Hose, Lawn, Point3D
+from sprinkler.waterjet import WaterJet
+from tests.garden_example_stl3d import Garden3D
+from tests.sprinkler_base_test import SprinklerBasetest
+
+
+class TestSDF(Basetest):
+    """
+    test the signed distance fields of the analytic primitives
+    """
+
+    def test_distances(self):
+        """
+        test the distances of the primitives at known points
+        """
+        points = np.array([[0, 0, 0], [2, 0, 0], [0, 0, 3], [3, 4, 0.5]])
+        box = Box((-1, -1, -1), (1, 1, 1))
+        self.assertTrue(
+            np.allclose([-1, 1, 2, np.sqrt(2**2 + 3**2)], box.distance(points))
+        )
+        sphere = Sphere((0, 0, 0), 1)
+        self.assertTrue(
+            np.allclose([-1, 1, 2, np.sqrt(25.25) - 1], sphere.distance(points))
+        )
+        cylinder = Cylinder((0, 0, 0), 1, 2)
+        self.assertTrue(np.allclose([0, 1, 1, 4], cylinder.distance(points)))
+        union = box | Sphere((3, 4, 0.5), 0.5)
+        self.assertIsInstance(union, Union)
+        self.assertTrue(np.allclose([-1, 1, 2, -0.5], union.distance(points)))
+        self.assertEqual([True, False, False, True], union.contains(points).tolist())
+        self.assertTrue(np.all(np.isinf(Union([]).distance(points))))
+        # shapes must implement distance and bounds
+        with self.assertRaises(TypeError):
+            SDF()
+
+    def test_broad_phase(self):
+        """
+        test that the bounding box culling of unions keeps the exact results
+        """
+        rng = np.random.default_rng(42)
+        centers = rng.uniform(0, 20, (50, 3))
+        union = Union([Sphere(tuple(center), 0.5) for center in centers])
+        points = rng.uniform(-5, 25, (2000, 3))
+        expected = np.min(
+            [np.linalg.norm(points - center, axis=1) - 0.5 for center in centers],
+            axis=0,
+        )
+        self.assertTrue(np.allclose(expected, union.distance(points)))
+        self.assertTrue(np.array_equal(expected <= 0, union.contains(points)))
+        self.assertEqual(2 * 2000, union.stats.queries)
+        self.assertGreater(union.stats.culled_queries, 0)
+        self.assertGreater(union.stats.avoided_ratio, 0.5)
+        low, high = union.bounds()
+        self.assertTrue(np.allclose(centers.min(axis=0) - 0.5, low))
+        self.assertTrue(np.allclose(centers.max(axis=0) + 0.5, high))
+
+    def test_sphere_trace(self):
+        """
+        test that sphere tracing finds the same hits as dense sampling
+        """
+        obstacles = Box((1, 4, 0), (3, 6, 2)) | Sphere((5, 5, 4), 1.5)
+        water_jet = WaterJet(start_position=Point3D(3.5, 0, 1), hose=Hose())
+        h = np.repeat(np.arange(-30, 181, 15), 8)
+        v = np.tile(np.arange(0, 80, 10), len(h) // 8)
+        trajectories = water_jet.calculate_trajectories(h, v, num_segments=20)
+        hit, hit_points = obstacles.sphere_trace(trajectories, epsilon=0.001)
+        # dense samples along the same polylines
+        f = np.linspace(0, 1, 201)[np.newaxis, np.newaxis, :, np.newaxis]
+        starts = trajectories[:, :-1, np.newaxis]
+        ends = trajectories[:, 1:, np.newaxis]
+        dense = (starts + f * (ends - starts)).reshape(len(trajectories), -1, 3)
+        dense_hit = obstacles.first_collision_indices(dense) >= 0
+        self.assertTrue(np.any(hit))
+        self.assertFalse(np.all(hit))
+        self.assertTrue(np.array_equal(dense_hit, hit))
+        self.assertTrue(np.all(obstacles.distance(hit_points[hit]) <= 0.001))
+        self.assertTrue(np.all(np.isnan(hit_points[~hit])))
+
+    def test_sphere_trace_grazing(self):
+        """
+        test that a jet grazing the surface until max_steps is not reported as a miss
+        """
+        box = Box((0, 0, 0), (10, 1, 2))
+        # skims the top of the box just above epsilon and then dips into it
+        grazing = np.array([[[0, 0.5, 2.002], [8, 0.5, 2.002], [9, 0.5, 1.5]]])
+        passing = grazing + [0, 0, 1]
+        trajectories = np.concatenate([grazing, passing])
+        hit, hit_points = box.sphere_trace(trajectories, epsilon=0.001, max_steps=64)
+        self.assertEqual([True, False], hit.tolist())
+        self.assertTrue(np.allclose([9, 0.5, 1.5], hit_points[0]))
+        self.assertTrue(np.all(np.isnan(hit_points[1])))
+
+
+class TestGardenSDF(SprinklerBasetest):
+    """
+    test the analytic garden elements of Garden3D
+    """
+
+    def test_garden_elements(self):
+        """
+        test the signed distance fields against the original per point checks
+        """
+        lawn = Lawn(width=6.1, length=14.6)
+        garden = Garden3D(self.stl_path, lawn)
+        points = np.random.default_rng(42).uniform([-1, -1, -1], [7, 16, 10], (5000, 3))
+        x, y, z = points.T
+        left_hedge = (
+            (0 <= x) & (x <= 1.1) & (0 <= y) & (y <= 13.4) & (0 <= z) & (z <= 1.8)
+        )
+        second_hedge = (
+            (1.1 <= x) & (x <= 2.2) & (9 <= y) & (y <= 10.2) & (0 <= z) & (z <= 1.8)
+        )
+        trunk = (
+            (np.abs(x - 2.1) <= 0.225)
+            & (np.abs(y - 7.35) <= 0.225)
+            & (0 <= z)
+            & (z <= 6)
+        )
+        crown = np.linalg.norm(points - [2.1, 7.35, 6], axis=1) <= 2.75
+        expected = left_hedge | second_hedge | trunk | crown
+        self.assertTrue(np.array_equal(expected, garden.obstacles.contains(points)))
+        self.assertTrue(
+            garden.is_point_colliding_with_horse_chestnut(Point3D(2.1, 7.35, 7))
+        )
+        self.assertFalse(garden.is_point_colliding_with_left_hedge(Point3D(3, 3, 1)))
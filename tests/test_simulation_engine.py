@@ -0,0 +1,112 @@
+"""
+Created on 2024-09-09
+
+@author: wf
+"""
+
+import time
+
+import numpy as np
+
+from sprinkler.impact_table import ImpactTable
+from sprinkler.simulation_engine import SimulationEngine
+from sprinkler.sprinkler_config import SprinklerConfig
+from sprinkler.waterjet import DragModel
+from tests.sprinkler_base_test import SprinklerBasetest
+
+
+class TestSimulationEngine(SprinklerBasetest):
+    """
+    test the headless simulation engine
+    """
+
+    def setUp(self, debug=False, profile=True):
+        SprinklerBasetest.setUp(self, debug=debug, profile=profile)
+        self.config = SprinklerConfig.load_from_yaml_file(self.config_path)
+
+    def test_sweep(self):
+        """
+        test that batched steps follow the same sweep as single ticks
+        """
+        single = SimulationEngine(self.config, speed=3)
+        batched = SimulationEngine(self.config, speed=3)
+        angles = [single.step() for _tick in range(500)]
+        h_single = np.concatenate([h for h, _v in angles])
+        v_single = np.concatenate([v for _h, v in angles])
+        h_batched, v_batched = batched.step(500)
+        self.assertTrue(np.array_equal(h_single, h_batched))
+        self.assertTrue(np.array_equal(v_single, v_batched))
+        self.assertTrue(
+            np.allclose(single.deposition.liters, batched.deposition.liters)
+        )
+        self.assertAlmostEqual(single.time, batched.time)
+        # the sweep turns around at the limits
+        self.assertEqual(self.config.angles.horizontal.min, h_batched.min())
+        self.assertLessEqual(h_batched.max(), self.config.angles.horizontal.max + 3)
+        batched.reset()
+        self.assertEqual(0, batched.total_liters)
+        self.assertEqual(0, batched.deposition.total_liters)
+
+    def test_run(self):
+        """
+        test a 30 minute run in fast forward
+        """
+        engine = SimulationEngine(self.config)
+        start = time.time()
+        result = engine.run(30 * 60, sample_interval=60)
+        elapsed = time.time() - start
+        self.assertLess(elapsed, 10)
+        self.assertEqual(30, len(result.times))
+        self.assertAlmostEqual(30 * 60, result.times[-1])
+        flow_rate = self.config.hose.flow_rate
+        self.assertAlmostEqual(30 * flow_rate, result.total_liters[-1])
+        stats = result.stats
+        self.assertAlmostEqual(
+            30 * flow_rate, stats.total_liters + stats.lost_liters, places=6
+        )
+        self.assertTrue(np.all(np.diff(result.coverage) >= 0))
+        if self.debug:
+            print(f"30 min simulated in {elapsed:.2f} s: {stats}")
+
+    def test_impact_table(self):
+        """
+        test that looking up the precomputed impact points deposits
+        the water where the computed ballistics would
+        """
+        table = ImpactTable.load_or_create(self.config, self.cache_dir)
+        computed = SimulationEngine(self.config)
+        looked_up = SimulationEngine(self.config, impact_table=table)
+        rng = np.random.default_rng(5)
+        angles = self.config.angles
+        h = rng.uniform(angles.horizontal.min, angles.horizontal.max, 200)
+        v = rng.uniform(angles.vertical.min, angles.vertical.max, 200)
+        impacts = computed.emit(h, v)
+        self.assertTrue(np.allclose(impacts, looked_up.emit(h, v), atol=0.01))
+        self.assertAlmostEqual(computed.total_liters, looked_up.total_liters)
+
+    def test_drag(self):
+        """
+        test that the drag model is used for the deposition
+        """
+        config = self.make_drag_limited(self.config)
+        self.assertGreater(DragModel.from_hose(config.hose).drag_coefficient, 0)
+        parabolic = SimulationEngine(config)
+        drag = SimulationEngine(config, model="drag")
+        self.assertEqual("drag", drag.water_jet.model)
+        # along the lawn so that the water lands on it
+        h = np.array([80.0, 90.0, 100.0])
+        v = np.array([20.0, 35.0, 50.0])
+        head = config.sprinkler_head
+        start = np.array([head.x, head.y])
+        parabolic_ranges = np.linalg.norm(parabolic.emit(h, v)[:, :2] - start, axis=1)
+        drag_impacts = drag.emit(h, v)
+        drag_ranges = np.linalg.norm(drag_impacts[:, :2] - start, axis=1)
+        self.assertTrue(np.all(drag_ranges < parabolic_ranges))
+        self.assertTrue(np.allclose(0, drag_impacts[:, 2]))
+        self.assertAlmostEqual(parabolic.total_liters, drag.total_liters)
+        self.assertFalse(
+            np.array_equal(parabolic.deposition.liters, drag.deposition.liters)
+        )
+        table = ImpactTable.load_or_create(config, self.cache_dir)
+        with self.assertRaises(ValueError):
+            SimulationEngine(config, impact_table=table, model="drag")
@@ -0,0 +1,180 @@
+"""
+Created on 2024-09-10
+
+@author: wf
+"""
+
+import numpy as np
+
+from sprinkler.impact_table import ImpactTable
+from sprinkler.simulation_engine import SimulationEngine
+from sprinkler.simulation_service import SimulationService
+from sprinkler.sprinkler_config import SprinklerConfig
+from sprinkler.sprinkler_core import SprinklerSystem
+from tests.sprinkler_base_test import SprinklerBasetest
+
+
+class TestSimulationService(SprinklerBasetest):
+    """
+    test the simulation shared by all browser sessions
+    """
+
+    def setUp(self, debug=False, profile=True):
+        SprinklerBasetest.setUp(self, debug=debug, profile=profile)
+        self.system = SprinklerSystem(
+            self.config_path, self.stl_path, cache_dir=self.cache_dir
+        )
+
+    def test_fan_out(self):
+        """
+        test that each tick is computed once and sent to all subscribers
+        """
+        service = SimulationService(self.system)
+        service.is_dynamic = True
+        received = {"a": [], "b": []}
+        callbacks = {
+            name: (lambda update, name=name: received[name].append(update))
+            for name in received
+        }
+        for callback in callbacks.values():
+            service.subscribe(callback)
+        # a new subscriber immediately gets the current state
+        self.assertEqual([0], [update.tick for update in received["a"]])
+        for _tick in range(10):
+            service.tick()
+        self.assertEqual(11, len(received["a"]))
+        # the very same update instances are shared
+        for update_a, update_b in zip(received["a"], received["b"]):
+            self.assertIs(update_a, update_b)
+        last = received["a"][-1]
+        self.assertEqual(10, last.tick)
+        self.assertAlmostEqual(service.engine.time, last.time)
+        self.assertAlmostEqual(service.engine.total_liters, last.total_liters)
+        # the trajectory is computed once per tick and number of segments
+        points = service.trajectory_points(last, 20)
+        self.assertEqual(21, len(points))
+        self.assertIs(points, service.trajectory_points(last, 20))
+        service.unsubscribe(callbacks["b"])
+        service.tick()
+        self.assertEqual(12, len(received["a"]))
+        self.assertEqual(11, len(received["b"]))
+        service.reset()
+        self.assertTrue(received["a"][-1].reset)
+        self.assertEqual(0, received["a"][-1].total_liters)
+
+    def test_static(self):
+        """
+        test that the static mode keeps sprinkling at the current angles
+        """
+        service = SimulationService(self.system)
+        service.h_angle, service.v_angle = 45, 30
+        updates = []
+        service.subscribe(updates.append)
+        service.tick()
+        service.tick()
+        self.assertEqual([(45, 30)] * 2, [(u.h_angle, u.v_angle) for u in updates[1:]])
+        self.assertIsNone(updates[0].h_angle)
+
+    def test_start(self):
+        """
+        test that starting sends the jet source and that the tick interval
+        follows the dynamic mode of a running simulation
+        """
+        service = SimulationService(self.system)
+        updates = []
+        service.subscribe(updates.append)
+        head = self.system.config.sprinkler_head
+        head.x = 1.5
+        service.start()
+        self.addCleanup(service.stop)
+        self.assertTrue(updates[-1].running)
+        self.assertEqual(1.5, updates[-1].start_position.x)
+        self.assertEqual(self.system.config.hose.velocity, updates[-1].velocity)
+        self.assertEqual(1.5, service.water_jet.start_position.x)
+        self.assertEqual(0.5, service.timer.interval)
+        service.is_dynamic = True
+        self.assertEqual(service.engine.time_step, service.timer.interval)
+        service.is_dynamic = False
+        self.assertEqual(0.5, service.timer.interval)
+        service.stop()
+        self.assertFalse(service.is_running)
+        self.assertIsNone(updates[-1].velocity)
+
+    def test_drag(self):
+        """
+        test that the service simulates and draws the jets of the drag model
+        """
+        self.make_drag_limited(self.system.config)
+        service = SimulationService(self.system, model="drag")
+        self.assertEqual("drag", service.engine.water_jet.model)
+        self.assertIsNone(service.engine.impact_table)
+        service.h_angle, service.v_angle = 30, 40
+        service.tick()
+        update = service.last_update
+        # drag trajectories are not sampled adaptively
+        points = service.trajectory_points(update, tolerance=0.02)
+        self.assertEqual(21, len(points))
+        impact = service.engine.water_jet.calculate_impacts([30], [40])[0]
+        self.assertTrue(np.allclose(impact, points[-1], atol=0.001))
+
+    def test_update_source(self):
+        """
+        test that moving the sprinkler head moves the simulated jets as well
+        """
+        service = SimulationService(self.system)
+        head = self.system.config.sprinkler_head
+        head.x, head.y = 1.5, 2.0
+        service.start()
+        self.addCleanup(service.stop)
+        start_position = service.engine.water_jet.start_position
+        self.assertEqual((1.5, 2.0), (start_position.x, start_position.y))
+        signature = ImpactTable.get_signature(self.system.config)
+        self.assertEqual(signature, service.engine.impact_table.signature)
+        service.h_angle, service.v_angle = 90, 30
+        service.tick()
+        # the water lands where an engine of the moved head puts it
+        engine = SimulationEngine(
+            self.system.config, impact_table=self.system.impact_table
+        )
+        engine.emit([90], [30])
+        liters = service.engine.deposition.liters
+        self.assertGreater(liters.sum(), 0)
+        self.assertTrue(np.allclose(engine.deposition.liters, liters))
+        # and not where the original head would have put it
+        engine = SimulationEngine(self.config)
+        engine.emit([90], [30])
+        self.assertFalse(np.allclose(engine.deposition.liters, liters))
+
+    def test_set_config(self):
+        """
+        test that a new configuration reinitializes the controls and the engine
+        """
+        service = SimulationService(self.system)
+        updates = []
+        service.subscribe(updates.append)
+        service.start()
+        self.addCleanup(service.stop)
+        service.is_dynamic = True
+        service.tick()
+        config = SprinklerConfig.from_yaml(self.system.config.to_yaml())
+        config.lawn.width = 4.0
+        config.angles.horizontal.max = 45
+        config.sprinkler_head.x = 2.0
+        config.hose.flow_rate = 30
+        service.set_config(config)
+        self.assertIs(config, self.system.config)
+        self.assertEqual(45, service.h_angle_max)
+        self.assertEqual(30, service.flow_rate)
+        self.assertFalse(service.is_dynamic)
+        self.assertEqual(0.5, service.timer.interval)
+        engine = service.engine
+        self.assertEqual(4.0, engine.deposition.lawn.width)
+        self.assertEqual(40, engine.deposition.nx)
+        self.assertEqual((45, 30), (engine.h_max, engine.flow_rate))
+        self.assertEqual(0, engine.total_liters)
+        self.assertEqual(2.0, engine.water_jet.start_position.x)
+        # all sessions are reset and get the new jet source
+        update = updates[-1]
+        self.assertTrue(update.reset)
+        self.assertTrue(update.running)
+        self.assertEqual(2.0, update.start_position.x)
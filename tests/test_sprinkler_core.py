@@ -4,6 +4,8 @@ Created on 2024-08-13
 @author: wf
 """
 
+import os
+
 from sprinkler.sprinkler_core import SprinklerSystem, SprinklerConfig
 from tests.sprinkler_base_test import SprinklerBasetest
 
@@ -15,9 +17,50 @@ class TestSprinklerCore(SprinklerBasetest):
 
     def setUp(self, debug=True, profile=True):
         SprinklerBasetest.setUp(self, debug=debug, profile=profile)
-        self.system = SprinklerSystem(self.config_path, self.stl_path)
+        self.system = SprinklerSystem(
+            self.config_path, self.stl_path, cache_dir=self.cache_dir
+        )
         self.config = self.system.config
 
     def test_sprinkler_system_initialization(self):
         self.assertIsInstance(self.system.config, SprinklerConfig)
-        self.assertEqual(self.system.stl_file_path, self.stl_path)
\ No newline at end of file
+        self.assertEqual(self.system.stl_file_path, self.stl_path)
+
+    def test_impact_table(self):
+        """
+        test that the impact table is only loaded or computed on first use
+        """
+
+        def table_files():
+            files = os.listdir(self.cache_dir)
+            return [name for name in files if name.startswith("impact_table_")]
+
+        self.assertEqual([], table_files())
+        table = self.system.impact_table
+        self.assertEqual([f"impact_table_{table.signature}.npz"], table_files())
+        self.assertIs(table, self.system.impact_table)
+        # calibrating the hose in place invalidates the table
+        hose = self.config.hose
+        hose.calibrate(hose.max_distance, hose.max_height * 0.8, hose.flow_rate)
+        calibrated = self.system.impact_table
+        self.assertNotEqual(table.signature, calibrated.signature)
+        self.assertEqual(2, len(table_files()))
+        self.assertIs(calibrated, self.system.impact_table)
+
+    def test_level_of_detail(self):
+        """
+        test selecting the level of detail per consumer
+        """
+        self.assertEqual(self.stl_path, self.system.web_stl_path)
+        self.assertIs(self.system.stl, self.system.collision_stl)
+        system = SprinklerSystem(
+            self.config_path,
+            self.stl_path,
+            cache_dir=self.cache_dir,
+            web_lod="coarse",
+            collision_lod="medium",
+        )
+        self.assertTrue(system.web_stl_path.startswith(self.cache_dir))
+        self.assertLess(
+            len(system.collision_stl.stl_mesh.vectors), len(system.stl.stl_mesh.vectors)
+        )
@@ -0,0 +1,165 @@
+"""
+Created on 2024-09-10
+
+@author: wf
+"""
+
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from nicegui import Client, ui
+from nicegui.page import page
+
+from sprinkler.simulation_service import SimulationService
+from sprinkler.sprinkler_core import SprinklerSystem
+from sprinkler.sprinkler_sim import SprinklerSimulation
+from tests.sprinkler_base_test import SprinklerBasetest
+from tests.stub_scene import StubScene
+
+
+class TestSprinklerSimulation(SprinklerBasetest):
+    """
+    test rendering the simulation updates into a stub scene
+    """
+
+    def setUp(self, debug=False, profile=True):
+        SprinklerBasetest.setUp(self, debug=debug, profile=profile)
+        self.system = SprinklerSystem(
+            self.config_path, self.stl_path, cache_dir=self.cache_dir
+        )
+        self.service = SimulationService(self.system)
+        self.service.is_dynamic = True
+
+    def create_simulation(self, jet_mode: str, **kwargs) -> SprinklerSimulation:
+        """
+        create a simulation view with its jet pool in a stub scene
+        """
+        sim = SprinklerSimulation(
+            None, self.system, service=self.service, jet_mode=jet_mode, **kwargs
+        )
+        sim.scene = StubScene()
+        sim.add_jet_pool()
+        return sim
+
+    def test_compact_mode(self):
+        """
+        test that each jet updates a single pooled point cloud in place
+        """
+        sim = self.create_simulation("compact", jet_pool_size=4, jet_segments=10)
+        scene = sim.scene
+        self.assertEqual(4, len(scene.objects))
+        self.assertEqual({"point_cloud"}, {obj.kind for obj in scene.objects})
+        clouds = list(scene.objects)
+        for tick in range(10):
+            scene.calls.clear()
+            self.service.tick()
+            sim.draw_jet(self.service.last_update)
+            # no objects are created per tick
+            self.assertEqual(clouds, scene.objects)
+            set_points = scene.calls_named("set_points")
+            self.assertEqual(1, len(set_points))
+            cloud, (points,) = set_points[0]
+            # the pool is reused round-robin
+            self.assertIs(clouds[tick % 4], cloud)
+            self.assertTrue(cloud.is_visible)
+            # one point per segment end as [x, y, z] in m
+            self.assertEqual(11, len(points))
+            for point in points:
+                self.assertEqual(3, len(point))
+                self.assertTrue(all(isinstance(value, (int, float)) for value in point))
+            head = self.system.config.sprinkler_head
+            self.assertAlmostEqual(head.x, points[0][0], places=3)
+            self.assertAlmostEqual(head.y, points[0][1], places=3)
+            self.assertAlmostEqual(0, points[-1][2], places=3)
+        # each cloud got its share of the jets
+        self.assertEqual(
+            [3, 3, 2, 2],
+            [
+                sum(1 for name, _args in cloud.calls if name == "set_points")
+                for cloud in clouds
+            ],
+        )
+
+    def test_lines_mode(self):
+        """
+        test that pending jets in lines mode are coalesced by the number
+        of jets the line pool can show and not by its number of segments
+        """
+        sim = self.create_simulation("lines", line_pool_size=60)
+        self.service.is_dynamic = False
+        self.service.h_angle, self.service.v_angle = 45, 45
+        self.service.tick()
+        sim.draw_jet(self.service.last_update)
+        segments = sim.jet_pool.used
+        self.assertGreater(segments, 1)
+        capacity = sim.jet_pool.jet_capacity
+        self.assertEqual(60 // segments, capacity)
+        for _tick in range(3 * capacity):
+            self.service.tick()
+            sim.submit_jet(self.service.last_update)
+        self.assertEqual(capacity, len(sim.updates.pending))
+        sim.updates.flush(force=True)
+        self.assertEqual(60, len(sim.scene.objects))
+
+    def test_client_mode(self):
+        """
+        test that starting the shared simulation in one session sends
+        the jet source to the browser computed jets of all sessions
+        """
+        client = Client(page(""), request=None)
+        self.addCleanup(client.delete)
+        self.addCleanup(self.service.stop)
+        views = []
+        with ExitStack() as stack:
+            for _session in range(2):
+                sim = SprinklerSimulation(
+                    None, self.system, service=self.service, jet_mode="client"
+                )
+                with client:
+                    sim.scene = ui.scene()
+                    sim.add_jet_pool()
+                # no buttons and labels without a browser session
+                stack.enter_context(patch.object(sim, "sync_simulation_button"))
+                stack.enter_context(patch.object(sim, "update_water_info"))
+                set_source = stack.enter_context(
+                    patch.object(sim.jet_pool, "set_source")
+                )
+                self.service.subscribe(sim.on_update)
+                stack.callback(self.service.unsubscribe, sim.on_update)
+                views.append((sim, set_source))
+            self.system.config.sprinkler_head.x = 1.5
+            views[0][0].start_simulation()
+            for sim, set_source in views:
+                sim.updates.flush(force=True)
+                set_source.assert_called_once()
+                start_position, velocity = set_source.call_args.args
+                self.assertEqual(1.5, start_position.x)
+                self.assertEqual(self.system.config.hose.velocity, velocity)
+
+    def test_private_service(self):
+        """
+        test that a private simulation is stopped with its client
+        while a shared one keeps running
+        """
+        sim = SprinklerSimulation(None, self.system)
+        self.assertTrue(sim.owns_service)
+        sim.service.start()
+        self.addCleanup(sim.service.stop)
+        sim.on_delete()
+        self.assertFalse(sim.service.is_running)
+        shared = SprinklerSimulation(None, self.system, service=self.service)
+        self.assertFalse(shared.owns_service)
+        self.service.start()
+        self.addCleanup(self.service.stop)
+        shared.on_delete()
+        self.assertTrue(self.service.is_running)
+
+    def test_drag_model(self):
+        """
+        test that the browser computed parabolas can not show drag jets
+        """
+        service = SimulationService(self.system, model="drag")
+        with self.assertRaises(ValueError):
+            SprinklerSimulation(None, self.system, service=service, jet_mode="client")
+        sim = SprinklerSimulation(None, self.system, service=service, jet_mode="lines")
+        self.assertEqual("drag", sim.service.water_jet.model)
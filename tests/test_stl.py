@@ -6,9 +6,15 @@ Created on 2024-09-04
 
 import os
 import matplotlib.pyplot as plt
+import numpy as np
+import stl
+from stl import mesh
 from tests.garden_example_stl3d import Garden3D
 from sprinkler.sprinkler_config import Point3D, Lawn, Hose
 from tests.sprinkler_base_test import SprinklerBasetest
+from sprinkler.mesh_cache import MeshCache
+from sprinkler.mesh_lod import MeshLOD
+from sprinkler.stl3d import STL3D
 from sprinkler.waterjet import WaterJet
 
 class TestStl(SprinklerBasetest):
@@ -83,3 +89,280 @@ class TestStl(SprinklerBasetest):
         plt.close(fig_2d)
 
         self.assertIsNotNone(collision_point, "Expected a collision with the left hedge")
+
+    def test_bvh_inside_mesh(self):
+        """Test the BVH based point in mesh queries"""
+        bvh = self.garden.bvh
+        self.assertGreater(bvh.node_total, 1)
+        # the crown of the horse chestnut and open air above the lawn
+        self.assertTrue(self.garden.is_point_inside_mesh(Point3D(2.1, 7.35, 5)))
+        self.assertFalse(self.garden.is_point_inside_mesh(Point3D(4.5, 3, 2)))
+        # candidate triangles are a superset of the exact bounding box overlaps
+        vectors = self.garden.stl_mesh.vectors
+        point = np.array([2100.0, 7350.0, 5000.0])
+        queries, triangles = bvh.query_points(point, tolerance=100)
+        overlapping = np.nonzero(
+            np.all(
+                (vectors.min(axis=1) <= point + 100)
+                & (vectors.max(axis=1) >= point - 100),
+                axis=1,
+            )
+        )[0]
+        self.assertTrue(set(overlapping).issubset(set(triangles)))
+        # batch query for trajectories
+        water_jet = WaterJet(start_position=Point3D(3, 0, 1), hose=Hose())
+        trajectories = water_jet.calculate_trajectories(
+            [0, 90, 100, 120, 150], [45, 45, 60, 30, 30]
+        )
+        indices = self.garden.first_collision_indices(trajectories)
+        self.assertEqual((5,), indices.shape)
+        # brute force scan of each trajectory point by point
+        expected = []
+        for trajectory in trajectories:
+            hits = [
+                index
+                for index, point in enumerate(trajectory)
+                if self.garden.points_inside_mesh(point)[0]
+            ]
+            expected.append(hits[0] if hits else -1)
+        self.assertEqual(expected, indices.tolist())
+        # some jets hit an obstacle in mid air and some do not hit anything
+        self.assertTrue(any(0 < index < 20 for index in expected))
+        self.assertIn(-1, expected)
+
+    def test_segment_intersection(self):
+        """Test the Möller–Trumbore segment and polyline queries"""
+        # a vertical polyline through the crown of the horse chestnut
+        polyline = [Point3D(2, 7, 9.5), Point3D(2, 7, 5), Point3D(2, 7, 0.5)]
+        mesh_hit = self.garden.intersect_polyline(polyline)
+        self.assertIsNotNone(mesh_hit)
+        self.assertEqual(0, mesh_hit.segment_index)
+        self.assertAlmostEqual(2, mesh_hit.point.x)
+        self.assertGreater(mesh_hit.point.z, 5)
+        # a segment with both ends outside of the crown still hits it
+        t, triangles = self.garden.intersect_segments(
+            [[-1, 7.35, 5], [4.5, 3, 2]], [[6, 7.35, 5], [4.5, 3.5, 2]]
+        )
+        self.assertFalse(np.isnan(t[0]))
+        self.assertGreaterEqual(triangles[0], 0)
+        self.assertTrue(np.isnan(t[1]))
+        self.assertEqual(-1, triangles[1])
+        # batch query for trajectories
+        water_jet = WaterJet(start_position=Point3D(3, 0, 1), hose=Hose())
+        trajectories = water_jet.calculate_trajectories([0, 90, 100], [45, 45, 60])
+        segments, points, triangles = self.garden.intersect_trajectories(trajectories)
+        self.assertEqual((3,), segments.shape)
+        self.assertEqual((3, 3), points.shape)
+        for jet in range(3):
+            hit = segments[jet] >= 0
+            self.assertEqual(hit, triangles[jet] >= 0)
+            self.assertEqual(hit, not np.isnan(points[jet, 0]))
+
+    def test_intersect_jet(self):
+        """Test the collision of adaptively sampled jets against dense sampling"""
+        water_jet = WaterJet(start_position=Point3D(3, 0, 1), hose=Hose())
+
+        def above_ground(hit) -> bool:
+            # touching the ground at the impact point depends on rounding
+            return hit is not None and hit.point.z > 0.01
+
+        hits = 0
+        for h_angle in range(0, 181, 30):
+            for v_angle in (20, 45, 70):
+                water_jet.set_angles(h_angle, v_angle)
+                mesh_hit = self.garden.intersect_jet(water_jet)
+                dense_hit = self.garden.intersect_polyline(
+                    water_jet.calculate_trajectory(num_segments=1000)
+                )
+                self.assertEqual(above_ground(dense_hit), above_ground(mesh_hit))
+                # fewer points than the fixed 20 segments even near the mesh
+                adaptive = water_jet.calculate_adaptive_trajectory(
+                    refine=self.garden.points_near_mesh
+                )
+                self.assertLess(len(adaptive), 21)
+                if above_ground(mesh_hit):
+                    hits += 1
+                    distance = np.linalg.norm(
+                        np.subtract(mesh_hit.point.to_tuple(), dense_hit.point.to_tuple())
+                    )
+                    self.assertLess(distance, 0.1)
+        self.assertGreater(hits, 0)
+
+    def test_precomputed_planes(self):
+        """Test the precomputed triangle planes against the per triangle check"""
+        vectors = self.garden.stl_mesh.vectors
+        self.assertEqual((len(vectors), 3), self.garden.unit_normals.shape)
+        self.assertTrue(self.garden.unit_normals.flags["C_CONTIGUOUS"])
+        points = np.array([[2100.0, 7350.0, 5000.0], [500.0, 5000.0, 500.0]])
+        distances = (
+            points @ self.garden.unit_normals[:200].T - self.garden.plane_offsets[:200]
+        )
+        for i, point in enumerate(points):
+            for j, triangle in enumerate(vectors[:200]):
+                if abs(distances[i, j]) > 1e-3:
+                    self.assertEqual(
+                        self.garden.point_above_triangle(point, triangle),
+                        distances[i, j] > 0,
+                    )
+        colliding = self.garden.points_colliding_with_mesh(points / 1000)
+        self.assertEqual((2,), colliding.shape)
+
+    def test_height_field(self):
+        """Test the height field raster of the garden"""
+        height_field = self.garden.get_height_field(resolution=0.05)
+        self.assertIs(height_field, self.garden.get_height_field(resolution=0.05))
+        heights = height_field.heights_at([2.1, 4.5, 100], [7.35, 3, 100])
+        self.assertGreater(heights[0], 5)
+        self.assertLess(heights[1], 0.5)
+        self.assertEqual(-np.inf, heights[2])
+        self.assertTrue(self.garden.is_point_below_surface(Point3D(2.1, 7.35, 5), 0.05))
+        self.assertFalse(self.garden.is_point_below_surface(Point3D(4.5, 3, 2), 0.05))
+        # points inside the mesh are below its surface
+        points = np.random.default_rng(42).uniform([0, 0, 0], [6, 14, 8], (2000, 3))
+        inside = self.garden.points_inside_mesh(points)
+        below = self.garden.points_below_surface(points, 0.05)
+        self.assertTrue(np.all(below[inside]))
+        water_jet = WaterJet(start_position=Point3D(3, 0, 1), hose=Hose())
+        trajectories = water_jet.calculate_trajectories([0, 90, 100], [45, 45, 60])
+        indices = height_field.first_collision_indices(trajectories)
+        self.assertEqual((3,), indices.shape)
+
+    def test_mesh_cache(self):
+        """Test loading the mesh and its derived indexes from the cache"""
+        garden_mesh = STL3D(self.stl_path, cache_dir=self.cache_dir)
+        height_field = garden_mesh.get_height_field(resolution=0.05)
+        cached = STL3D(self.stl_path, cache_dir=self.cache_dir)
+        self.assertIsInstance(cached.stl_mesh.data, np.memmap)
+        self.assertIsInstance(cached.bvh.node_min, np.memmap)
+        self.assertTrue(
+            np.array_equal(garden_mesh.stl_mesh.vectors, cached.stl_mesh.vectors)
+        )
+        self.assertTrue(np.array_equal(garden_mesh.plane_offsets, cached.plane_offsets))
+        self.assertTrue(
+            np.array_equal(garden_mesh.bvh.triangle_order, cached.bvh.triangle_order)
+        )
+        cached_field = cached.get_height_field(resolution=0.05)
+        self.assertIsInstance(cached_field.heights, np.memmap)
+        self.assertTrue(np.array_equal(height_field.heights, cached_field.heights))
+        points = np.random.default_rng(7).uniform([0, 0, 0], [6, 14, 8], (500, 3))
+        self.assertTrue(
+            np.array_equal(
+                garden_mesh.points_inside_mesh(points),
+                cached.points_inside_mesh(points),
+            )
+        )
+
+    def test_mesh_cache_prune(self):
+        """Test that a changed STL file replaces the cache of its earlier version"""
+        other_path = os.path.join(self.cache_dir, "other.stl")
+        stl_path = os.path.join(self.cache_dir, "garden_copy.stl")
+        for path in (other_path, stl_path):
+            with open(self.stl_path, "rb") as source, open(path, "wb") as target:
+                target.write(source.read())
+        other_cache = MeshCache(self.cache_dir, other_path)
+        other_cache.save("data", np.arange(3))
+        old_cache = MeshCache(self.cache_dir, stl_path)
+        old_cache.save("data", np.arange(3))
+        # the same file is not pruned by its own cache
+        self.assertEqual([], old_cache.prune_stale())
+        stat = os.stat(stl_path)
+        os.utime(stl_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        new_cache = MeshCache(self.cache_dir, stl_path)
+        self.assertNotEqual(old_cache.key, new_cache.key)
+        new_cache.save("data", np.arange(3))
+        self.assertFalse(os.path.isdir(old_cache.path))
+        self.assertTrue(new_cache.has("data"))
+        self.assertTrue(other_cache.has("data"))
+
+    def test_binary_stl_memmap(self):
+        """Test the zero copy binary reader and the ASCII fallback"""
+        data = STL3D.read_binary_stl(self.stl_path)
+        self.assertIsInstance(data, np.memmap)
+        self.assertFalse(data.flags.writeable)
+        self.assertIsInstance(self.garden.stl_mesh.data, np.memmap)
+        parsed = mesh.Mesh.from_file(self.stl_path)
+        self.assertTrue(np.array_equal(parsed.vectors, self.garden.stl_mesh.vectors))
+        ascii_path = os.path.join(self.cache_dir, "garden_ascii.stl")
+        parsed.name = "garden"
+        parsed.save(ascii_path, mode=stl.Mode.ASCII)
+        self.assertIsNone(STL3D.read_binary_stl(ascii_path))
+        ascii_stl = STL3D(ascii_path)
+        self.assertTrue(
+            np.allclose(parsed.vectors, ascii_stl.stl_mesh.vectors, atol=1e-3)
+        )
+
+    def test_lazy_indexes(self):
+        """Test that opening a mesh without a cache does not build its indexes"""
+        garden_mesh = STL3D(self.stl_path)
+        self.assertIsInstance(garden_mesh.stl_mesh.data, np.memmap)
+        self.assertIsNone(garden_mesh._bvh)
+        self.assertIsNone(garden_mesh._unit_normals)
+        self.assertIsNone(garden_mesh._plane_offsets)
+        self.assertTrue(garden_mesh.is_point_inside_mesh(Point3D(2.1, 7.35, 5)))
+        self.assertIsNotNone(garden_mesh._bvh)
+        self.assertIsNone(garden_mesh._unit_normals)
+        self.assertEqual(
+            len(garden_mesh.stl_mesh.vectors), len(garden_mesh.plane_offsets)
+        )
+        self.assertIsNotNone(garden_mesh._unit_normals)
+        # a partially cached plane set is computed again
+        cached = STL3D(self.stl_path, cache_dir=self.cache_dir)
+        unit_normals = cached.unit_normals
+        os.remove(cached.mesh_cache.file_path("unit_normals"))
+        reloaded = STL3D(self.stl_path, cache_dir=self.cache_dir)
+        self.assertTrue(np.array_equal(unit_normals, reloaded.unit_normals))
+        self.assertTrue(reloaded.mesh_cache.has("unit_normals"))
+
+    def test_mesh_lod(self):
+        """Test the simplified level of detail variants of the garden"""
+        garden_mesh = STL3D(self.stl_path, cache_dir=self.cache_dir)
+        self.assertIs(garden_mesh, garden_mesh.get_lod("full"))
+        self.assertEqual(self.stl_path, garden_mesh.get_lod_path("full"))
+        full = garden_mesh.stl_mesh.vectors
+        for level in ["medium", "coarse"]:
+            lod = garden_mesh.get_lod(level)
+            self.assertIs(lod, garden_mesh.get_lod(level))
+            self.assertTrue(os.path.isfile(garden_mesh.get_lod_path(level)))
+            vectors = lod.stl_mesh.vectors
+            self.assertLess(len(vectors), len(full))
+            # vertices move by at most one cell
+            cell_size = MeshLOD.cell_size(level)
+            self.assertTrue(
+                np.all(vectors.min(axis=(0, 1)) >= full.min(axis=(0, 1)) - cell_size)
+            )
+            self.assertTrue(
+                np.all(vectors.max(axis=(0, 1)) <= full.max(axis=(0, 1)) + cell_size)
+            )
+            if self.debug:
+                print(f"{level}: {len(vectors)}/{len(full)} triangles")
+        # the chestnut crown is still solid and the open lawn still free
+        points = np.array([[2.1, 7.35, 5], [4.5, 3, 2]])
+        inside = garden_mesh.get_lod("coarse").points_inside_mesh(points)
+        self.assertEqual([True, False], inside.tolist())
+        with self.assertRaises(ValueError):
+            garden_mesh.get_lod("ultra")
+
+    def test_broad_phase(self):
+        """Test the trajectory bounding box culling and its counters"""
+        water_jet = WaterJet(start_position=Point3D(3, 0, 1), hose=Hose())
+        h = np.repeat(np.arange(-90, 271, 10), 9)
+        v = np.tile(np.arange(-20, 70, 10), len(h) // 9)
+        trajectories = water_jet.calculate_trajectories(h, v)
+        # jets leaving the garden model far away
+        trajectories = np.concatenate([trajectories, trajectories + [0, -50, 0]])
+        stats = self.garden.collision_stats
+        stats.reset()
+        segment_index, points, _triangles = self.garden.intersect_trajectories(trajectories)
+        self.assertEqual(len(trajectories), stats.queries)
+        self.assertGreaterEqual(stats.culled_queries, len(trajectories) // 2)
+        self.assertGreater(stats.avoided_ratio, 0.9)
+        # same result as testing all segments
+        t, _triangles = self.garden.intersect_segments(
+            trajectories[:, :-1].reshape(-1, 3), trajectories[:, 1:].reshape(-1, 3)
+        )
+        hit = ~np.isnan(t).reshape(len(trajectories), -1)
+        self.assertTrue(np.array_equal(hit.any(axis=1), segment_index >= 0))
+        far = [Point3D(x, -50, 1) for x in range(3)]
+        self.assertIsNone(self.garden.intersect_polyline(far))
+        if self.debug:
+            print(stats)
@@ -0,0 +1,46 @@
+"""
+Created on 2024-09-10
+
+@author: wf
+"""
+
+from ngwidgets.basetest import Basetest
+
+from sprinkler.update_coalescer import UpdateCoalescer
+
+
+class TestUpdateCoalescer(Basetest):
+    """
+    test the coalescing of UI updates per client frame
+    """
+
+    def test_coalesce(self):
+        """
+        test that updates of several ticks are flushed once per frame
+        with the latest value per key
+        """
+        coalescer = UpdateCoalescer(max_fps=8)
+        applied = []
+        # 16 ticks per second for one second
+        for tick in range(16):
+            now = tick / 16
+            coalescer.submit("label", lambda tick=tick: applied.append(("label", tick)))
+            coalescer.submit(("jet", tick % 3), lambda tick=tick: applied.append(tick))
+            coalescer.flush(now=now)
+        self.assertEqual(32, coalescer.submitted)
+        self.assertEqual(8, coalescer.flushes)
+        labels = [a[1] for a in applied if isinstance(a, tuple)]
+        # the first tick is flushed immediately then every second tick
+        self.assertEqual(list(range(0, 16, 2)), labels)
+        # the last tick is still pending until it is forced out
+        self.assertEqual(2, len(coalescer.pending))
+        self.assertEqual(2, coalescer.flush(now=1.0, force=True))
+        self.assertEqual(15, applied[-1])
+        self.assertEqual(0, coalescer.flush(force=True))
+
+    def test_invalid_frame_rate(self):
+        """
+        test that the frame rate must be positive
+        """
+        with self.assertRaises(ValueError):
+            UpdateCoalescer(max_fps=0)
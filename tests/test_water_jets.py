@@ -0,0 +1,76 @@
+"""
+Created on 2024-09-10
+
+@author: wf
+"""
+
+from unittest.mock import patch
+
+from ngwidgets.basetest import Basetest
+from nicegui import Client, ui
+from nicegui.page import page
+
+from sprinkler.sprinkler_config import Point3D
+from sprinkler.water_jets import WaterJets
+
+
+class TestWaterJets(Basetest):
+    """
+    test the water jets element computed in the browser
+    """
+
+    def setUp(self, debug=False, profile=True):
+        Basetest.setUp(self, debug=debug, profile=profile)
+        self.client = Client(page(""), request=None)
+        self.addCleanup(self.client.delete)
+        with self.client:
+            self.scene = ui.scene()
+
+    def create_jets(self, **kwargs) -> WaterJets:
+        with self.client:
+            jets = WaterJets(self.scene, Point3D(1, 2, 0.5), velocity=10, **kwargs)
+        return jets
+
+    def test_construction(self):
+        """
+        test that the source and the pool settings are sent as properties
+        """
+        jets = self.create_jets(size=3, segments=20, animate=False)
+        props = jets.props
+        self.assertEqual(self.scene.id, props["scene-id"])
+        self.assertEqual(3, props["size"])
+        self.assertEqual(3, jets.jet_capacity)
+        self.assertEqual(20, props["segments"])
+        self.assertFalse(props["animate"])
+        self.assertEqual([1, 2, 0.5], props["start"])
+        self.assertEqual(10, props["velocity"])
+        self.assertEqual(9.8, props["gravity"])
+        self.assertEqual(0, jets.jet_count)
+        with self.assertRaises(ValueError):
+            self.create_jets(size=0)
+
+    def test_jets(self):
+        """
+        test that jets, source changes and clearing are sent to the browser
+        """
+        jets = self.create_jets(size=2)
+        with patch.object(jets, "run_method") as run_method:
+            for h_angle, v_angle in [(10.123, 45.456), (20, 30), (30, 15)]:
+                jets.add_jet(h_angle, v_angle)
+            self.assertEqual(3, jets.jet_count)
+            # only the rounded angles of each jet are sent
+            self.assertEqual(
+                [
+                    ("add_jet", 10.12, 45.46),
+                    ("add_jet", 20.0, 30.0),
+                    ("add_jet", 30.0, 15.0),
+                ],
+                [call.args for call in run_method.call_args_list],
+            )
+            jets.set_source(Point3D(3, 4, 1), velocity=12, gravity=9.81)
+            self.assertEqual([3, 4, 1], jets.props["start"])
+            self.assertEqual(12, jets.props["velocity"])
+            self.assertEqual(9.81, jets.props["gravity"])
+            run_method.reset_mock()
+            jets.clear()
+            run_method.assert_called_once_with("clear")
@@ -6,13 +6,14 @@ Author: wf
 
 import math
 import os
+import time
 
 import matplotlib.pyplot as plt
 import numpy as np
 from ngwidgets.basetest import Basetest
 
-from sprinkler.sprinkler_config import Hose
-from sprinkler.waterjet import Point3D, WaterJet
+from sprinkler.sprinkler_config import AngleRange, Angles, Hose
+from sprinkler.waterjet import DragModel, Point3D, TrajectoryCache, WaterJet
 
 
 class TestWaterjetVisual(Basetest):
@@ -43,6 +44,174 @@ class TestWaterjetVisual(Basetest):
         self.assertEqual(trajectory[0], wj.start_position)
         self.assertEqual(trajectory[-1].z, 0)  # Should end at ground level
 
+    def test_batch_trajectories(self):
+        """
+        Test the vectorized batch trajectory calculation against the scalar one
+        """
+        start_position = Point3D(3.05, 0, 1.2)
+        wj = WaterJet(start_position=start_position, hose=self.hose)
+        angles = Angles(
+            horizontal=AngleRange(min=-85, max=85, initial=0, step=2),
+            vertical=AngleRange(min=-75, max=75, initial=0, step=2),
+        )
+        h_angles, v_angles = WaterJet.angle_grid(angles)
+        self.assertEqual(86 * 76, len(h_angles))
+        start_time = time.time()
+        trajectories = wj.calculate_trajectories(h_angles, v_angles)
+        elapsed = time.time() - start_time
+        if self.debug:
+            print(f"{len(h_angles)} trajectories in {elapsed*1000:.1f} ms")
+        self.assertEqual((86 * 76, 21, 3), trajectories.shape)
+        for index in [0, 1000, 3333, len(h_angles) - 1]:
+            wj.set_angles(h_angles[index], v_angles[index])
+            expected = wj.calculate_trajectory()
+            for point, row in zip(expected, trajectories[index]):
+                for expected_value, value in zip(point.to_tuple(), row):
+                    self.assertAlmostEqual(expected_value, value)
+        # all jets start at the sprinkler head and end on the ground
+        np.testing.assert_allclose(
+            trajectories[:, 0, :], [[3.05, 0, 1.2]] * len(h_angles)
+        )
+        np.testing.assert_allclose(trajectories[:, -1, 2], 0, atol=1e-9)
+
+    def test_ballistics(self):
+        """
+        Test the closed form time of flight, apex and impact point
+        """
+        wj = WaterJet(start_position=Point3D(0, 0, 1), hose=self.hose)
+        for h_angle, v_angle in [(0, 45), (45, 30), (-60, 0), (90, -20), (0, 90)]:
+            wj.set_angles(horizontal_angle=h_angle, vertical_angle=v_angle)
+            ballistics = wj.calculate_ballistics()
+            trajectory = wj.calculate_trajectory(num_segments=2000)
+            impact = trajectory[-1]
+            self.assertAlmostEqual(impact.x, ballistics.impact.x)
+            self.assertAlmostEqual(impact.y, ballistics.impact.y)
+            self.assertAlmostEqual(0, ballistics.impact.z)
+            max_z = max(p.z for p in trajectory)
+            self.assertAlmostEqual(max_z, ballistics.apex.z, 4)
+            self.assertGreater(ballistics.time_of_flight, 0)
+        # a straight up jet reaches the calibrated max height
+        self.assertAlmostEqual(1 + self.hose.max_height, ballistics.apex.z)
+
+        h_angles = np.array([0, 45, -60, 90])
+        v_angles = np.array([45, 30, 0, -20])
+        times, apexes, impacts = wj.calculate_ballistics_batch(h_angles, v_angles)
+        self.assertEqual((4,), times.shape)
+        self.assertEqual((4, 3), apexes.shape)
+        trajectories = wj.calculate_trajectories(h_angles, v_angles)
+        np.testing.assert_allclose(impacts, trajectories[:, -1, :], atol=1e-9)
+
+    def test_trajectory_cache(self):
+        """
+        Test the LRU trajectory cache
+        """
+        hose = Hose()
+        cache = TrajectoryCache(maxsize=3, angle_resolution=0.5)
+        wj = WaterJet(start_position=Point3D(0, 0, 1), hose=hose, cache=cache)
+        for h_angle, v_angle in [(10, 20), (10.1, 20.1), (30, 40), (10, 20)]:
+            wj.set_angles(h_angle, v_angle)
+            trajectory = wj.calculate_trajectory()
+            self.assertEqual(21, len(trajectory))
+        self.assertEqual(2, cache.misses)
+        self.assertEqual(2, cache.hits)
+        # a hit is the trajectory of the quantized angles
+        wj.set_angles(10.1, 20.1)
+        quantized = WaterJet(start_position=Point3D(0, 0, 1), hose=hose)
+        quantized.set_angles(10, 20)
+        self.assertEqual(quantized.calculate_trajectory(), wj.calculate_trajectory())
+        # callers get their own copies of the points
+        trajectory = wj.calculate_trajectory()
+        trajectory[-1].z = 42
+        self.assertNotEqual(42, wj.calculate_trajectory()[-1].z)
+        # evict the least recently used entry
+        for h_angle in [50, 60, 70]:
+            wj.set_angles(h_angle, 20)
+            wj.calculate_trajectory()
+        self.assertEqual(3, len(cache.entries))
+        # recalibration changes the velocity and invalidates the cache
+        hose.calibrate(max_distance=10, max_height=5, flow_rate=hose.flow_rate)
+        wj.set_angles(70, 20)
+        trajectory = wj.calculate_trajectory()
+        self.assertEqual(1, cache.invalidations)
+        self.assertEqual(1, len(cache.entries))
+        expected = WaterJet(start_position=Point3D(0, 0, 1), hose=hose)
+        expected.set_angles(70, 20)
+        self.assertEqual(expected.calculate_trajectory(), trajectory)
+        if self.debug:
+            print(cache.stats())
+
+    def test_drag_model(self):
+        """
+        Test the air drag trajectory model
+        """
+        hose = Hose(max_distance=9, max_height=6)
+        k, v0 = DragModel.fit(hose.max_distance, hose.max_height)
+        self.assertGreater(k, 0)
+        self.assertGreater(v0, hose.velocity)
+        model = DragModel.from_hose(hose)
+        origin = Point3D(0, 0, 0)
+        vertical = model.calculate_trajectories(origin, [0], [90], num_segments=200)
+        self.assertAlmostEqual(hose.max_height, vertical[0, :, 2].max(), 1)
+        v_angles = np.arange(10, 56)
+        trajectories = model.calculate_trajectories(
+            origin, np.zeros(len(v_angles)), v_angles
+        )
+        self.assertAlmostEqual(hose.max_distance, trajectories[:, -1, 0].max(), 1)
+        # measurements which are not drag limited fall back to the parabola
+        k, v0 = DragModel.fit(max_distance=13.6, max_height=5.7)
+        self.assertEqual(0, k)
+
+        wj = WaterJet(start_position=Point3D(0, 0, 1), hose=hose, model="drag")
+        wj.set_angles(horizontal_angle=45, vertical_angle=30)
+        trajectory = wj.calculate_trajectory()
+        self.assertEqual(21, len(trajectory))
+        self.assertEqual(wj.start_position, trajectory[0])
+        self.assertAlmostEqual(0, trajectory[-1].z)
+        parabolic = WaterJet(start_position=Point3D(0, 0, 1), hose=hose)
+        parabolic.set_angles(horizontal_angle=45, vertical_angle=30)
+        self.assertLess(trajectory[-1].x, parabolic.calculate_trajectory()[-1].x)
+        with self.assertRaises(ValueError):
+            WaterJet(start_position=Point3D(0, 0, 1), hose=hose, model="magic")
+
+    def test_adaptive_trajectory(self):
+        """
+        Test the adaptive trajectory sampling
+        """
+        wj = WaterJet(start_position=Point3D(0, 0, 1), hose=self.hose)
+        wj.set_angles(horizontal_angle=0, vertical_angle=60)
+        tolerance = 0.02
+        trajectory = wj.calculate_adaptive_trajectory(tolerance=tolerance)
+        self.assertEqual(wj.start_position, trajectory[0])
+        self.assertAlmostEqual(0, trajectory[-1].z)
+        # check the chord error against a densely sampled reference
+        dense = wj.calculate_trajectory(num_segments=4000)
+        xs = np.array([p.x for p in trajectory])
+        zs = np.array([p.z for p in trajectory])
+        max_error = max(abs(np.interp(p.x, xs, zs) - p.z) for p in dense)
+        # vertical deviation on steep parts is larger than the perpendicular one
+        self.assertLess(max_error, 3 * tolerance)
+        if self.debug:
+            print(f"{len(trajectory)} adaptive points, max error {max_error:.4f} m")
+        # fewer points than the fixed 20 segments for the same chord error bound
+        fixed = np.array([p.to_tuple() for p in wj.calculate_trajectory(20)])
+        starts, ends = fixed[:-1], fixed[1:]
+        times = np.linspace(0, wj.calculate_ballistics().time_of_flight, 21)
+        mids = wj.parabolic.position_at((times[:-1] + times[1:]) / 2)
+        chords = ends - starts
+        fixed_error = np.max(
+            np.linalg.norm(np.cross(mids - starts, chords), axis=1)
+            / np.linalg.norm(chords, axis=1)
+        )
+        adaptive = wj.calculate_adaptive_trajectory(
+            tolerance=fixed_error, ground_tolerance=fixed_error
+        )
+        self.assertLess(len(adaptive), len(fixed))
+        # points get denser near the obstacle
+        near_obstacle = wj.calculate_adaptive_trajectory(
+            tolerance=tolerance, refine=lambda points: points[:, 0] > 2
+        )
+        self.assertGreater(len(near_obstacle), len(trajectory))
+
     def test_real_life_data(self):
         """
         Test and generate visualizations using real-life test data